@@ -0,0 +1,351 @@
+import argparse
+import logging
+import os
+import random
+import statistics
+import threading
+import time
+from datetime import date, timedelta
+from db import (
+    DB_PATH, SHARD_COUNT, SHARDED_TABLES, query_db, executemany_db, query_all_shards,
+    shard_indexes, shard_path, to_day,
+)
+from profiler import timed
+
+try:
+    import duckdb
+except ImportError: # DuckDB is optional; everything falls back to SQLite
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+# Long-range and cross-user aggregates. Per-user dashboard queries stay on SQLite
+# (they are index lookups); these scan whole tables and can run on DuckDB instead.
+ANALYTICS_ENGINE = os.getenv("FITNESS_ANALYTICS_ENGINE", "sqlite").lower()
+
+# "sqlite" reads the live database files through DuckDB's sqlite extension,
+# "parquet" reads the snapshots written by `python analytics.py snapshot`
+ANALYTICS_SOURCE = os.getenv("FITNESS_ANALYTICS_SOURCE", "sqlite").lower()
+ANALYTICS_DIR = os.getenv("FITNESS_ANALYTICS_DIR", "analytics")
+
+ANALYTICS_TABLES = ("users",) + SHARDED_TABLES
+
+# The only columns that leave the app's databases, per table. Credentials, contact details
+# and free text (chat messages, suggestion descriptions) are never exported or queried here.
+ANALYTICS_COLUMNS = {
+    "users": ("id", "age", "gender", "height", "weight"),
+    "workouts": ("id", "user_id", "date", "exercise", "duration", "calories_burned", "calories_estimated"),
+    "weigh_ins": ("id", "user_id", "date", "weight"),
+    "chat_logs": ("id", "user_id", "timestamp", "kind"),
+    "goals": ("id", "user_id", "goal_type", "target_value", "current_value", "start_date", "end_date", "status"),
+    "goal_suggestions": ("id", "user_id", "chat_log_id", "goal_type", "target_value", "start_date", "end_date", "status"),
+    "workout_rollups": ("user_id", "period", "period_start", "sessions", "minutes", "calories"),
+}
+
+# Shared by both engines so the buckets always match
+_AGE_GROUP = """
+    CASE WHEN age IS NULL THEN 'unknown'
+         WHEN age < 25 THEN '<25'
+         WHEN age < 35 THEN '25-34'
+         WHEN age < 50 THEN '35-49'
+         ELSE '50+' END
+"""
+
+# Each query has a SQLite form (run per shard, merged in Python) and a DuckDB form
+# (one statement over views that union the shards). The SQLite forms take the first day
+# number to include (see db.to_day), the DuckDB forms take (since_days,).
+_SQLITE_QUERIES = {
+    "weekly_workouts": """
+        SELECT date(date, 'weekday 0', '-6 days') AS week, COUNT(*) AS sessions,
+               COUNT(DISTINCT user_id) AS users, COALESCE(SUM(duration), 0) AS minutes,
+               COALESCE(SUM(calories_burned), 0) AS calories
+        FROM workouts WHERE day >= ?
+        GROUP BY week
+    """,
+    "exercise_totals": """
+        SELECT lower(exercise) AS exercise, COUNT(*) AS sessions, COUNT(DISTINCT user_id) AS users,
+               COALESCE(SUM(duration), 0) AS minutes
+        FROM workouts WHERE day >= ?
+        GROUP BY lower(exercise)
+    """,
+    "user_minutes": """
+        SELECT user_id, COALESCE(SUM(duration), 0) AS minutes
+        FROM workouts WHERE day >= ?
+        GROUP BY user_id
+    """,
+}
+
+_DUCKDB_QUERIES = {
+    "weekly_workouts": """
+        SELECT strftime(date_trunc('week', CAST(date AS DATE)), '%Y-%m-%d') AS week, COUNT(*) AS sessions,
+               COUNT(DISTINCT user_id) AS users, COALESCE(SUM(duration), 0) AS minutes,
+               COALESCE(SUM(calories_burned), 0) AS calories
+        FROM workouts WHERE CAST(date AS DATE) >= current_date - CAST(? AS INTEGER)
+        GROUP BY week ORDER BY week
+    """,
+    "exercise_totals": """
+        SELECT lower(exercise) AS exercise, COUNT(*) AS sessions, COUNT(DISTINCT user_id) AS users,
+               COALESCE(SUM(duration), 0) AS minutes
+        FROM workouts WHERE CAST(date AS DATE) >= current_date - CAST(? AS INTEGER)
+        GROUP BY lower(exercise) ORDER BY minutes DESC, exercise
+    """,
+    "cohort_activity": f"""
+        WITH per_user AS (
+            SELECT user_id, SUM(duration) AS minutes FROM workouts
+            WHERE CAST(date AS DATE) >= current_date - CAST(? AS INTEGER)
+            GROUP BY user_id
+        )
+        SELECT {_AGE_GROUP} AS age_group, COALESCE(u.gender, 'unknown') AS gender,
+               COUNT(*) AS users, AVG(p.minutes) AS avg_minutes
+        FROM per_user p JOIN users u ON u.id = p.user_id
+        GROUP BY age_group, gender ORDER BY age_group, gender
+    """,
+}
+
+_duck = None
+_duck_lock = threading.Lock()
+
+
+def duckdb_enabled(engine=None):
+    """True if analytics should run on DuckDB (requested and installed)."""
+    engine = (engine or ANALYTICS_ENGINE).lower()
+    if engine != "duckdb":
+        return False
+    if duckdb is None:
+        logger.warning("FITNESS_ANALYTICS_ENGINE=duckdb but duckdb is not installed; using SQLite")
+        return False
+    return True
+
+
+def _quote(path):
+    return "'" + path.replace("'", "''") + "'"
+
+
+def _snapshot_path(table):
+    return os.path.join(ANALYTICS_DIR, f"{table}.parquet")
+
+
+def _columns(table):
+    return ", ".join(ANALYTICS_COLUMNS[table])
+
+
+def _create_sqlite_views(connection):
+    """Attaches the SQLite files read-only and exposes each table's allowed columns as a view (shards unioned)."""
+    connection.execute("INSTALL sqlite")
+    connection.execute("LOAD sqlite")
+    connection.execute(f"ATTACH {_quote(DB_PATH)} AS app (TYPE sqlite, READ_ONLY)")
+    sources = {table: ["app"] for table in ANALYTICS_TABLES}
+    if SHARD_COUNT > 1:
+        for shard in shard_indexes():
+            connection.execute(f"ATTACH {_quote(shard_path(shard))} AS shard_{shard} (TYPE sqlite, READ_ONLY)")
+        for table in SHARDED_TABLES:
+            sources[table] = [f"shard_{shard}" for shard in shard_indexes()]
+    for table, schemas in sources.items():
+        union = " UNION ALL ".join(f"SELECT {_columns(table)} FROM {schema}.{table}" for schema in schemas)
+        connection.execute(f"CREATE OR REPLACE VIEW {table} AS {union}")
+
+
+def _create_parquet_views(connection):
+    """Exposes the Parquet snapshots as views; they are re-read on every query."""
+    for table in ANALYTICS_TABLES:
+        path = _snapshot_path(table)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No snapshot for {table}; run `python analytics.py snapshot` first")
+        connection.execute(f"CREATE OR REPLACE VIEW {table} AS SELECT {_columns(table)} FROM read_parquet({_quote(path)})")
+
+
+def _duckdb_cursor():
+    """Returns a cursor on the shared in-process DuckDB database, creating it on first use."""
+    global _duck
+    with _duck_lock:
+        if _duck is None:
+            connection = duckdb.connect()
+            if ANALYTICS_SOURCE == "parquet":
+                _create_parquet_views(connection)
+            else:
+                _create_sqlite_views(connection)
+            _duck = connection
+        # DuckDB connections aren't thread-safe; each caller gets its own cursor
+        return _duck.cursor()
+
+
+@timed("db")
+def _duckdb_query(name, params):
+    cursor = _duckdb_cursor()
+    try:
+        cursor.execute(_DUCKDB_QUERIES[name], params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def _merge(rows, key, sums):
+    """Adds up per-shard partial aggregates by `key` (users are disjoint across shards)."""
+    merged = {}
+    for row in rows:
+        entry = merged.setdefault(row[key], {key: row[key], **{column: 0 for column in sums}})
+        for column in sums:
+            entry[column] += row[column]
+    return list(merged.values())
+
+
+def _first_day(since_days):
+    """Day number of the first day in a `since_days` window ending today."""
+    return to_day(date.today()) - since_days
+
+
+def weekly_workouts(since_days=365, engine=None):
+    """Sessions, active users, minutes and calories per week (weeks start on Monday), oldest first."""
+    if duckdb_enabled(engine):
+        return _duckdb_query("weekly_workouts", (since_days,))
+    rows = query_all_shards(_SQLITE_QUERIES["weekly_workouts"], (_first_day(since_days),))
+    merged = _merge(rows, "week", ("sessions", "users", "minutes", "calories"))
+    return sorted(merged, key=lambda row: row["week"])
+
+
+def exercise_totals(since_days=365, engine=None):
+    """Sessions, users and minutes per exercise across all users, most minutes first."""
+    if duckdb_enabled(engine):
+        return _duckdb_query("exercise_totals", (since_days,))
+    rows = query_all_shards(_SQLITE_QUERIES["exercise_totals"], (_first_day(since_days),))
+    merged = _merge(rows, "exercise", ("sessions", "users", "minutes"))
+    return sorted(merged, key=lambda row: (-row["minutes"], row["exercise"]))
+
+
+def cohort_activity(since_days=365, engine=None):
+    """Active users and average workout minutes per user, by age group and gender."""
+    if duckdb_enabled(engine):
+        return _duckdb_query("cohort_activity", (since_days,))
+    minutes = {row["user_id"]: row["minutes"] for row in query_all_shards(_SQLITE_QUERIES["user_minutes"], (_first_day(since_days),))}
+    if not minutes:
+        return []
+    # users lives in the main database, so the join happens here rather than in SQL
+    users = query_db(f"SELECT id, {_AGE_GROUP} AS age_group, COALESCE(gender, 'unknown') AS gender FROM users")
+    cohorts = {}
+    for user in users:
+        if user["id"] in minutes:
+            cohorts.setdefault((user["age_group"], user["gender"]), []).append(minutes[user["id"]])
+    return [
+        {"age_group": age_group, "gender": gender, "users": len(values), "avg_minutes": sum(values) / len(values)}
+        for (age_group, gender), values in sorted(cohorts.items())
+    ]
+
+
+def snapshot_parquet():
+    """
+    Writes the allowed columns (ANALYTICS_COLUMNS) of every analytics table to ANALYTICS_DIR
+    as Parquet (shards combined).
+    Files are written under a temporary name and swapped in, so readers never see a partial file.
+    Returns {table: row_count}.
+    """
+    if duckdb is None:
+        raise RuntimeError("Parquet snapshots need duckdb (pip install duckdb)")
+    os.makedirs(ANALYTICS_DIR, exist_ok=True)
+    connection = duckdb.connect()
+    counts = {}
+    try:
+        _create_sqlite_views(connection)
+        for table in ANALYTICS_TABLES:
+            path = _snapshot_path(table)
+            connection.execute(
+                f"COPY (SELECT {_columns(table)} FROM {table}) TO {_quote(path + '.tmp')} (FORMAT parquet)"
+            )
+            os.replace(path + ".tmp", path)
+            counts[table] = connection.execute(f"SELECT COUNT(*) FROM read_parquet({_quote(path)})").fetchone()[0]
+    finally:
+        connection.close()
+    logger.info("Wrote analytics snapshot to %s: %s", ANALYTICS_DIR, counts)
+    return counts
+
+
+def seed_synthetic(users=1000, workouts_per_user=365):
+    """
+    Fills an empty database with random users and daily-ish workouts for benchmarking.
+    Refuses to touch a database that already has workouts.
+    """
+    if any(row["n"] for row in query_all_shards("SELECT COUNT(*) AS n FROM workouts")):
+        raise RuntimeError("Database already has workouts; run the benchmark from an empty directory")
+    rng = random.Random(42)
+    exercises = ["Running", "Cycling", "Swimming", "Yoga", "Weights", "Walking", "HIIT"]
+    user_rows = [
+        (f"bench{i}", f"bench{i}@example.com", "x", rng.randint(18, 70), rng.choice(["Male", "Female"]),
+         rng.uniform(150, 195), rng.uniform(50, 110))
+        for i in range(users)
+    ]
+    executemany_db(
+        "INSERT INTO users (name, email, password, age, gender, height, weight) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        user_rows
+    )
+    today = date.today()
+    for row in query_db("SELECT id FROM users WHERE email LIKE 'bench%@example.com'"):
+        workouts = []
+        for _ in range(workouts_per_user):
+            duration = rng.randint(10, 90)
+            day = today - timedelta(days=rng.randint(0, 3 * 365))
+            workouts.append((row["id"], day.strftime('%Y-%m-%d'), rng.choice(exercises), duration, duration * rng.uniform(5, 12)))
+        executemany_db(
+            "INSERT INTO workouts (user_id, date, exercise, duration, calories_burned) VALUES (?, ?, ?, ?, ?)",
+            workouts, shard_key=row["id"]
+        )
+    return users * workouts_per_user
+
+
+def _comparable(rows):
+    return [{key: round(value, 3) if isinstance(value, float) else value for key, value in row.items()} for row in rows]
+
+
+def benchmark(repeat=5, since_days=3 * 365):
+    """
+    Times every analytics query on SQLite and on DuckDB (median of `repeat` runs)
+    and checks that both engines return the same rows. Returns a list of result dicts.
+    """
+    if duckdb is None:
+        raise RuntimeError("The benchmark compares against DuckDB; pip install duckdb first")
+    results = []
+    for query in (weekly_workouts, exercise_totals, cohort_activity):
+        timings, outputs = {}, {}
+        for engine in ("sqlite", "duckdb"):
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                outputs[engine] = query(since_days, engine=engine)
+                samples.append(time.perf_counter() - started)
+            timings[engine] = statistics.median(samples)
+        results.append({
+            "query": query.__name__,
+            "rows": len(outputs["sqlite"]),
+            "sqlite_ms": timings["sqlite"] * 1000,
+            "duckdb_ms": timings["duckdb"] * 1000,
+            "same_result": _comparable(outputs["sqlite"]) == _comparable(outputs["duckdb"]),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-user analytics on SQLite or DuckDB")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("snapshot", help="Write Parquet snapshots for FITNESS_ANALYTICS_SOURCE=parquet")
+    bench = subparsers.add_parser("benchmark", help="Compare SQLite and DuckDB on the analytics queries")
+    bench.add_argument("--repeat", type=int, default=5, help="Runs per query and engine")
+    bench.add_argument("--days", type=int, default=3 * 365, help="History window to aggregate")
+    bench.add_argument("--synthetic-users", type=int, default=0,
+                       help="First seed this many synthetic users (empty database only)")
+    bench.add_argument("--workouts-per-user", type=int, default=365, help="Workouts per synthetic user")
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        for table, rows in snapshot_parquet().items():
+            print(f"{table}: {rows} rows")
+    elif args.command == "benchmark":
+        if args.synthetic_users:
+            rows = seed_synthetic(args.synthetic_users, args.workouts_per_user)
+            print(f"Seeded {rows} synthetic workouts.")
+        print(f"DuckDB source: {ANALYTICS_SOURCE}")
+        for result in benchmark(args.repeat, args.days):
+            speedup = result["sqlite_ms"] / result["duckdb_ms"] if result["duckdb_ms"] else float("inf")
+            print(
+                f"{result['query']}: {result['rows']} rows, sqlite {result['sqlite_ms']:.1f} ms, "
+                f"duckdb {result['duckdb_ms']:.1f} ms ({speedup:.1f}x), "
+                f"{'same result' if result['same_result'] else 'RESULTS DIFFER'}"
+            )
@@ -0,0 +1,457 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import secrets
+import statistics
+import time
+from datetime import date, timedelta
+from urllib.parse import parse_qs, urlsplit
+from dotenv import load_dotenv
+load_dotenv() # before llm_client, which creates its Groq client at import
+
+from db import query_db, execute_db
+from sessions import verify_password, create_session, restore_session, end_session, end_user_sessions
+from workout_log import record_workout, get_workout_history
+from goal_progress import create_goal
+from body_metrics import calculate_bmi, get_bmi_category, calculate_bmr
+from chat_turns import fitness_messages, finish_fitness_turn
+from llm_client import complete_with_deadline, stream_with_deadline, local_fallback_reply
+from trends import workout_totals
+from intent_router import route_message
+
+# JSON API for mobile clients, served without Streamlit: every request is one handler call
+# instead of a full script rerun. Run it with `python api.py serve` (uvicorn) next to the UI.
+# Clients log in once with POST /api/login and send the returned token as "Authorization: Bearer <token>".
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1024 * 1024
+GOAL_TYPES = ("weight_loss", "weight_gain", "exercise", "other")
+
+
+class ApiError(Exception):
+    """Turned into a JSON error response with the given HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# --- Handlers: run on a worker thread (the db helpers are blocking) ------------------
+
+def _user_json(user):
+    return {key: user[key] for key in ("id", "name", "email", "age", "gender", "height", "weight")}
+
+
+def _number(body, key, default=None, minimum=0):
+    value = body.get(key, default)
+    if value is None:
+        raise ApiError(400, f"'{key}' is required")
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < minimum:
+        raise ApiError(400, f"'{key}' must be a number >= {minimum}")
+    return value
+
+
+def _date(body, key, default):
+    value = body.get(key) or default
+    try:
+        return date.fromisoformat(value).isoformat()
+    except (TypeError, ValueError):
+        raise ApiError(400, f"'{key}' must be a YYYY-MM-DD date")
+
+
+def _int_param(request, key, default, minimum=None):
+    try:
+        value = int(request["query"].get(key, [default])[0])
+    except ValueError:
+        raise ApiError(400, f"'{key}' must be an integer")
+    if minimum is not None and value < minimum:
+        raise ApiError(400, f"'{key}' must be an integer >= {minimum}")
+    return value
+
+
+def health(request):
+    return {"ok": True}
+
+
+def login(request):
+    body = request["body"]
+    email, password = body.get("email"), body.get("password")
+    if not email or not password:
+        raise ApiError(400, "'email' and 'password' are required")
+    user = query_db("SELECT * FROM users WHERE email = ?", (email,), fetchone=True)
+    if user is None or not verify_password(user, password):
+        raise ApiError(401, "Invalid credentials")
+    token = create_session(user["id"])
+    if token is None:
+        raise ApiError(500, "Could not create a session")
+    return {"token": token, "user": _user_json(user)}
+
+
+def logout(request):
+    end_session(request["token"])
+    return {"ok": True}
+
+
+def list_workouts(request):
+    limit = max(1, min(_int_param(request, "limit", 10), 100))
+    return {"workouts": [dict(row) for row in get_workout_history(request["user"]["id"], limit)]}
+
+
+def add_workout(request):
+    user, body = request["user"], request["body"]
+    exercise = (body.get("exercise") or "").strip()
+    if not exercise:
+        raise ApiError(400, "'exercise' is required")
+    workout_id, calories, estimated = record_workout(
+        user["id"],
+        _date(body, "date", date.today().isoformat()),
+        exercise,
+        _number(body, "duration", minimum=1),
+        _number(body, "calories_burned", 0),
+        user["weight"]
+    )
+    if workout_id == -1:
+        raise ApiError(500, "Failed to log workout")
+    return {"id": workout_id, "calories_burned": calories, "calories_estimated": estimated}
+
+
+def list_goals(request):
+    user = request["user"]
+    goals = query_db(
+        "SELECT id, goal_type, target_value, current_value, start_date, end_date, status "
+        "FROM goals WHERE user_id = ? ORDER BY id DESC",
+        (user["id"],),
+        shard_key=user["id"]
+    )
+    return {"goals": [dict(row) for row in goals]}
+
+
+def add_goal(request):
+    user, body = request["user"], request["body"]
+    goal_type = (body.get("goal_type") or "").strip().lower().replace(" ", "_")
+    if goal_type not in GOAL_TYPES:
+        raise ApiError(400, f"'goal_type' must be one of {', '.join(GOAL_TYPES)}")
+    start_date = _date(body, "start_date", date.today().isoformat())
+    end_date = _date(body, "end_date", (date.fromisoformat(start_date) + timedelta(days=30)).isoformat())
+    if end_date <= start_date:
+        raise ApiError(400, "End date must be after start date")
+    goal_id = create_goal(user["id"], goal_type, _number(body, "target_value"), start_date, end_date)
+    if goal_id == -1:
+        raise ApiError(500, "Failed to set goal")
+    return {"id": goal_id}
+
+
+def dashboard(request):
+    user = request["user"]
+    days = _int_param(request, "days", 30, minimum=0) # 0 = all time
+    totals = workout_totals(user["id"], days or None)
+    bmi, category = None, None
+    if user["height"] and user["weight"]:
+        bmi, _ = calculate_bmi(user["weight"], user["height"])
+        category = get_bmi_category(bmi)[0] if bmi else None
+    goals = query_db(
+        "SELECT goal_type, target_value, current_value, status FROM goals WHERE user_id = ? AND status = 'active'",
+        (user["id"],),
+        shard_key=user["id"]
+    )
+    return {
+        "days": days,
+        "sessions": totals["sessions"] if totals else 0,
+        "calories": totals["calories"] if totals else 0,
+        "bmi": bmi,
+        "bmi_category": category,
+        "bmr": calculate_bmr(user["weight"] or 0, user["height"] or 0, user["age"] or 0, user["gender"]),
+        "active_goals": [dict(row) for row in goals],
+    }
+
+
+def chat(request):
+    user = request["user"]
+    message = _chat_message(request["body"])
+    routed = route_message(user["id"], message)
+    if routed:
+        reply, outcome = routed[1], "local"
+    else:
+        reply, outcome = complete_with_deadline(
+            fitness_messages(user["id"], message),
+            fallback=lambda: local_fallback_reply(user["id"], message),
+            kind="fitness",
+        )
+    chat_log_id, suggested = finish_fitness_turn(user["id"], message, reply, user["weight"])
+    return {"reply": reply, "outcome": outcome, "chat_log_id": chat_log_id, "goal_suggested": suggested}
+
+
+def _chat_message(body):
+    message = (body.get("message") or "").strip()
+    if not message:
+        raise ApiError(400, "'message' is required")
+    return message
+
+
+def chat_stream(user, message):
+    """Generator of reply deltas; returns the same summary dict as chat() minus the reply text."""
+    parts = []
+    routed = route_message(user["id"], message)
+    if routed:
+        parts.append(routed[1])
+        yield routed[1]
+        outcome = "local"
+    else:
+        stream = stream_with_deadline(
+            fitness_messages(user["id"], message),
+            fallback=lambda: local_fallback_reply(user["id"], message),
+            kind="fitness",
+        )
+        try:
+            while True:
+                delta = next(stream)
+                parts.append(delta)
+                yield delta
+        except StopIteration as stop:
+            outcome = stop.value
+    chat_log_id, suggested = finish_fitness_turn(user["id"], message, "".join(parts), user["weight"])
+    return {"outcome": outcome, "chat_log_id": chat_log_id, "goal_suggested": suggested}
+
+
+# (method, path) -> (handler, needs a logged-in user, success status)
+ROUTES = {
+    ("GET", "/api/health"): (health, False, 200),
+    ("POST", "/api/login"): (login, False, 200),
+    ("POST", "/api/logout"): (logout, True, 200),
+    ("GET", "/api/workouts"): (list_workouts, True, 200),
+    ("POST", "/api/workouts"): (add_workout, True, 201),
+    ("GET", "/api/goals"): (list_goals, True, 200),
+    ("POST", "/api/goals"): (add_goal, True, 201),
+    ("GET", "/api/dashboard"): (dashboard, True, 200),
+    ("POST", "/api/chat"): (chat, True, 200),
+}
+_PATHS = {path for _, path in ROUTES}
+
+
+# --- ASGI plumbing -------------------------------------------------------------------
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload, default=str).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _read_body(receive):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ApiError(400, "Client disconnected")
+        chunks.append(message.get("body", b""))
+        size += len(chunks[-1])
+        if size > MAX_BODY_BYTES:
+            raise ApiError(413, "Request body too large")
+        if not message.get("more_body"):
+            break
+    raw = b"".join(chunks)
+    if not raw:
+        return {}
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        raise ApiError(400, "Body must be JSON")
+    if not isinstance(body, dict):
+        raise ApiError(400, "Body must be a JSON object")
+    return body
+
+
+def _bearer_token(scope):
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer":
+                return token.strip()
+    return None
+
+
+def _wants_stream(scope, query):
+    if query.get("stream", ["0"])[0] in ("1", "true"):
+        return True
+    return any(name == b"accept" and b"text/event-stream" in value for name, value in scope["headers"])
+
+
+async def _stream_chat(send, user, message):
+    """Runs the chat generator on a worker thread and forwards each delta as a server-sent event."""
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def pump():
+        stream = chat_stream(user, message)
+        try:
+            while True:
+                loop.call_soon_threadsafe(events.put_nowait, ("delta", {"delta": next(stream)}))
+        except StopIteration as stop:
+            loop.call_soon_threadsafe(events.put_nowait, ("done", stop.value))
+        except Exception as e:
+            logger.exception("Chat stream failed")
+            loop.call_soon_threadsafe(events.put_nowait, ("error", {"error": str(e)}))
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")],
+    })
+    worker = loop.run_in_executor(None, pump)
+    while True:
+        event, data = await events.get()
+        frame = f"data: {json.dumps(data)}\n\n" if event == "delta" else f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        await send({"type": "http.response.body", "body": frame.encode("utf-8"), "more_body": event == "delta"})
+        if event != "delta":
+            break
+    await worker
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """The ASGI application."""
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    method, path = scope["method"], scope["path"].rstrip("/")
+    try:
+        route = ROUTES.get((method, path))
+        if route is None:
+            raise ApiError(405 if path in _PATHS else 404, "Method not allowed" if path in _PATHS else "Not found")
+        handler, needs_user, status = route
+        request = {
+            "query": parse_qs(scope.get("query_string", b"").decode("latin-1")),
+            "body": await _read_body(receive),
+            "token": _bearer_token(scope),
+            "user": None,
+        }
+        if needs_user:
+            # One signed-token check and primary-key lookup, as for cookie logins in the UI
+            if request["token"]:
+                request["user"] = await asyncio.to_thread(restore_session, request["token"])
+            if request["user"] is None:
+                raise ApiError(401, "Not logged in")
+        if handler is chat and _wants_stream(scope, request["query"]):
+            return await _stream_chat(send, request["user"], _chat_message(request["body"]))
+        await _send_json(send, status, await asyncio.to_thread(handler, request))
+    except ApiError as e:
+        await _send_json(send, e.status, {"error": e.message})
+    except Exception:
+        logger.exception("Unhandled error in %s %s", method, path)
+        await _send_json(send, 500, {"error": "Internal server error"})
+
+
+# --- Load test -----------------------------------------------------------------------
+
+async def _load_worker(host, port, request, stop_at, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            status = int(lines[0].split()[1])
+            length = next((int(line.split(":", 1)[1]) for line in lines if line.lower().startswith("content-length:")), 0)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def _run_load(url, token, concurrency, seconds):
+    parts = urlsplit(url)
+    target = parts.path + (f"?{parts.query}" if parts.query else "")
+    request = (
+        f"GET {target} HTTP/1.1\r\nHost: {parts.hostname}\r\n"
+        f"Authorization: Bearer {token}\r\nConnection: keep-alive\r\n\r\n"
+    ).encode("latin-1")
+    latencies, statuses = [], {}
+    stop_at = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _load_worker(parts.hostname, parts.port or 80, request, stop_at, latencies, statuses) for _ in range(concurrency)
+    ))
+    return latencies, statuses, time.perf_counter() - started
+
+
+def load_test(url, concurrency=32, seconds=10, server_workers=1, token=None):
+    """
+    Keep-alive GET load against a running API (e.g. http://127.0.0.1:8000/api/dashboard).
+    Without a token, a throwaway user and session are created for the run.
+    Returns requests per second overall and per server worker process (= core).
+    """
+    user_id = None
+    if token is None:
+        user_id = execute_db(
+            "INSERT INTO users (name, email, password, age, gender, height, weight) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ("Load test", f"loadtest-{secrets.token_hex(4)}@example.invalid", "!", 30, "Other", 175, 70)
+        )
+        token = create_session(user_id)
+    try:
+        latencies, statuses, elapsed = asyncio.run(_run_load(url, token, concurrency, seconds))
+    finally:
+        if user_id is not None:
+            end_user_sessions(user_id)
+            execute_db("DELETE FROM users WHERE id = ?", (user_id,))
+    latencies.sort()
+    rps = len(latencies) / elapsed
+    return {
+        "requests": len(latencies),
+        "statuses": statuses,
+        "rps": rps,
+        "rps_per_core": rps / server_workers,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless JSON API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="Run the API with uvicorn")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes (one per core)")
+    load = subparsers.add_parser("loadtest", help="Measure requests per second against a running API")
+    load.add_argument("--url", default="http://127.0.0.1:8000/api/dashboard")
+    load.add_argument("--concurrency", type=int, default=32)
+    load.add_argument("--seconds", type=float, default=10)
+    load.add_argument("--server-workers", type=int, default=1, help="Worker processes the server runs (for per-core numbers)")
+    load.add_argument("--token", default=None, help="Session token (default: a throwaway user)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        try:
+            import uvicorn
+        except ImportError:
+            print("❌ uvicorn is not installed: pip install uvicorn")
+        else:
+            uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers, log_level="warning")
+    elif args.command == "loadtest":
+        result = load_test(args.url, args.concurrency, args.seconds, args.server_workers, args.token)
+        errors = sum(count for status, count in result["statuses"].items() if status != 200)
+        print(
+            f"{'✅' if not errors else '❌'} {result['requests']} requests, {errors} non-200: "
+            f"{result['rps']:.0f} req/s ({result['rps_per_core']:.0f} per server core), "
+            f"p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms"
+        )
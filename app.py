@@ -1,17 +1,21 @@
+import html
 import streamlit as st
 from dotenv import load_dotenv
 load_dotenv()
 
-from auth import register, login
+from auth import register, login, restore_login, forget_login, sync_cookie
 from bmi import show_bmi
 from pro import manage_profile
 from workouts import log_workout
 from tips import show_tip
 from dashboard import show_dashboard
-from goals import set_goal, view_goals
+from goals import set_goal, view_goals, show_goal_suggestions
 from report_generator import generate_user_report
 from chatbot import fitness_chatbot, show_chat_analytics
 from nutrition_chat import nutrition_chat
+from profiler import PROFILE_ENABLED, profile_page
+from fragments import app_run
+from db_maintenance import start_maintenance
 
 # ── Page configuration ───────────────────────────────────────────────────────
 st.set_page_config(
@@ -21,8 +25,11 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+# Idle-time database maintenance (checkpoints, ANALYZE, vacuuming); started once per process
+start_maintenance()
+
 # ── Global custom CSS ─────────────────────────────────────────────────────────
-st.markdown("""
+GLOBAL_CSS = """
 <style>
 /* Sidebar gradient */
 [data-testid="stSidebar"] {
@@ -56,13 +63,38 @@ st.markdown("""
     color: #222 !important;
 }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+
+def show_profile_stats(stats):
+    """Shows the render-time breakdown of the current page in the sidebar."""
+    with st.sidebar.expander("⏱️ Render Profile", expanded=False):
+        st.caption(f"Page: {stats['page']}")
+        st.write(f"**Total:** {stats['total'] * 1000:.1f} ms")
+        for kind, seconds in stats["segments"].items():
+            st.write(f"- {kind.upper()}: {seconds * 1000:.1f} ms ({stats['calls'][kind]} calls)")
+        st.write(f"- Other: {stats['other'] * 1000:.1f} ms")
+        if stats["profile_path"]:
+            st.caption(f"cProfile saved to `{stats['profile_path']}`")
 
 
 def main():
+    # Full runs only happen on navigation and app-wide actions; widgets inside
+    # fragments (dashboard, goals, chat, workout log) rerun just their own section
+    with app_run() as run:
+        st.markdown(GLOBAL_CSS, unsafe_allow_html=True)
+        render_app(run)
+
+
+def render_app(run):
+    if "user_id" not in st.session_state:
+        restore_login() # A refresh or new tab comes back with the session cookie
+    sync_cookie()
+
     if "user_id" not in st.session_state:
         # ── Auth pages ────────────────────────────────────────────────────────
         page = st.sidebar.selectbox("Menu", ["Login", "Register"])
+        run["page"] = page
         if page == "Login":
             login()
         else:
@@ -76,7 +108,7 @@ def main():
 
         st.sidebar.markdown(
             f"<div style='font-size:1rem; padding:6px 0;'>👋 Hello, "
-            f"<b>{st.session_state.user['name']}</b></div>",
+            f"<b>{html.escape(st.session_state.user['name'] or '')}</b></div>",
             unsafe_allow_html=True,
         )
         st.sidebar.divider()
@@ -88,78 +120,88 @@ def main():
         )
         st.sidebar.divider()
         show_tip(st.session_state.user_id)
+        run["page"] = choice
+
+        capture_profile = False
+        if PROFILE_ENABLED:
+            capture_profile = st.sidebar.checkbox("🔬 Capture cProfile for this page")
 
         # ── Welcome banner ────────────────────────────────────────────────────
         st.markdown(
             f"""
             <div class='welcome-banner'>
                 <h2>🏋️ Fitness Assistant</h2>
-                <p>AI-powered fitness insights for <b>{st.session_state.user['name']}</b></p>
+                <p>AI-powered fitness insights for <b>{html.escape(st.session_state.user['name'] or '')}</b></p>
             </div>
             """,
             unsafe_allow_html=True,
         )
 
         # ── Routing ───────────────────────────────────────────────────────────
-        if choice == "🚪 Logout":
-            st.warning("Are you sure you want to logout?")
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("Yes, Logout"):
-                    st.session_state.clear()
-                    st.rerun()
-            with col2:
-                if st.button("No, Stay"):
-                    st.rerun()
-
-        elif choice == "🏠 Dashboard":
-            show_dashboard(st.session_state.user_id)
-
-        elif choice == "📏 BMI":
-            show_bmi(st.session_state.user)
-
-        elif choice == "👤 Profile":
-            manage_profile(st.session_state.user_id)
-
-        elif choice == "🏋️ Workout":
-            log_workout(st.session_state.user_id)
-
-        elif choice == "🎯 Goals":
-            set_goal(st.session_state.user_id)
-            st.divider()
-            view_goals(st.session_state.user_id)
-
-        elif choice == "🤖 Chatbot":
-            fitness_chatbot(st.session_state.user_id)
-            with st.expander("📊 My Chat Analytics"):
-                show_chat_analytics(st.session_state.user_id)
-
-        elif choice == "🥗 Nutrition":
-            nutrition_chat(st.session_state.user_id)
-
-        elif choice == "📄 Report":
-            st.subheader("📄 Generate Your Fitness Report")
-            st.write("Download a personalised PDF summary of your profile, goals, workouts, and chat history.")
-            if st.button("📥 Generate PDF Report", type="primary"):
-                try:
-                    path = generate_user_report(
-                        st.session_state.user_id,
-                        st.session_state.user['name'],
-                        max_workout_entries=5,
-                        max_goal_entries=5,
-                        max_chat_entries=5
-                    )
-                    with open(path, "rb") as f:
+        with profile_page(choice, capture=capture_profile) as page_stats:
+            if choice == "🚪 Logout":
+                st.warning("Are you sure you want to logout?")
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button("Yes, Logout"):
+                        forget_login()
+                        st.rerun()
+                with col2:
+                    if st.button("No, Stay"):
+                        st.rerun()
+
+            elif choice == "🏠 Dashboard":
+                show_dashboard(st.session_state.user_id)
+
+            elif choice == "📏 BMI":
+                show_bmi(st.session_state.user)
+
+            elif choice == "👤 Profile":
+                manage_profile(st.session_state.user_id)
+
+            elif choice == "🏋️ Workout":
+                log_workout(st.session_state.user_id)
+
+            elif choice == "🎯 Goals":
+                show_goal_suggestions(st.session_state.user_id)
+                set_goal(st.session_state.user_id)
+                st.divider()
+                view_goals(st.session_state.user_id)
+
+            elif choice == "🤖 Chatbot":
+                fitness_chatbot(st.session_state.user_id)
+                with st.expander("📊 My Chat Analytics"):
+                    show_chat_analytics(st.session_state.user_id)
+
+            elif choice == "🥗 Nutrition":
+                nutrition_chat(st.session_state.user_id)
+
+            elif choice == "📄 Report":
+                st.subheader("📄 Generate Your Fitness Report")
+                st.write("Download a personalised PDF summary of your profile, goals, workouts, and chat history.")
+                if st.button("📥 Generate PDF Report", type="primary"):
+                    try:
+                        # Rendered in memory and streamed straight to the download button
+                        file_name, pdf = generate_user_report(
+                            st.session_state.user_id,
+                            st.session_state.user['name'],
+                            max_workout_entries=5,
+                            max_goal_entries=5,
+                            max_chat_entries=5
+                        )
                         st.download_button(
                             "⬇️ Download Report",
-                            f,
-                            file_name=path,
+                            pdf,
+                            file_name=file_name,
                             mime="application/pdf",
                             type="primary",
                         )
-                    st.success("Report generated successfully!")
-                except Exception as e:
-                    st.error(f"Failed to generate report: {e}")
+                        st.success("Report generated successfully!")
+                    except Exception as e:
+                        st.error(f"Failed to generate report: {e}")
+
+        if page_stats:
+            show_profile_stats(page_stats)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,13 @@
 import streamlit as st
 import bcrypt
+import json
+import logging
+import time
 from db import query_db, execute_db # Import both query_db and execute_db
+from goal_progress import log_weigh_in
+from sessions import COOKIE_NAME, COOKIE_SECURE, SESSION_DAYS, verify_password, create_session, restore_session, end_session
+
+logger = logging.getLogger(__name__)
 
 def register():
     st.markdown("<h2 style='text-align: center; color: #4CAF50;'>Create an Account</h2>", unsafe_allow_html=True)
@@ -43,6 +50,7 @@ def register():
                             (name, email, pwd_hash_str, age, gender, height, weight)
                         )
                         if result != -1:
+                            log_weigh_in(result, weight) # Baseline for weight-goal tracking
                             st.success("✅ Account created successfully! Please proceed to Login.")
                         else:
                             st.error("Registration failed due to a database error. Please try again.")
@@ -67,16 +75,71 @@ def login():
                 else:
                     user = query_db("SELECT * FROM users WHERE email = ?", (email,), fetchone=True)
                     if user:
-                        stored_hash_str = user["password"]
-                        pwd_bytes = pwd.encode('utf-8')
-                        stored_hash_bytes = stored_hash_str.encode('utf-8')
-                        
-                        if bcrypt.checkpw(pwd_bytes, stored_hash_bytes):
+                        if verify_password(user, pwd):
                             st.session_state.user_id = user["id"]
                             st.session_state.user = dict(user)
+                            remember_login(user["id"]) # Later refreshes skip bcrypt via the session cookie
                             st.success("Login successful! Redirecting...")
                             st.rerun()
                         else:
                             st.error("Invalid credentials. Please check your email and password.")
                     else:
                         st.error("Account not found. Please register first.")
+
+
+# --- Remembered logins: the session cookie (see sessions.py) ------------------
+
+def _request_cookie():
+    # st.context.cookies (Streamlit 1.37+) holds the cookies sent when this browser session connected
+    context = getattr(st, "context", None)
+    cookies = getattr(context, "cookies", None) or {}
+    return cookies.get(COOKIE_NAME)
+
+
+def restore_login():
+    """
+    Logs the browser session in from its session cookie, if it has a valid one.
+    Call before showing the login page; returns True when the user was restored.
+    """
+    cookie = _request_cookie()
+    if not cookie or st.session_state.get("session_ended"):
+        return False
+    started = time.perf_counter()
+    user = restore_session(cookie)
+    if user is None:
+        return False
+    st.session_state.user_id = user["id"]
+    st.session_state.user = dict(user)
+    st.session_state.session_cookie = cookie
+    logger.info("Restored session for user %s in %.1f ms", user["id"], (time.perf_counter() - started) * 1000)
+    return True
+
+
+def remember_login(user_id):
+    """Creates a session after a password login; the cookie is written on the next run (see sync_cookie)."""
+    st.session_state.pop("session_ended", None)
+    cookie = create_session(user_id)
+    if cookie:
+        st.session_state.session_cookie = cookie
+        st.session_state.pending_cookie = (cookie, SESSION_DAYS * 86400)
+
+
+def forget_login():
+    """Ends the current session and clears the browser session state and cookie."""
+    end_session(st.session_state.get("session_cookie"))
+    st.session_state.clear()
+    # The browser still sends the old cookie until the page reloads; it no longer matches a session
+    st.session_state.session_ended = True
+    st.session_state.pending_cookie = ("", 0)
+
+
+def sync_cookie():
+    """Writes (or deletes) the session cookie in the browser once, after login or logout."""
+    pending = st.session_state.pop("pending_cookie", None)
+    if pending is None:
+        return
+    import streamlit.components.v1 as components
+    value, max_age = pending
+    # Written from the page, so it can't be HttpOnly: the app never renders user input as raw HTML
+    cookie = f"{COOKIE_NAME}={value}; Max-Age={max_age}; Path=/; SameSite=Strict{'; Secure' if COOKIE_SECURE else ''}"
+    components.html(f"<script>window.parent.document.cookie = {json.dumps(cookie)};</script>", height=0)
@@ -1,26 +1,7 @@
 import streamlit as st
 import plotly.graph_objects as go
-
-
-def calculate_bmi(weight, height):
-    """Calculates BMI given weight in kg and height in cm."""
-    if height <= 0:
-        return None, "Height must be greater than 0."
-    height_m = height / 100
-    bmi = weight / (height_m ** 2)
-    return round(bmi, 2), None
-
-
-def get_bmi_category(bmi):
-    """Categorises BMI based on standard ranges. Returns (category, color)."""
-    if bmi < 18.5:
-        return "Underweight", "#1E90FF"
-    elif bmi < 25:
-        return "Normal weight", "#32CD32"
-    elif bmi < 30:
-        return "Overweight", "#FFA500"
-    else:
-        return "Obese", "#FF6347"
+from profiler import segment
+from body_metrics import ACTIVITY_FACTORS, calculate_bmi, get_bmi_category, calculate_bmr, calculate_tdee
 
 
 def _bmi_gauge(bmi: float, color: str) -> go.Figure:
@@ -50,42 +31,6 @@ def _bmi_gauge(bmi: float, color: str) -> go.Figure:
     return fig
 
 
-def calculate_bmr(weight, height, age, gender):
-    """Calculates Basal Metabolic Rate (BMR) from user metrics."""
-    if height <= 0 or age <= 0 or weight <= 0:
-        return None
-
-    gender_tag = (gender or "").strip().lower()
-    if gender_tag == "female":
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-    elif gender_tag == "male":
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    else:
-        # Use average of male and female formulas for non-binary/other
-        bmr_male = 10 * weight + 6.25 * height - 5 * age + 5
-        bmr_female = 10 * weight + 6.25 * height - 5 * age - 161
-        bmr = (bmr_male + bmr_female) / 2
-
-    return round(bmr, 2)
-
-
-def calculate_tdee(bmr, activity_level):
-    """Calculates Total Daily Energy Expenditure based on activity multiplier."""
-    if bmr is None:
-        return None
-
-    factors = {
-        "Sedentary (little or no exercise)": 1.2,
-        "Lightly active (1-3 days/week)": 1.375,
-        "Moderately active (3-5 days/week)": 1.55,
-        "Very active (6-7 days/week)": 1.725,
-        "Extra active (very hard exercise / physical job)": 1.9,
-    }
-
-    multiplier = factors.get(activity_level, 1.2)
-    return round(bmr * multiplier, 2)
-
-
 def show_bmi(user_data):
     """Displays the BMI calculation interface and results."""
     st.subheader("📏 Body Mass Index (BMI)")
@@ -105,13 +50,7 @@ def show_bmi(user_data):
         )
         activity_level = st.selectbox(
             "Activity Level",
-            options=[
-                "Sedentary (little or no exercise)",
-                "Lightly active (1-3 days/week)",
-                "Moderately active (3-5 days/week)",
-                "Very active (6-7 days/week)",
-                "Extra active (very hard exercise / physical job)",
-            ],
+            options=list(ACTIVITY_FACTORS),
             index=0,
         )
 
@@ -139,7 +78,8 @@ def show_bmi(user_data):
         gain_cal = round(tdee + 500, 2)
 
         # Gauge chart
-        st.plotly_chart(_bmi_gauge(bmi, color), use_container_width=True)
+        with segment("chart"):
+            st.plotly_chart(_bmi_gauge(bmi, color), use_container_width=True)
 
         # Result text
         st.markdown(
@@ -0,0 +1,198 @@
+import argparse
+import difflib
+import logging
+import re
+import time
+from functools import lru_cache
+from db import (
+    query_db, execute_db, executemany_db, execute_transaction, shard_job, get_checkpoint, checkpoint_statement, shard_indexes
+)
+
+# Kept free of Streamlit imports so the backfill can run from the command line
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_JOB = "calorie_backfill"
+
+# MET values (Compendium of Physical Activities, typical intensity) for workouts.EXERCISE_OPTIONS
+MET_VALUES = {
+    "Running": 9.8, "Walking": 3.5, "Cycling": 7.5, "Swimming": 5.8, "Yoga": 2.5,
+    "Weight Training": 5.0, "HIIT": 8.0, "Push-ups": 3.8, "Pull-ups": 3.8, "Jump Rope": 11.8,
+    "Pilates": 3.0, "Boxing": 7.8, "Dancing": 5.0, "Rowing": 7.0, "Other": 4.0,
+}
+DEFAULT_MET = MET_VALUES["Other"]
+DEFAULT_WEIGHT_KG = 70.0
+
+# Words in custom exercise names, mapped to one of the options above or to their own MET
+KEYWORD_METS = {
+    "run": "Running", "running": "Running", "jog": "Running", "jogging": "Running", "sprint": "Running",
+    "sprints": "Running", "treadmill": "Running",
+    "walk": "Walking", "walking": "Walking", "hike": 6.0, "hiking": 6.0, "stairs": 8.8, "stair": 8.8,
+    "bike": "Cycling", "biking": "Cycling", "cycle": "Cycling", "spin": "Cycling", "spinning": "Cycling",
+    "swim": "Swimming", "swimming": "Swimming", "laps": "Swimming",
+    "stretch": 2.3, "stretching": 2.3, "mobility": 2.3,
+    "weights": "Weight Training", "lifting": "Weight Training", "strength": "Weight Training",
+    "gym": "Weight Training", "deadlift": "Weight Training", "deadlifts": "Weight Training",
+    "squat": "Weight Training", "squats": "Weight Training", "bench": "Weight Training",
+    "crossfit": "HIIT", "circuit": "HIIT", "tabata": "HIIT", "bootcamp": "HIIT",
+    "calisthenics": "Push-ups", "plank": 3.8, "core": 3.8, "abs": 3.8,
+    "skipping": "Jump Rope", "kickboxing": "Boxing", "karate": 10.3, "judo": 10.3, "taekwondo": 10.3,
+    "zumba": 7.3, "aerobics": 7.3, "dance": "Dancing", "erg": "Rowing", "kayaking": 5.0,
+    "elliptical": 5.0, "tennis": 7.3, "badminton": 5.5, "basketball": 6.5, "football": 7.0,
+    "soccer": 7.0, "cricket": 4.8, "volleyball": 4.0, "golf": 4.8, "climbing": 8.0, "bouldering": 8.0,
+    "skiing": 7.0, "skating": 7.0, "rollerblading": 7.5,
+}
+
+# Every ~batch_size workout ids get one UPDATE; weights are looked up per row as of the workout date
+_BACKFILL_UPDATE = """
+    UPDATE workouts
+    SET calories_burned = ROUND(m.met * 3.5 * COALESCE(
+            (SELECT wi.weight FROM weigh_ins wi
+             WHERE wi.user_id = workouts.user_id AND wi.date <= workouts.date
+             ORDER BY wi.date DESC, wi.id DESC LIMIT 1),
+            u.weight, ?) / 200.0 * workouts.duration, 1),
+        calories_estimated = 1
+    FROM temp.backfill_mets m, temp.backfill_weights u
+    WHERE m.exercise = workouts.exercise AND u.user_id = workouts.user_id
+      AND workouts.id > ? AND workouts.id <= ?
+      AND COALESCE(workouts.calories_burned, 0) = 0 AND workouts.duration > 0
+"""
+
+_words = re.compile(r"[a-z]+")
+_OPTIONS = {name.lower(): name for name in MET_VALUES}
+
+
+def _met(value):
+    return MET_VALUES[value] if isinstance(value, str) else value
+
+
+@lru_cache(maxsize=4096)
+def met_for_exercise(exercise):
+    """
+    MET value for an exercise name: an exact option, a known word in a custom name
+    ("morning jog", "leg day weights"), or a close spelling ("runing"); DEFAULT_MET otherwise.
+    """
+    name = (exercise or "").strip().lower()
+    if name in _OPTIONS:
+        return MET_VALUES[_OPTIONS[name]]
+    words = _words.findall(name)
+    for word in words:
+        if word in KEYWORD_METS:
+            return _met(KEYWORD_METS[word])
+    for candidate in [name, *words]:
+        close = difflib.get_close_matches(candidate, [*_OPTIONS, *KEYWORD_METS], n=1, cutoff=0.8)
+        if close:
+            return MET_VALUES[_OPTIONS[close[0]]] if close[0] in _OPTIONS else _met(KEYWORD_METS[close[0]])
+    return DEFAULT_MET
+
+
+def estimate_calories(exercise, duration_minutes, weight_kg=None):
+    """kcal = MET x 3.5 x kg / 200 per minute, rounded to 0.1."""
+    weight_kg = weight_kg or DEFAULT_WEIGHT_KG
+    return round(met_for_exercise(exercise) * 3.5 * weight_kg / 200 * (duration_minutes or 0), 1)
+
+
+def weight_on(user_id, date):
+    """The user's weight on a date: the latest weigh-in up to then, else their profile weight."""
+    row = query_db(
+        "SELECT weight FROM weigh_ins WHERE user_id = ? AND date <= ? ORDER BY date DESC, id DESC LIMIT 1",
+        (user_id, date),
+        fetchone=True,
+        shard_key=user_id
+    )
+    if row and row["weight"]:
+        return row["weight"]
+    user = query_db("SELECT weight FROM users WHERE id = ?", (user_id,), fetchone=True)
+    return user["weight"] if user and user["weight"] else None
+
+
+def _load_lookups(shard):
+    """
+    Fills per-connection temp tables with the MET of every distinct zero-calorie exercise
+    name and the profile weight of every user in the shard, so the UPDATE is a join.
+    """
+    exercises = [row["exercise"] for row in query_db(
+        "SELECT DISTINCT exercise FROM workouts WHERE COALESCE(calories_burned, 0) = 0", shard=shard
+    )]
+    user_ids = [row["user_id"] for row in query_db("SELECT DISTINCT user_id FROM workouts", shard=shard)]
+    # Users live in the main database, so weights are looked up separately instead of joined
+    weights = {}
+    for i in range(0, len(user_ids), 500):
+        chunk = user_ids[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        for row in query_db(f"SELECT id, weight FROM users WHERE id IN ({placeholders})", chunk):
+            weights[row["id"]] = row["weight"]
+
+    for statement in (
+        "CREATE TEMP TABLE IF NOT EXISTS backfill_mets (exercise TEXT PRIMARY KEY, met REAL)",
+        "CREATE TEMP TABLE IF NOT EXISTS backfill_weights (user_id INTEGER PRIMARY KEY, weight REAL)",
+        "DELETE FROM temp.backfill_mets",
+        "DELETE FROM temp.backfill_weights",
+    ):
+        execute_db(statement, shard=shard)
+    executemany_db(
+        "INSERT INTO temp.backfill_mets (exercise, met) VALUES (?, ?)",
+        [(exercise, met_for_exercise(exercise)) for exercise in exercises if exercise is not None],
+        shard=shard
+    )
+    executemany_db(
+        "INSERT INTO temp.backfill_weights (user_id, weight) VALUES (?, ?)",
+        [(user_id, weights.get(user_id)) for user_id in user_ids],
+        shard=shard
+    )
+    return len(exercises)
+
+
+def backfill_calories(batch_size=50000, reset=False):
+    """
+    Estimates calories for every workout stored with 0 (or no) calories, shard by shard.
+    Each batch is one set-based UPDATE over an id window, committed together with its
+    checkpoint, so an interrupted run resumes where it stopped. Returns the rows updated.
+    """
+    updated = 0
+    started = time.perf_counter()
+    for shard in shard_indexes():
+        job = shard_job(BACKFILL_JOB, shard)
+        if reset:
+            execute_transaction([checkpoint_statement(job, 0)], shard=shard)
+        position = get_checkpoint(job, shard=shard)
+        last_id = query_db("SELECT COALESCE(MAX(id), 0) AS id FROM workouts", fetchone=True, shard=shard)["id"]
+        if position >= last_id:
+            continue
+        names = _load_lookups(shard)
+        logger.info("Calorie backfill (%s) from workout %d to %d, %d exercise names", job, position, last_id, names)
+
+        while position < last_id:
+            end = min(position + batch_size, last_id)
+            rows = execute_transaction(
+                [(_BACKFILL_UPDATE, (DEFAULT_WEIGHT_KG, position, end)), checkpoint_statement(job, end)],
+                shard=shard
+            )
+            if rows == -1:
+                raise RuntimeError(f"Calorie backfill failed for workouts {position + 1}-{end}")
+            updated += rows - 1 # minus the checkpoint row
+            position = end
+
+    logger.info("Calorie backfill estimated %d workouts in %.1fs", updated, time.perf_counter() - started)
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MET-based calorie estimates")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill = subparsers.add_parser("backfill", help="Estimate calories for logged workouts stored with 0")
+    backfill.add_argument("--batch-size", type=int, default=50000, help="Workout ids per UPDATE")
+    backfill.add_argument("--reset", action="store_true", help="Ignore the checkpoint and rescan everything")
+    estimate = subparsers.add_parser("estimate", help="Estimate one workout")
+    estimate.add_argument("exercise")
+    estimate.add_argument("minutes", type=float)
+    estimate.add_argument("--weight", type=float, default=DEFAULT_WEIGHT_KG, help="Body weight in kg")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        print(f"✅ Estimated calories for {backfill_calories(args.batch_size, args.reset)} workouts.")
+    elif args.command == "estimate":
+        print(
+            f"{args.exercise}: MET {met_for_exercise(args.exercise)}, "
+            f"≈ {estimate_calories(args.exercise, args.minutes, args.weight):.0f} kcal"
+        )
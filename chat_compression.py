@@ -0,0 +1,267 @@
+import argparse
+import logging
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from db import (query_db, execute_db, execute_transaction, query_all_shards, shard_job,
+                get_checkpoint, checkpoint_statement, shard_indexes)
+
+# chat_logs.bot_reply holds either plain TEXT (short or not yet migrated replies) or a BLOB:
+# MAGIC, the id of the dictionary it was compressed with (2 bytes), then a raw deflate stream
+# primed with that dictionary. Readers pass every value through reply_text().
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"\xfa" # Never the first byte of UTF-8 text, so BLOBs can't be mistaken for encoded replies
+DICTIONARY_SIZE = 32 * 1024 # zlib's window: a bigger preset dictionary wouldn't be used
+MIN_LENGTH = 64 # replies shorter than this are stored as they are
+LEVEL = 9
+DICTIONARY_REFRESH = 300 # seconds before a running process picks up a newly trained dictionary
+MIGRATION_JOB = "chat_compression"
+
+_WORD = re.compile(r"\S+")
+
+# dictionary id -> bytes; dictionaries are never deleted, old rows keep pointing at theirs
+_dictionaries = {}
+_dictionaries_loaded = 0.0
+_dictionaries_lock = threading.Lock()
+
+
+def _load_dictionaries():
+    global _dictionaries_loaded
+    rows = query_db("SELECT id, dictionary FROM chat_dictionaries ORDER BY id")
+    with _dictionaries_lock:
+        for row in rows:
+            _dictionaries[row["id"]] = bytes(row["dictionary"])
+        _dictionaries_loaded = time.monotonic()
+
+
+def current_dictionary():
+    """(id, bytes) of the newest trained dictionary, or (0, None) before one has been trained."""
+    if time.monotonic() - _dictionaries_loaded > DICTIONARY_REFRESH:
+        _load_dictionaries()
+    with _dictionaries_lock:
+        if not _dictionaries:
+            return 0, None
+        dictionary_id = max(_dictionaries)
+        return dictionary_id, _dictionaries[dictionary_id]
+
+
+def _dictionary(dictionary_id):
+    if dictionary_id == 0:
+        return None
+    if dictionary_id not in _dictionaries:
+        _load_dictionaries()
+    if dictionary_id not in _dictionaries:
+        raise ValueError(f"Chat reply compressed with unknown dictionary {dictionary_id}")
+    return _dictionaries[dictionary_id]
+
+
+def compress_reply(text):
+    """The value to store in chat_logs.bot_reply: a compressed BLOB, or `text` itself if that is smaller."""
+    if not text or len(text) < MIN_LENGTH:
+        return text
+    dictionary_id, dictionary = current_dictionary()
+    raw = text.encode("utf-8")
+    options = {"zdict": dictionary} if dictionary else {}
+    compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, **options)
+    blob = MAGIC + struct.pack(">H", dictionary_id) + compressor.compress(raw) + compressor.flush()
+    return blob if len(blob) < len(raw) else text
+
+
+def reply_text(value):
+    """The reply stored in a chat_logs.bot_reply value, decompressing it if needed."""
+    if not isinstance(value, bytes):
+        return value
+    if value[:1] != MAGIC:
+        return value.decode("utf-8", "replace")
+    dictionary_id, = struct.unpack_from(">H", value, 1)
+    dictionary = _dictionary(dictionary_id)
+    options = {"zdict": dictionary} if dictionary else {}
+    decompressor = zlib.decompressobj(-15, **options)
+    return (decompressor.decompress(value[3:]) + decompressor.flush()).decode("utf-8")
+
+
+def build_dictionary(samples, size=DICTIONARY_SIZE, max_words=6):
+    """
+    Builds a preset dictionary from sample replies: the word sequences (2 to `max_words`
+    words) that appear in the most replies, weighted by length. The most valuable ones go
+    last, where deflate reaches them with the shortest distances.
+    """
+    counts = Counter()
+    for sample in samples:
+        words = _WORD.findall(sample)
+        grams = set()
+        for n in range(2, max_words + 1):
+            for i in range(len(words) - n + 1):
+                grams.add(" ".join(words[i:i + n]))
+        counts.update(grams) # once per reply: phrases shared across replies are what pays off
+    ranked = sorted(
+        (gram for gram, count in counts.items() if count > 1),
+        key=lambda gram: (counts[gram] - 1) * len(gram),
+        reverse=True
+    )
+
+    chosen, used, text = [], 0, ""
+    for gram in ranked:
+        if used >= size:
+            break
+        if gram in text:
+            continue # already covered by a longer phrase
+        chosen.append(gram)
+        text += gram + "\n"
+        used += len(gram.encode("utf-8")) + 1
+    return "\n".join(reversed(chosen)).encode("utf-8")[-size:]
+
+
+def train_dictionary(sample_size=2000, size=DICTIONARY_SIZE):
+    """Trains a dictionary on recent replies and makes it the one new replies use. Returns (id, samples)."""
+    rows = query_all_shards("SELECT bot_reply FROM chat_logs ORDER BY id DESC LIMIT ?", (sample_size,))
+    samples = [text for text in (reply_text(row["bot_reply"]) for row in rows) if text and len(text) >= MIN_LENGTH]
+    if not samples:
+        return None, 0
+    dictionary = build_dictionary(samples, size)
+    dictionary_id = execute_db(
+        "INSERT INTO chat_dictionaries (dictionary, samples) VALUES (?, ?)", (dictionary, len(samples))
+    )
+    if dictionary_id == -1:
+        raise RuntimeError("Failed to store the chat dictionary")
+    _load_dictionaries()
+    logger.info("Trained chat dictionary %d (%d bytes) on %d replies", dictionary_id, len(dictionary), len(samples))
+    return dictionary_id, len(samples)
+
+
+def migrate_replies(batch_size=500, reset=False, recompress=False):
+    """
+    Compresses stored plain-text replies (and, with `recompress`, replies compressed with an
+    older dictionary) in id order. Each batch is written together with its checkpoint, so an
+    interrupted run resumes where it stopped. Returns (rows_compressed, bytes_before, bytes_after).
+    """
+    dictionary_id, _ = current_dictionary()
+    compressed = before = after = 0
+    for shard in shard_indexes():
+        job = shard_job(MIGRATION_JOB, shard)
+        if reset or recompress:
+            execute_transaction([checkpoint_statement(job, 0)], shard=shard)
+        after_id = get_checkpoint(job, shard=shard)
+        while True:
+            rows = query_db(
+                "SELECT id, bot_reply FROM chat_logs WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, batch_size),
+                shard=shard
+            )
+            if not rows:
+                break
+            statements = []
+            for row in rows:
+                value = row["bot_reply"]
+                if isinstance(value, bytes) and not (recompress and struct.unpack_from(">H", value, 1)[0] != dictionary_id):
+                    continue
+                packed = compress_reply(reply_text(value))
+                if not isinstance(packed, bytes) or packed == value:
+                    continue
+                # The old value in the WHERE clause skips rows changed since they were read
+                statements.append(("UPDATE chat_logs SET bot_reply = ? WHERE id = ? AND bot_reply = ?", (packed, row["id"], value)))
+                before += len(value.encode("utf-8") if isinstance(value, str) else value)
+                after += len(packed)
+            after_id = rows[-1]["id"]
+            statements.append(checkpoint_statement(job, after_id))
+            if execute_transaction(statements, shard=shard) == -1:
+                raise RuntimeError(f"Failed to compress chat replies up to {after_id}")
+            compressed += len(statements) - 1
+        logger.info("Chat reply migration (%s) done up to chat log %d", job, after_id)
+    return compressed, before, after
+
+
+def compression_report(batch_size=1000, users=50, turns=20):
+    """
+    Space used by stored replies, and the read-latency cost of decompressing them: the
+    decode time per reply, and for up to `users` users the time a chat-history read
+    (`turns` replies) spends querying versus decompressing.
+    """
+    report = {"rows": 0, "compressed": 0, "stored_bytes": 0, "original_bytes": 0, "decode_seconds": 0.0}
+    for shard in shard_indexes():
+        after_id = 0
+        while True:
+            rows = query_db(
+                "SELECT id, bot_reply FROM chat_logs WHERE id > ? ORDER BY id LIMIT ?", (after_id, batch_size), shard=shard
+            )
+            if not rows:
+                break
+            for row in rows:
+                value = row["bot_reply"]
+                if value is None:
+                    continue
+                report["rows"] += 1
+                if isinstance(value, bytes):
+                    started = time.perf_counter()
+                    text = reply_text(value)
+                    report["decode_seconds"] += time.perf_counter() - started
+                    report["compressed"] += 1
+                    report["stored_bytes"] += len(value)
+                    report["original_bytes"] += len(text.encode("utf-8"))
+                else:
+                    size = len(value.encode("utf-8"))
+                    report["stored_bytes"] += size
+                    report["original_bytes"] += size
+            after_id = rows[-1]["id"]
+
+    query_seconds = decode_seconds = 0.0
+    sampled = query_all_shards("SELECT DISTINCT user_id FROM chat_logs WHERE user_id IS NOT NULL LIMIT ?", (users,))
+    for row in sampled[:users]:
+        started = time.perf_counter()
+        replies = query_db(
+            "SELECT bot_reply FROM chat_logs WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (row["user_id"], turns),
+            shard_key=row["user_id"]
+        )
+        queried = time.perf_counter()
+        for reply in replies:
+            reply_text(reply["bot_reply"])
+        query_seconds += queried - started
+        decode_seconds += time.perf_counter() - queried
+    report["history_reads"] = len(sampled[:users])
+    report["history_query_ms"] = query_seconds * 1000 / max(len(sampled[:users]), 1)
+    report["history_decode_ms"] = decode_seconds * 1000 / max(len(sampled[:users]), 1)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compression of stored chat replies")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train = subparsers.add_parser("train", help="Train a shared dictionary on recent replies")
+    train.add_argument("--samples", type=int, default=2000, help="Recent replies to train on (per shard)")
+    train.add_argument("--size", type=int, default=DICTIONARY_SIZE, help="Dictionary size in bytes (max 32 KB)")
+    migrate = subparsers.add_parser("migrate", help="Compress existing replies in batches")
+    migrate.add_argument("--batch-size", type=int, default=500, help="Chat logs per batch")
+    migrate.add_argument("--reset", action="store_true", help="Ignore the checkpoint and rescan everything")
+    migrate.add_argument("--recompress", action="store_true", help="Also recompress replies using an older dictionary")
+    subparsers.add_parser("report", help="Show space saved and decompression overhead")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        dictionary_id, samples = train_dictionary(args.samples, min(args.size, DICTIONARY_SIZE))
+        if dictionary_id is None:
+            print("❌ No chat replies to train on yet.")
+        else:
+            print(f"✅ Trained dictionary {dictionary_id} on {samples} replies.")
+    elif args.command == "migrate":
+        rows, before, after = migrate_replies(args.batch_size, args.reset, args.recompress)
+        saved = f", {before - after:,} bytes saved ({1 - after / before:.0%})" if before else ""
+        print(f"✅ Compressed {rows} replies{saved}.")
+    elif args.command == "report":
+        report = compression_report()
+        stored, original = report["stored_bytes"], report["original_bytes"]
+        print(f"Replies: {report['rows']} ({report['compressed']} compressed)")
+        print(f"Stored: {stored:,} bytes of {original:,} ({1 - stored / original if original else 0:.0%} saved)")
+        if report["compressed"]:
+            print(f"Decompression: {report['decode_seconds'] * 1e6 / report['compressed']:.1f} µs per reply")
+        if report["history_reads"]:
+            query_ms, decode_ms = report["history_query_ms"], report["history_decode_ms"]
+            print(
+                f"Chat history read: {query_ms:.2f} ms query + {decode_ms:.2f} ms decompression "
+                f"({decode_ms / query_ms if query_ms else 0:.0%} overhead)"
+            )
@@ -0,0 +1,84 @@
+import os
+from collections import deque
+import streamlit as st
+from db import query_db
+from chat_compression import reply_text
+
+# Messages kept in session state per chat (a ring buffer: the oldest drop off)
+HISTORY_LIMIT = int(os.getenv("FITNESS_CHAT_HISTORY", "20"))
+
+# Turns paged in from chat_logs per "Load earlier" click; at most four pages
+# (two messages per turn) are kept at once
+PAGE_TURNS = 10
+EARLIER_LIMIT = 4 * PAGE_TURNS * 2
+
+
+def get_chat_history(user_id, kind):
+    """
+    Returns the session's bounded history for one chat ("fitness" or "nutrition"):
+    `recent` holds this session's latest messages, `earlier` holds turns paged in
+    from the database. Both are fixed-size deques, so memory and render time stay flat.
+    """
+    key = f"chat_history_{kind}_{user_id}"
+    if key not in st.session_state:
+        st.session_state[key] = {
+            "recent": deque(maxlen=HISTORY_LIMIT),
+            "earlier": deque(maxlen=EARLIER_LIMIT),
+            "gap": False, # True once paged-in turns no longer connect to the recent ones
+            "exhausted": False,
+        }
+    return st.session_state[key]
+
+
+def remember_turn(history, user_message, bot_reply, chat_log_id=None):
+    """Adds a question/answer pair to the ring buffer."""
+    chat_log_id = chat_log_id if chat_log_id not in (None, -1) else None
+    history["recent"].append({"role": "user", "content": user_message, "id": chat_log_id})
+    history["recent"].append({"role": "assistant", "content": bot_reply, "id": chat_log_id})
+
+
+def _oldest_id(history):
+    ids = [m["id"] for part in ("earlier", "recent") for m in history[part] if m["id"] is not None]
+    return min(ids) if ids else None
+
+
+def load_earlier(user_id, kind, history, turns=PAGE_TURNS):
+    """Pages in the `turns` chat turns before the oldest one shown. Returns the number loaded."""
+    oldest = _oldest_id(history)
+    query = "SELECT id, user_message, bot_reply FROM chat_logs WHERE user_id = ? AND kind = ?"
+    params = [user_id, kind]
+    if oldest is not None:
+        query += " AND id < ?"
+        params.append(oldest)
+    rows = query_db(query + " ORDER BY id DESC LIMIT ?", params + [turns], shard_key=user_id)
+    if len(rows) < turns:
+        history["exhausted"] = True
+
+    earlier = history["earlier"]
+    if len(earlier) + 2 * len(rows) > earlier.maxlen:
+        history["gap"] = True # appendleft below pushes the newest paged-in turns out
+    for row in rows: # newest first, so each one goes in front of the previous
+        earlier.appendleft({"role": "assistant", "content": reply_text(row["bot_reply"]), "id": row["id"]})
+        earlier.appendleft({"role": "user", "content": row["user_message"], "id": row["id"]})
+    return len(rows)
+
+
+def _render_messages(messages):
+    for message in messages:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
+
+def render_chat_history(user_id, kind, history):
+    """Draws the "Load earlier" control, any paged-in turns and the recent messages."""
+    if not history["exhausted"]:
+        if st.button("⬆️ Load earlier messages", key=f"load_earlier_{kind}_{user_id}"):
+            if load_earlier(user_id, kind, history) == 0:
+                st.caption("No earlier messages.")
+    if history["earlier"]:
+        _render_messages(history["earlier"])
+        if history["gap"]:
+            st.caption("⋯ newer messages hidden — they're still saved in your chat history ⋯")
+        elif history["recent"]:
+            st.divider()
+    _render_messages(history["recent"])
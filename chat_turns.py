@@ -0,0 +1,92 @@
+from datetime import date
+from db import query_db, execute_db, to_day
+from chat_compression import compress_reply
+from goal_suggestions import record_goal_suggestions
+
+# One fitness-chat turn without Streamlit: the LLM messages and the bookkeeping after the
+# reply. Shared by the chat page and the API.
+
+def log_chat_interaction(user_id, user_message, bot_reply):
+    """Logs the chat interaction to the database and returns the new chat log id."""
+    return execute_db(
+        "INSERT INTO chat_logs (user_id, user_message, bot_reply) VALUES (?, ?, ?)",
+        (user_id, user_message, compress_reply(bot_reply)),
+        shard_key=user_id
+    )
+
+def get_user_context(user_id):
+    """Fetches relevant user data to provide context to the AI."""
+    # Fetch user profile
+    user_data = query_db("SELECT * FROM users WHERE id = ?", (user_id,), fetchone=True)
+    if not user_data:
+        return "User data not found."
+
+    # Fetch active goals
+    goals = query_db("SELECT goal_type, target_value, current_value, status FROM goals WHERE user_id = ? AND status != 'completed'", (user_id,), shard_key=user_id)
+    # Fetch recent workout (last 3 days or similar)
+    recent_workouts = query_db(
+        "SELECT date, exercise, duration, calories_burned FROM workouts WHERE user_id = ? AND day >= ? ORDER BY day DESC LIMIT 3",
+        (user_id, to_day(date.today()) - 3),
+        shard_key=user_id
+    )
+
+    context = f"""
+    User Profile:
+    - Name: {user_data['name']}
+    - Age: {user_data['age']}
+    - Gender: {user_data['gender']}
+    - Height: {user_data['height']} cm
+    - Weight: {user_data['weight']} kg
+
+    Active Goals:
+    """
+    if goals:
+        for goal in goals:
+            context += f"- Type: {goal['goal_type']}, Target: {goal['target_value']}, Current: {goal['current_value']}, Status: {goal['status']}\n"
+    else:
+        context += "No active goals.\n"
+
+    context += "\nRecent Workouts (last 3 days):\n"
+    if recent_workouts:
+        for workout in recent_workouts:
+            context += f"- Date: {workout['date']}, Exercise: {workout['exercise']}, Duration: {workout['duration']} min, Calories: {workout['calories_burned']}\n"
+    else:
+        context += "No recent workouts logged.\n"
+
+    return context
+
+def fitness_messages(user_id, prompt):
+    """The system and user messages sent to the LLM for one chat message, with the user's context."""
+    user_context = get_user_context(user_id)
+
+    # Prepare the full prompt for the AI, including user context
+    full_prompt = f"""
+    User Context:
+    {user_context}
+
+    User Message:
+    {prompt}
+
+    Please provide a helpful, friendly, and accurate response related to fitness, nutrition, or the user's goals based on the context provided.
+    If the user mentions a goal (e.g., losing weight, gaining muscle, specific exercise targets), acknowledge it and offer relevant advice or encouragement.
+    If the user's message seems to define a new goal, please acknowledge it and suggest they might want to formally set it in the Goals section.
+    """
+    return [
+        {
+            "role": "system",
+            "content": "You are Nova, a friendly and knowledgeable AI fitness and nutrition assistant. Provide helpful, encouraging, and scientifically-backed advice. Use the user's context (profile, goals, recent workouts) provided to personalize your responses."
+        },
+        {
+            "role": "user",
+            "content": full_prompt
+        }
+    ]
+
+def finish_fitness_turn(user_id, prompt, response_text, current_weight=None):
+    """
+    Logs a finished chat turn and stores any goals mentioned in the message as suggestions.
+    Returns (chat_log_id, whether a goal suggestion was recorded).
+    """
+    chat_log_id = log_chat_interaction(user_id, prompt, response_text)
+    suggested = record_goal_suggestions(user_id, chat_log_id, prompt, current_weight)
+    return chat_log_id, bool(suggested)
@@ -0,0 +1,290 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+import groq
+from db import query_db, execute_db, shard_for_user, SHARD_COUNT, to_day
+from llm_client import MODEL
+
+# Kept free of Streamlit imports so the nightly job can run from cron
+
+logger = logging.getLogger(__name__)
+
+# Groq limits for the model (requests and tokens per minute); the job stays under both
+REQUESTS_PER_MINUTE = float(os.getenv("FITNESS_SUMMARY_RPM", "30"))
+TOKENS_PER_MINUTE = float(os.getenv("FITNESS_SUMMARY_TPM", "6000"))
+MAX_TOKENS = 180 # completion cap per summary
+MAX_ATTEMPTS = 5
+# A rate limit asking for a longer wait than this (e.g. the daily quota) ends the run; rerun to resume
+MAX_PAUSE = 120
+
+SYSTEM_PROMPT = (
+    "You are Nova, a supportive fitness coach. Write a short weekly coach's summary (at most four "
+    "sentences) for the member below: what they did this week, how their goals are tracking, and one "
+    "concrete focus for next week. Address them by first name. No lists or headings."
+)
+
+# The batch job has its own client: longer timeout, and retries are handled here
+_client = groq.Groq(timeout=60, max_retries=0)
+
+
+class TokenBucket:
+    """`rate` units per second, bursting up to `capacity`; acquire() blocks until they are available."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount):
+        # Requests bigger than the bucket wait for a full bucket and take it into debt
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= min(amount, self.capacity):
+                    self.tokens -= amount
+                    return
+                wait = (min(amount, self.capacity) - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def adjust(self, amount):
+        """Credits (positive) or debits (negative) units, e.g. once actual token usage is known."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """Request and token buckets shared by all workers, plus a common pause after a 429."""
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute / 60, requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+        self.paused_until = 0.0
+        self.stopped = threading.Event()
+
+    def acquire(self, estimated_tokens):
+        while True:
+            wait = self.paused_until - time.monotonic()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        self.requests.acquire(1)
+        self.tokens.acquire(estimated_tokens)
+
+    def settle(self, estimated_tokens, used_tokens):
+        self.tokens.adjust(estimated_tokens - used_tokens)
+
+    def pause(self, seconds):
+        """Holds every worker back after a rate-limit error; ends the run if the wait is too long."""
+        if seconds > MAX_PAUSE:
+            logger.warning("Rate limited for %.0fs; stopping, rerun later to resume", seconds)
+            self.stopped.set()
+            return
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def week_start(day=None):
+    """Monday of the last full week before `day` (default: today)."""
+    day = date.fromisoformat(day) if isinstance(day, str) else (day or date.today())
+    return (day - timedelta(days=day.weekday() + 7)).isoformat()
+
+
+def pending_users(week, user_ids=None):
+    """Users (all, or `user_ids`) without a summary for the week yet: the job's resume point."""
+    done = {row["user_id"] for row in query_db("SELECT user_id FROM coach_summaries WHERE week = ?", (week,))}
+    if user_ids is None:
+        user_ids = [row["id"] for row in query_db("SELECT id FROM users ORDER BY id")]
+    return [user_id for user_id in user_ids if user_id not in done]
+
+
+def fetch_summary_data(user_ids, week):
+    """
+    Profile, the week's workouts per exercise, active goals and the week's weigh-ins for
+    several users, in one query per table and shard. Returns {user_id: data}.
+    """
+    start = date.fromisoformat(week)
+    end = (start + timedelta(days=6)).isoformat()
+    placeholders = ",".join("?" * len(user_ids))
+    users = query_db(f"SELECT id, name, age, gender, height, weight FROM users WHERE id IN ({placeholders})", list(user_ids))
+    data = {row["id"]: {"user": dict(row), "workouts": [], "goals": [], "weights": []} for row in users}
+
+    by_shard = defaultdict(list)
+    for user_id in data:
+        by_shard[shard_for_user(user_id) if SHARD_COUNT > 1 else None].append(user_id)
+    for shard, ids in by_shard.items():
+        where = f"user_id IN ({','.join('?' * len(ids))})"
+        for key, query, params in (
+            ("workouts",
+             f"SELECT user_id, exercise, COUNT(*) AS sessions, SUM(duration) AS minutes, "
+             f"SUM(calories_burned) AS calories FROM workouts WHERE {where} AND day BETWEEN ? AND ? "
+             "GROUP BY user_id, exercise ORDER BY user_id, minutes DESC",
+             [*ids, to_day(week), to_day(end)]),
+            ("goals",
+             f"SELECT user_id, goal_type, target_value, current_value, end_date FROM goals "
+             f"WHERE {where} AND status = 'active' ORDER BY user_id, end_date",
+             ids),
+            ("weights",
+             f"SELECT user_id, weight FROM weigh_ins WHERE {where} AND date BETWEEN ? AND ? "
+             "ORDER BY user_id, date, id",
+             [*ids, week, end]),
+        ):
+            for row in query_db(query, params, shard=shard):
+                data[row["user_id"]][key].append(dict(row))
+    return data
+
+
+def build_prompt(data, week):
+    """A compact, get_user_context-style description of one member's week."""
+    user = data["user"]
+    lines = [
+        f"Member: {user['name'] or 'Member'}, {user['age'] or '?'} years, {user['gender'] or 'unspecified'}, "
+        f"{user['height'] or '?'} cm, {user['weight'] or '?'} kg.",
+        f"Week of {week}:",
+    ]
+    workouts = data["workouts"]
+    if workouts:
+        lines.append(
+            f"- {sum(w['sessions'] for w in workouts)} workouts, {sum(w['minutes'] or 0 for w in workouts):.0f} minutes, "
+            f"{sum(w['calories'] or 0 for w in workouts):.0f} kcal"
+        )
+        for w in workouts[:6]:
+            lines.append(f"  - {w['exercise']}: {w['sessions']}x, {w['minutes'] or 0:.0f} min")
+    else:
+        lines.append("- No workouts logged.")
+    if len(data["weights"]) >= 2:
+        change = data["weights"][-1]["weight"] - data["weights"][0]["weight"]
+        lines.append(f"- Weight change: {change:+.1f} kg")
+    for goal in data["goals"][:4]:
+        lines.append(
+            f"- Goal {goal['goal_type']}: {goal['current_value'] or 0:g} of {goal['target_value'] or 0:g}, ends {goal['end_date']}"
+        )
+    return "\n".join(lines)
+
+
+def _template_summary(data, week):
+    name = (data["user"]["name"] or "there").split()[0]
+    return (
+        f"Hi {name}, there were no workouts logged in the week of {week}. "
+        "A short walk or a 10-minute session is a great way to get going again — small steps count!"
+    )
+
+
+def _retry_after(error):
+    try:
+        return float(error.response.headers.get("retry-after", 10))
+    except (AttributeError, TypeError, ValueError):
+        return 10.0
+
+
+def summarize_user(data, week, limiter):
+    """Summary for one member: (text, model, tokens), or None if it couldn't be generated now."""
+    if not data["workouts"] and not data["weights"]:
+        return _template_summary(data, week), "template", 0 # nothing to coach on, no LLM call needed
+
+    prompt = build_prompt(data, week)
+    estimate = (len(SYSTEM_PROMPT) + len(prompt)) // 4 + MAX_TOKENS
+    for attempt in range(MAX_ATTEMPTS):
+        if limiter.stopped.is_set():
+            return None
+        limiter.acquire(estimate)
+        try:
+            response = _client.chat.completions.create(
+                model=MODEL,
+                messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
+                max_tokens=MAX_TOKENS,
+            )
+        except groq.RateLimitError as e:
+            limiter.settle(estimate, 0)
+            limiter.pause(_retry_after(e))
+            continue
+        except (groq.APIConnectionError, groq.InternalServerError) as e:
+            logger.warning("Summary for user %s failed (attempt %d): %s", data["user"]["id"], attempt + 1, e)
+            limiter.settle(estimate, 0)
+            time.sleep(2 ** attempt)
+            continue
+        except groq.APIError as e:
+            logger.error("Summary for user %s failed: %s", data["user"]["id"], e)
+            return None
+        used = response.usage.total_tokens if response.usage else estimate
+        limiter.settle(estimate, used)
+        return response.choices[0].message.content.strip(), MODEL, used
+    return None
+
+
+def run_summaries(week=None, user_ids=None, workers=8, batch_size=200, reset=False, limiter=None):
+    """
+    Writes a coach's summary for every user (or `user_ids`) without one for `week`.
+    Each summary is stored as soon as it arrives, so a run stopped by rate limits (or
+    anything else) resumes with the remaining users. Returns (written, skipped).
+    """
+    week = week or week_start()
+    if reset:
+        execute_db("DELETE FROM coach_summaries WHERE week = ?", (week,))
+    pending = pending_users(week, user_ids)
+    limiter = limiter or RateLimiter()
+    written = 0
+    started = time.perf_counter()
+    logger.info("Coach summaries for week %s: %d users pending", week, len(pending))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summary") as pool:
+        for i in range(0, len(pending), batch_size):
+            if limiter.stopped.is_set():
+                break
+            data = fetch_summary_data(pending[i:i + batch_size], week)
+            futures = {pool.submit(summarize_user, item, week, limiter): user_id for user_id, item in data.items()}
+            for future in as_completed(futures):
+                result = future.result()
+                if result is None:
+                    continue # left without a row, so the next run picks it up
+                text, model, tokens = result
+                if execute_db(
+                    "INSERT OR REPLACE INTO coach_summaries (user_id, week, summary, model, tokens) VALUES (?, ?, ?, ?, ?)",
+                    (futures[future], week, text, model, tokens)
+                ) != -1:
+                    written += 1
+
+    logger.info(
+        "Coach summaries for week %s: %d written, %d left for the next run, %.1fs",
+        week, written, len(pending) - written, time.perf_counter() - started
+    )
+    return written, len(pending) - written
+
+
+def latest_summary(user_id):
+    """The user's most recent coach's summary row, or None."""
+    return query_db(
+        "SELECT week, summary FROM coach_summaries WHERE user_id = ? ORDER BY week DESC LIMIT 1",
+        (user_id,),
+        fetchone=True
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Weekly coach's summaries")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", help="Summarize last week for every user without a summary (run nightly)")
+    run.add_argument("--week", default=None, help="Monday of the week, YYYY-MM-DD (default: last full week)")
+    run.add_argument("--user-id", type=int, nargs="*", default=None)
+    run.add_argument("--workers", type=int, default=8, help="Concurrent LLM requests")
+    run.add_argument("--batch-size", type=int, default=200, help="Users fetched per batch of queries")
+    run.add_argument("--reset", action="store_true", help="Regenerate the week's summaries")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        written, remaining = run_summaries(args.week, args.user_id, args.workers, args.batch_size, args.reset)
+        if remaining:
+            print(f"❌ Wrote {written} summaries; {remaining} left (rate limited or failed) — rerun to resume.")
+        else:
+            print(f"✅ Wrote {written} summaries.")
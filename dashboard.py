@@ -1,52 +1,154 @@
 import streamlit as st
 import plotly.graph_objects as go
 import plotly.express as px
-from db import query_db
-from datetime import datetime, timedelta
-import calendar
+from db import query_db, data_version
+from profiler import segment
+from fragments import fragment
+from coach_summaries import latest_summary
+from trends import (
+    TIME_RANGES, RESOLUTIONS, pick_resolution, downsample,
+    workout_totals, workout_series, chat_series, weight_series,
+)
+
+# Above this many points, line charts drop the per-point markers
+MARKER_LIMIT = 90
+
+# Cached dashboard data is keyed by the user's data version, so writes show up
+# immediately; the TTL only bounds memory for idle users
+CACHE_TTL = 600
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def load_overview(user_id, version):
+    """Profile and goals as plain dicts; `version` is db.data_version(user_id)."""
+    user_data = query_db("SELECT * FROM users WHERE id = ?", (user_id,), fetchone=True)
+    goals = query_db("SELECT goal_type, target_value, current_value, status FROM goals WHERE user_id = ?", (user_id,), shard_key=user_id)
+    return (dict(user_data) if user_data else None), [dict(g) for g in goals]
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def load_trends(user_id, version, days, resolution):
+    """Aggregated series for one time range; payloads stay small for any range."""
+    totals = workout_totals(user_id, days)
+    return {
+        "sessions": totals['sessions'] if totals else 0,
+        "calories": totals['calories'] if totals else 0,
+        "workouts": [dict(row) for row in workout_series(user_id, days, resolution)],
+        "chat": [dict(row) for row in chat_series(user_id, days, resolution)],
+        "weigh_ins": [dict(row) for row in weight_series(user_id, days)],
+    }
 
 def show_dashboard(user_id):
     """Displays the user's fitness dashboard."""
     st.subheader("📊 Dashboard")
 
-    # Fetch user profile data
-    user_data = query_db("SELECT * FROM users WHERE id = ?", (user_id,), fetchone=True)
+    user_data, _ = load_overview(user_id, data_version(user_id))
     if not user_data:
         st.error("User data not found. Please log in again.")
         st.session_state.clear()
         st.rerun()
         return
 
-    # Fetch user's goals
-    goals = query_db("SELECT goal_type, target_value, current_value, status FROM goals WHERE user_id = ?", (user_id,))
+    # Written by the nightly coach_summaries.py job
+    summary = latest_summary(user_id)
+    if summary:
+        st.info(f"📝 **Coach's summary, week of {summary['week']}:** {summary['summary']}")
+
+    # Each section reruns on its own when its widgets change
+    show_trends(user_id)
+    show_goal_progress(user_id)
+
+@fragment("Dashboard / trends")
+def show_trends(user_id):
+    """Key metrics and trend charts for the selected time range."""
+    user_data, goals = load_overview(user_id, data_version(user_id))
 
-    # Fetch user's recent workouts (last 7 days)
-    seven_days_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-    workouts = query_db(
-        "SELECT date, exercise, duration, calories_burned FROM workouts WHERE user_id = ? AND date >= ? ORDER BY date DESC",
-        (user_id, seven_days_ago)
-    )
+    # Time range for the trend charts; long ranges read the weekly/monthly rollups
+    range_col, resolution_col = st.columns([2, 3])
+    range_label = range_col.selectbox("Time range", list(TIME_RANGES), key="dashboard_range")
+    resolution_choice = resolution_col.radio("Resolution", RESOLUTIONS, horizontal=True, key="dashboard_resolution")
+    days = TIME_RANGES[range_label]
+    resolution = pick_resolution(days, resolution_choice)
 
-    # Fetch user's chat logs (last 7 days)
-    chat_logs = query_db(
-        "SELECT timestamp, user_message FROM chat_logs WHERE user_id = ? AND timestamp >= ? ORDER BY timestamp DESC",
-        (user_id, seven_days_ago)
-    )
+    data = load_trends(user_id, data_version(user_id), days, resolution)
+    workouts, chat_activity, weigh_ins = data["workouts"], data["chat"], data["weigh_ins"]
 
     # Calculate key metrics
-    total_workouts = len(workouts)
-    total_calories_burned = sum(w['calories_burned'] for w in workouts if w['calories_burned']) if workouts else 0
+    total_workouts = data["sessions"]
+    total_calories_burned = data["calories"]
     active_goals = len([g for g in goals if g['status'] != 'completed'])
     total_goals = len(goals)
 
     # --- Display Key Metrics ---
     col1, col2, col3, col4 = st.columns(4)
     col1.metric("Total Workouts", total_workouts)
-    col2.metric("Calories Burned (Last 7 Days)", f"{total_calories_burned:.0f}")
+    col2.metric(f"Calories Burned ({range_label})", f"{total_calories_burned:.0f}")
     col3.metric("Active Goals", f"{active_goals}/{total_goals}")
     col4.metric("BMI", round(user_data['weight'] / ((user_data['height'] / 100) ** 2), 2)) # Recalculate BMI
 
 
+    # --- Workout Activity Chart ---
+    if workouts:
+        st.subheader("🏋️ Workout Activity")
+        # Totals are already summed per day/week/month by the query
+        periods = [w['period_start'] for w in workouts]
+        duration_dates, durations = downsample(periods, [w['minutes'] for w in workouts])
+        calorie_dates, calories = downsample(periods, [w['calories'] for w in workouts])
+        mode = 'lines+markers' if len(duration_dates) <= MARKER_LIMIT else 'lines'
+
+        with segment("chart"):
+            fig_workouts = go.Figure()
+            fig_workouts.add_trace(go.Scatter(x=duration_dates, y=durations, mode=mode, name='Duration (min)', yaxis='y1'))
+            fig_workouts.add_trace(go.Scatter(x=calorie_dates, y=calories, mode=mode, name='Calories Burned', yaxis='y2'))
+
+            fig_workouts.update_layout(
+                title=f"Workout Duration & Calories Burned ({range_label}, {resolution})",
+                xaxis_title="Date",
+                yaxis=dict(title="Duration (minutes)", side='left'),
+                yaxis2=dict(title="Calories", side='right', overlaying='y'),
+            )
+            st.plotly_chart(fig_workouts, use_container_width=True)
+    else:
+        st.info("No workout data found for this period. Log some workouts in the 'Workout' section.")
+
+
+    # --- Weight Trend Chart ---
+    if len(weigh_ins) > 1:
+        st.subheader("⚖️ Weight Trend")
+        # Weigh-ins are plotted at raw resolution, downsampled to the point budget
+        weigh_in_dates, weights = downsample([w['date'] for w in weigh_ins], [w['weight'] for w in weigh_ins])
+
+        with segment("chart"):
+            fig_weight = go.Figure(go.Scatter(
+                x=weigh_in_dates, y=weights, name='Weight (kg)',
+                mode='lines+markers' if len(weigh_in_dates) <= MARKER_LIMIT else 'lines'
+            ))
+            fig_weight.update_layout(title=f"Weight ({range_label})", xaxis_title="Date", yaxis_title="Weight (kg)")
+            st.plotly_chart(fig_weight, use_container_width=True)
+
+
+    # --- Chat Activity Chart ---
+    if chat_activity:
+        st.subheader(f"💬 Chat Activity ({range_label})")
+        log_dates, message_counts = downsample(
+            [row['period_start'] for row in chat_activity], [row['messages'] for row in chat_activity]
+        )
+
+        with segment("chart"):
+            fig_chat = px.bar(
+                x=log_dates,
+                y=message_counts,
+                labels={'x': 'Date', 'y': 'Number of Messages'},
+                title=f"Number of Messages per {'Day' if resolution == 'daily' else resolution[:-2].capitalize()}"
+            )
+            st.plotly_chart(fig_chat, use_container_width=True)
+    else:
+        st.info("No chat activity found for this period. Start a conversation with Nova AI!")
+
+
+@fragment("Dashboard / goals")
+def show_goal_progress(user_id):
+    """Current vs target values and status breakdown of the user's goals."""
+    _, goals = load_overview(user_id, data_version(user_id))
+
     # --- Goal Progress Chart ---
     if goals:
         st.subheader("🎯 Goal Progress")
@@ -55,86 +157,27 @@ def show_dashboard(user_id):
         target_values = [g['target_value'] for g in goals]
         statuses = [g['status'] for g in goals]
 
-        # Create a combined bar chart for current vs target
-        fig_goals = go.Figure(data=[
-            go.Bar(name='Current Value', x=goal_names, y=current_values, marker_color='lightblue'),
-            go.Bar(name='Target Value', x=goal_names, y=target_values, marker_color='orange')
-        ])
-        fig_goals.update_layout(
-            title="Current vs Target Values for Goals",
-            xaxis_title="Goal Type",
-            yaxis_title="Value",
-            barmode='group'
-        )
-        st.plotly_chart(fig_goals, use_container_width=True)
-
-        # Status pie chart
-        status_counts = {status: statuses.count(status) for status in set(statuses)}
-        fig_status = px.pie(
-            names=list(status_counts.keys()),
-            values=list(status_counts.values()),
-            title="Goal Status Distribution"
-        )
-        st.plotly_chart(fig_status, use_container_width=True)
+        with segment("chart"):
+            # Create a combined bar chart for current vs target
+            fig_goals = go.Figure(data=[
+                go.Bar(name='Current Value', x=goal_names, y=current_values, marker_color='lightblue'),
+                go.Bar(name='Target Value', x=goal_names, y=target_values, marker_color='orange')
+            ])
+            fig_goals.update_layout(
+                title="Current vs Target Values for Goals",
+                xaxis_title="Goal Type",
+                yaxis_title="Value",
+                barmode='group'
+            )
+            st.plotly_chart(fig_goals, use_container_width=True)
+
+            # Status pie chart
+            status_counts = {status: statuses.count(status) for status in set(statuses)}
+            fig_status = px.pie(
+                names=list(status_counts.keys()),
+                values=list(status_counts.values()),
+                title="Goal Status Distribution"
+            )
+            st.plotly_chart(fig_status, use_container_width=True)
     else:
         st.info("You haven't set any goals yet. Go to the 'Goals' section to get started!")
-
-
-    # --- Workout Activity Chart ---
-    if workouts:
-        st.subheader("🏋️ Recent Workout Activity")
-        workout_dates = [w['date'] for w in workouts]
-        workout_durations = [w['duration'] for w in workouts]
-        workout_calories = [w['calories_burned'] for w in workouts]
-
-        # Prepare data for plotting (sum calories/duration per date if multiple workouts per day)
-        daily_stats = {}
-        for w in workouts:
-            date = w['date']
-            if date not in daily_stats:
-                daily_stats[date] = {'duration': 0, 'calories': 0}
-            daily_stats[date]['duration'] += w['duration']
-            daily_stats[date]['calories'] += w['calories_burned']
-
-        sorted_dates = sorted(daily_stats.keys())
-        durations = [daily_stats[date]['duration'] for date in sorted_dates]
-        calories = [daily_stats[date]['calories'] for date in sorted_dates]
-
-        fig_workouts = go.Figure()
-        fig_workouts.add_trace(go.Scatter(x=sorted_dates, y=durations, mode='lines+markers', name='Duration (min)', yaxis='y1'))
-        fig_workouts.add_trace(go.Scatter(x=sorted_dates, y=calories, mode='lines+markers', name='Calories Burned', yaxis='y2'))
-
-        fig_workouts.update_layout(
-            title="Workout Duration & Calories Burned (Last 7 Days)",
-            xaxis_title="Date",
-            yaxis=dict(title="Duration (minutes)", side='left'),
-            yaxis2=dict(title="Calories", side='right', overlaying='y'),
-        )
-        st.plotly_chart(fig_workouts, use_container_width=True)
-    else:
-        st.info("No recent workout data found. Log some workouts in the 'Workout' section.")
-
-
-    # --- Chat Activity Chart ---
-    if chat_logs:
-        st.subheader("💬 Chat Activity (Last 7 Days)")
-        # Extract dates from timestamps
-        log_dates = [datetime.fromisoformat(log['timestamp'].replace('Z', '+00:00')).date() for log in chat_logs]
-        # Count messages per day
-        date_counts = {}
-        for date in log_dates:
-            date_counts[date] = date_counts.get(date, 0) + 1
-
-        # Prepare data for bar chart
-        sorted_log_dates = sorted(date_counts.keys())
-        message_counts = [date_counts[date] for date in sorted_log_dates]
-
-        fig_chat = px.bar(
-            x=[date.strftime('%Y-%m-%d') for date in sorted_log_dates], # Format dates for x-axis
-            y=message_counts,
-            labels={'x': 'Date', 'y': 'Number of Messages'},
-            title="Number of Messages per Day"
-        )
-        st.plotly_chart(fig_chat, use_container_width=True)
-    else:
-        st.info("No recent chat activity found. Start a conversation with Nova AI!")
@@ -2,75 +2,368 @@ import sqlite3
 import os
 import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from log_config import setup_logging
+from profiler import timed
+import db_writer
 
-# Configure logging (optional, but helpful for debugging)
-logging.basicConfig(level=logging.INFO)
+# Configure logging: records are queued and written by a background listener thread
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Path to the SQLite database file
 DB_PATH = "Fitness Assistant.db"
 
+# Integer forms of the date columns, generated by SQLite from the text columns (so every writer
+# keeps them right) and indexed: range filters and sorts compare integers instead of strings.
+# workouts.day, goals.start_day / end_day: days since 1970-01-01; chat_logs.ts: Unix seconds (UTC).
+# Julian day 2440587.5 is 1970-01-01 00:00 UTC; unparseable text gives NULL.
+DAY_COLUMN = "INTEGER GENERATED ALWAYS AS (CAST(julianday({column}) - 2440587.5 AS INTEGER)) VIRTUAL"
+EPOCH_COLUMN = "INTEGER GENERATED ALWAYS AS (CAST(strftime('%s', {column}) AS INTEGER)) VIRTUAL"
+GENERATED_DATE_COLUMNS = (
+    ("workouts", "day", DAY_COLUMN.format(column="date")),
+    ("goals", "start_day", DAY_COLUMN.format(column="start_date")),
+    ("goals", "end_day", DAY_COLUMN.format(column="end_date")),
+    ("chat_logs", "ts", EPOCH_COLUMN.format(column="timestamp")),
+)
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def to_day(value):
+    """Day number (as stored in the *_day columns) of a date, datetime or YYYY-MM-DD string."""
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    elif isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal() - _EPOCH_ORDINAL
+
+def from_day(day):
+    """The date of a day number."""
+    return date.fromordinal(int(day) + _EPOCH_ORDINAL)
+
+def to_epoch(value):
+    """Unix seconds (as stored in chat_logs.ts) of a datetime, date or ISO string; naive values are UTC."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    elif not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc) # CURRENT_TIMESTAMP is UTC
+    return int(value.timestamp())
+
+def from_epoch(seconds):
+    """Naive UTC datetime of Unix seconds, like the text CURRENT_TIMESTAMP writes."""
+    return datetime.fromtimestamp(int(seconds), timezone.utc).replace(tzinfo=None)
+
+# Typed reads: alias a column as "name [day]" or "name [epoch]" to get date / datetime objects
+sqlite3.register_converter("day", from_day)
+sqlite3.register_converter("epoch", from_epoch)
+
+# Goal types whose progress is maintained automatically from workouts and weigh-ins
+AUTO_GOAL_TYPES = "('exercise', 'weight_loss', 'weight_gain')"
+
+# Marks auto-tracked goals completed once they reach their target
+_COMPLETE_GOALS = f"""
+        UPDATE goals SET status = 'completed', version = version + 1
+        WHERE user_id = NEW.user_id AND status = 'active' AND goal_type IN {AUTO_GOAL_TYPES}
+          AND target_value > 0 AND current_value >= target_value;
+"""
+
+# Sets weight-goal progress from history: the baseline is the last weigh-in on/before the
+# start date (or the first one inside the window), the latest reading is the last weigh-in
+# on/before the end date. Used by the weigh-in triggers and goal_progress.recompute_goal_progress.
+RECOMPUTE_WEIGHT_PROGRESS = """
+    UPDATE goals SET version = version + 1, current_value = (CASE goal_type WHEN 'weight_loss' THEN 1 ELSE -1 END) * COALESCE(
+        COALESCE(
+            (SELECT w.weight FROM weigh_ins w
+             WHERE w.user_id = goals.user_id AND w.date <= goals.start_date
+             ORDER BY w.date DESC, w.id DESC LIMIT 1),
+            (SELECT w.weight FROM weigh_ins w
+             WHERE w.user_id = goals.user_id AND w.date >= goals.start_date
+             ORDER BY w.date ASC, w.id ASC LIMIT 1)
+        ) - (SELECT w.weight FROM weigh_ins w
+             WHERE w.user_id = goals.user_id AND w.date <= goals.end_date
+             ORDER BY w.date DESC, w.id DESC LIMIT 1),
+        0)
+    WHERE goal_type IN ('weight_loss', 'weight_gain') AND status = 'active' {goal_filter}
+"""
+
+def _recompute_weight_goals(*rows):
+    """Trigger statement recomputing the active weight goals a weigh-in row (NEW and/or OLD) can affect."""
+    # A weigh-in after a goal's end date is neither its baseline nor its latest reading
+    affected = " OR ".join(f"(user_id = {row}.user_id AND {row}.date <= end_date)" for row in rows)
+    return RECOMPUTE_WEIGHT_PROGRESS.format(goal_filter=f"AND ({affected})").rstrip() + ";"
+
+# Triggers that keep goals.current_value up to date on every write: exercise goals
+# accumulate workout minutes inside the goal window (as deltas), weight goals are recomputed
+# from their baseline and latest weigh-in (loss counts positive for weight_loss), so
+# back-dated, edited and deleted weigh-ins are handled too.
+# Every change bumps goals.version so concurrent editors detect it (see goals.view_goals).
+# init_db() drops and recreates them, so edits here reach existing databases.
+GOAL_PROGRESS_TRIGGERS = {
+    "goal_progress_workout_insert": f"""
+    AFTER INSERT ON workouts
+    BEGIN
+        UPDATE goals SET current_value = COALESCE(current_value, 0) + COALESCE(NEW.duration, 0),
+                         version = version + 1
+        WHERE user_id = NEW.user_id AND goal_type = 'exercise' AND status = 'active'
+          AND NEW.day BETWEEN start_day AND end_day;
+        {_COMPLETE_GOALS}
+    END;
+    """,
+    "goal_progress_workout_delete": """
+    AFTER DELETE ON workouts
+    BEGIN
+        UPDATE goals SET current_value = COALESCE(current_value, 0) - COALESCE(OLD.duration, 0),
+                         version = version + 1
+        WHERE user_id = OLD.user_id AND goal_type = 'exercise' AND status = 'active'
+          AND OLD.day BETWEEN start_day AND end_day;
+    END;
+    """,
+    "goal_progress_workout_update": f"""
+    AFTER UPDATE OF user_id, date, duration ON workouts
+    BEGIN
+        UPDATE goals SET current_value = COALESCE(current_value, 0) - COALESCE(OLD.duration, 0),
+                         version = version + 1
+        WHERE user_id = OLD.user_id AND goal_type = 'exercise' AND status = 'active'
+          AND OLD.day BETWEEN start_day AND end_day;
+        UPDATE goals SET current_value = COALESCE(current_value, 0) + COALESCE(NEW.duration, 0),
+                         version = version + 1
+        WHERE user_id = NEW.user_id AND goal_type = 'exercise' AND status = 'active'
+          AND NEW.day BETWEEN start_day AND end_day;
+        {_COMPLETE_GOALS}
+    END;
+    """,
+    "goal_progress_weigh_in_insert": f"""
+    AFTER INSERT ON weigh_ins
+    BEGIN{_recompute_weight_goals("NEW")}
+        {_COMPLETE_GOALS}
+    END;
+    """,
+    "goal_progress_weigh_in_delete": f"""
+    AFTER DELETE ON weigh_ins
+    BEGIN{_recompute_weight_goals("OLD")}
+        {_COMPLETE_GOALS.replace("NEW.", "OLD.")}
+    END;
+    """,
+    "goal_progress_weigh_in_update": f"""
+    AFTER UPDATE OF user_id, date, weight ON weigh_ins
+    BEGIN{_recompute_weight_goals("OLD", "NEW")}
+        {_COMPLETE_GOALS}
+    END;
+    """,
+}
+
+# Weekly and monthly workout totals per user, for long-range dashboard charts.
+# Weeks start on Monday; period_start is the first day of the week or month.
+ROLLUP_PERIODS = {
+    "week": "date({column}, 'weekday 0', '-6 days')",
+    "month": "date({column}, 'start of month')",
+}
+
+def _rollup_add(row, sign):
+    """Trigger statements adding (sign=1) or removing (sign=-1) one workout from its rollups."""
+    statements = []
+    for period, expression in ROLLUP_PERIODS.items():
+        start = expression.format(column=f"{row}.date")
+        if sign > 0:
+            statements.append(f"""
+        INSERT INTO workout_rollups (user_id, period, period_start, sessions, minutes, calories)
+        VALUES ({row}.user_id, '{period}', {start}, 1, COALESCE({row}.duration, 0), COALESCE({row}.calories_burned, 0))
+        ON CONFLICT (user_id, period, period_start) DO UPDATE SET
+            sessions = sessions + 1, minutes = minutes + excluded.minutes, calories = calories + excluded.calories;""")
+        else:
+            statements.append(f"""
+        UPDATE workout_rollups SET sessions = sessions - 1, minutes = minutes - COALESCE({row}.duration, 0),
+                                   calories = calories - COALESCE({row}.calories_burned, 0)
+        WHERE user_id = {row}.user_id AND period = '{period}' AND period_start = {start};
+        DELETE FROM workout_rollups
+        WHERE user_id = {row}.user_id AND period = '{period}' AND period_start = {start} AND sessions <= 0;""")
+    return "".join(statements)
+
+WORKOUT_ROLLUP_TRIGGERS = {
+    "workout_rollup_insert": f"""
+    AFTER INSERT ON workouts
+    BEGIN{_rollup_add("NEW", 1)}
+    END;
+    """,
+    "workout_rollup_delete": f"""
+    AFTER DELETE ON workouts
+    BEGIN{_rollup_add("OLD", -1)}
+    END;
+    """,
+    "workout_rollup_update": f"""
+    AFTER UPDATE OF user_id, date, duration, calories_burned ON workouts
+    BEGIN{_rollup_add("OLD", -1)}{_rollup_add("NEW", 1)}
+    END;
+    """,
+}
+
+# Rebuilds rollups from the workouts table (run after deleting the old rollup rows)
+REBUILD_WORKOUT_ROLLUPS = "INSERT INTO workout_rollups (user_id, period, period_start, sessions, minutes, calories)" + " UNION ALL ".join(
+    f"""
+    SELECT user_id, '{period}', {expression.format(column="date")}, COUNT(*),
+           COALESCE(SUM(duration), 0), COALESCE(SUM(calories_burned), 0)
+    FROM workouts WHERE date IS NOT NULL {{user_filter}} GROUP BY user_id, 3"""
+    for period, expression in ROLLUP_PERIODS.items()
+)
+
+# Optional sharding: with FITNESS_SHARDS > 1, per-user tables live in one of N SQLite files
+# (picked per user_id) so users don't contend for a single write lock. DB_PATH then acts as
+# the global directory holding users, user_shards and job/LLM bookkeeping.
+SHARD_COUNT = max(int(os.getenv("FITNESS_SHARDS", "1")), 1)
+SHARD_DIR = os.getenv("FITNESS_SHARD_DIR", "shards")
+SHARDED_TABLES = ("workouts", "weigh_ins", "chat_logs", "goals", "goal_suggestions", "workout_rollups")
+
+# user_id -> shard index, filled lazily from the directory's user_shards table
+_shard_cache = {}
+_shard_lock = threading.Lock()
+
 # Thread-local storage for database connections (for multi-threading safety in Streamlit)
 local_storage = threading.local()
 
-def get_db_connection():
+# Per-user data versions, bumped by every successful write made with shard_key=user_id.
+# Cached views put the version in their cache key so they refresh after the user's data changes.
+_data_versions = {}
+_versions_lock = threading.Lock()
+
+def _write_via_writer(op, path, statements, expected_rowcount=None):
+    """
+    Sends a write to the single-writer daemon when FITNESS_DB_WRITER_SOCKET is set.
+    Returns None (write directly instead) when it is off or not running.
+    """
+    if not db_writer.SOCKET_PATH:
+        return None
+    try:
+        return db_writer.send_write(op, path, statements, expected_rowcount)
+    except db_writer.WriterUnavailable:
+        return None
+    except Exception as e: # same contract as a direct write: log it and return -1
+        logger.error("DB writer %s on %s failed: %s", op, path, e)
+        return -1
+
+def shard_path(shard):
+    """Returns the file path of shard number `shard`."""
+    return os.path.join(SHARD_DIR, f"shard_{shard:02d}.db")
+
+def shard_indexes():
+    """Shards to visit for fan-out queries and backfills ([None] = DB_PATH when sharding is off)."""
+    return list(range(SHARD_COUNT)) if SHARD_COUNT > 1 else [None]
+
+def shard_for_user(user_id):
+    """
+    Returns the shard holding a user's rows, assigning user_id % SHARD_COUNT on first use.
+    Assignments are cached per process; see sharding.py for moving users between shards.
     """
-    Gets a thread-local SQLite connection, creating one if it doesn't exist.
-    Ensures row_factory is set for accessing columns by name.
+    user_id = int(user_id)
+    with _shard_lock:
+        if user_id in _shard_cache:
+            return _shard_cache[user_id]
+    row = query_db("SELECT shard FROM user_shards WHERE user_id = ?", (user_id,), fetchone=True)
+    if row is None:
+        execute_db(
+            "INSERT OR IGNORE INTO user_shards (user_id, shard) VALUES (?, ?)",
+            (user_id, user_id % SHARD_COUNT)
+        )
+        row = query_db("SELECT shard FROM user_shards WHERE user_id = ?", (user_id,), fetchone=True)
+    shard = row["shard"] if row else user_id % SHARD_COUNT
+    with _shard_lock:
+        _shard_cache[user_id] = shard
+    return shard
+
+def forget_shard_assignment(user_id):
+    """Drops a cached assignment (after a user has been moved to another shard)."""
+    with _shard_lock:
+        _shard_cache.pop(int(user_id), None)
+
+def data_version(user_id):
+    """Current data version of a user (see bump_data_version)."""
+    return _data_versions.get(int(user_id), 0)
+
+def bump_data_version(user_id):
+    """Marks a user's cached data as stale; keyed writes call this automatically."""
+    with _versions_lock:
+        _data_versions[int(user_id)] = _data_versions.get(int(user_id), 0) + 1
+
+def resolve_db_path(shard_key=None, shard=None):
+    """
+    Picks the database file for a statement: the shard of user `shard_key`, an explicit
+    `shard` number, or DB_PATH. Without sharding everything resolves to DB_PATH.
     """
-    if not hasattr(local_storage, 'connection'):
+    if SHARD_COUNT <= 1:
+        return DB_PATH
+    if shard is not None:
+        return shard_path(shard)
+    if shard_key is not None:
+        return shard_path(shard_for_user(shard_key))
+    return DB_PATH
+
+def get_db_connection(path=None):
+    """
+    Gets a thread-local SQLite connection for `path` (default DB_PATH), creating one
+    if it doesn't exist. Ensures row_factory is set for accessing columns by name.
+    """
+    path = path or DB_PATH
+    connections = getattr(local_storage, 'connections', None)
+    if connections is None:
+        connections = local_storage.connections = {}
+    if path not in connections:
         try:
-            local_storage.connection = sqlite3.connect(DB_PATH)
-            local_storage.connection.row_factory = sqlite3.Row # Enables accessing columns by name
-            logger.info(f"Connected to SQLite database: {DB_PATH}")
+            connection = sqlite3.connect(path, detect_types=sqlite3.PARSE_COLNAMES) # "[day]"/"[epoch]" aliases
+            connection.row_factory = sqlite3.Row # Enables accessing columns by name
+            connections[path] = connection
+            logger.debug("Connected to SQLite database: %s", path)
         except sqlite3.Error as e:
-            logger.error(f"Failed to connect to database {DB_PATH}: {e}")
+            logger.error("Failed to connect to database %s: %s", path, e)
             raise # Re-raise to be handled by the calling function
-    return local_storage.connection
+    return connections[path]
 
 def close_db_connection():
     """
-    Closes the thread-local SQLite connection if it exists.
+    Closes all thread-local SQLite connections.
     """
-    if hasattr(local_storage, 'connection'):
+    connections = getattr(local_storage, 'connections', {})
+    for path, connection in list(connections.items()):
         try:
-            local_storage.connection.close()
-            logger.info("Database connection closed.")
+            connection.close()
+            logger.debug("Database connection closed: %s", path)
         except sqlite3.Error as e:
-            logger.error(f"Error closing database connection: {e}")
+            logger.error("Error closing database connection: %s", e)
         finally:
-            # Remove the connection attribute after closing
-            delattr(local_storage, 'connection')
+            # Remove the connection after closing
+            connections.pop(path, None)
 
-def query_db(query, params=(), fetchone=False):
+@timed("db")
+def query_db(query, params=(), fetchone=False, shard_key=None, shard=None):
     """
     Executes a SELECT query and returns the results.
+    Pass shard_key=user_id for queries on per-user tables (see resolve_db_path).
     """
     conn = None
     cursor = None
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(resolve_db_path(shard_key, shard))
         cursor = conn.cursor()
-        logger.debug(f"Executing query: {query} with params: {params}")
+        logger.debug("Executing query: %s with params: %s", query, params)
         cursor.execute(query, params)
 
         if fetchone:
             result = cursor.fetchone()
-            logger.debug(f"Fetched one row: {result}")
+            logger.debug("Fetched one row: %s", result)
         else:
             result = cursor.fetchall()
-            logger.debug(f"Fetched {len(result)} rows")
+            logger.debug("Fetched %d rows", len(result))
 
         return result
 
     except sqlite3.Error as e:
-        logger.error(f"Database Query Error: Query: {query}, Params: {params}, Error: {e}")
+        logger.error("Database Query Error: Query: %s, Params: %s, Error: %s", query, params, e)
         if fetchone:
             return None
         else:
             return []
     except Exception as e: # Catch other potential errors
-        logger.error(f"Unexpected error in query_db: {e}")
+        logger.error("Unexpected error in query_db: %s", e)
         if fetchone:
             return None
         else:
@@ -81,44 +374,53 @@ def query_db(query, params=(), fetchone=False):
             try:
                 cursor.close()
             except sqlite3.Error as e:
-                logger.warning(f"Error closing cursor: {e}")
+                logger.warning("Error closing cursor: %s", e)
         # Note: Connection is managed per thread and not closed here.
 
-def execute_db(query, params=()):
+@timed("db")
+def execute_db(query, params=(), shard_key=None, shard=None):
     """
     Executes an INSERT, UPDATE, or DELETE query.
+    Pass shard_key=user_id for statements on per-user tables (see resolve_db_path).
     """
+    result = _write_via_writer("execute", resolve_db_path(shard_key, shard), [(query, params)])
+    if result is not None:
+        if result != -1 and shard_key is not None:
+            bump_data_version(shard_key)
+        return result
     conn = None
     cursor = None
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(resolve_db_path(shard_key, shard))
         cursor = conn.cursor()
-        logger.debug(f"Executing update query: {query} with params: {params}")
+        logger.debug("Executing update query: %s with params: %s", query, params)
         cursor.execute(query, params)
         conn.commit() # Commit the transaction
+        if shard_key is not None:
+            bump_data_version(shard_key)
         last_row_id = cursor.lastrowid
         row_count = cursor.rowcount
-        logger.debug(f"Query executed successfully. Last row ID: {last_row_id}, Rows affected: {row_count}")
+        logger.debug("Query executed successfully. Last row ID: %s, Rows affected: %s", last_row_id, row_count)
         # Return last inserted row id for INSERT statements, or affected rows count for UPDATE/DELETE
         return last_row_id if last_row_id is not None else row_count
 
     except sqlite3.Error as e:
-        logger.error(f"Database Execution Error: Query: {query}, Params: {params}, Error: {e}")
+        logger.error("Database Execution Error: Query: %s, Params: %s, Error: %s", query, params, e)
         if conn: # Rollback only if connection object exists
             try:
                 conn.rollback()
                 logger.info("Transaction rolled back due to error.")
             except sqlite3.Error as rollback_e:
-                logger.error(f"Error rolling back transaction: {rollback_e}")
+                logger.error("Error rolling back transaction: %s", rollback_e)
         return -1 # Indicate failure
     except Exception as e: # Catch other potential errors
-        logger.error(f"Unexpected error in execute_db: {e}")
+        logger.error("Unexpected error in execute_db: %s", e)
         if conn:
             try:
                 conn.rollback()
                 logger.info("Transaction rolled back due to unexpected error.")
             except sqlite3.Error as rollback_e:
-                logger.error(f"Error rolling back transaction: {rollback_e}")
+                logger.error("Error rolling back transaction: %s", rollback_e)
         return -1
     finally:
         # Close cursor explicitly (good practice)
@@ -126,14 +428,150 @@ def execute_db(query, params=()):
             try:
                 cursor.close()
             except sqlite3.Error as e:
-                logger.warning(f"Error closing cursor: {e}")
+                logger.warning("Error closing cursor: %s", e)
         # Note: Connection is managed per thread and not closed here.
 
+@timed("db")
+def executemany_db(query, params_seq, expected_rowcount=None, shard_key=None, shard=None):
+    """
+    Executes one INSERT/UPDATE/DELETE for every parameter tuple in a single transaction.
+    If `expected_rowcount` is given and the statements affect a different number of
+    rows (e.g. a version check failed), the transaction is rolled back.
+    Returns the number of affected rows, or -1 on failure.
+    """
+    if db_writer.SOCKET_PATH:
+        params_seq = list(params_seq)
+    result = _write_via_writer("executemany", resolve_db_path(shard_key, shard), [(query, params_seq)], expected_rowcount)
+    if result is not None:
+        if result != -1 and shard_key is not None:
+            bump_data_version(shard_key)
+        return result
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection(resolve_db_path(shard_key, shard))
+        cursor = conn.cursor()
+        logger.debug("Executing batch query: %s", query)
+        cursor.executemany(query, params_seq)
+        row_count = cursor.rowcount
+        if expected_rowcount is not None and row_count != expected_rowcount:
+            conn.rollback()
+            logger.warning("Batch affected %d rows, expected %d; rolled back.", row_count, expected_rowcount)
+            return -1
+        conn.commit()
+        if shard_key is not None:
+            bump_data_version(shard_key)
+        return row_count
+
+    except sqlite3.Error as e:
+        logger.error("Database Batch Error: Query: %s, Error: %s", query, e)
+        if conn:
+            try:
+                conn.rollback()
+                logger.info("Transaction rolled back due to error.")
+            except sqlite3.Error as rollback_e:
+                logger.error("Error rolling back transaction: %s", rollback_e)
+        return -1
+    finally:
+        if cursor:
+            try:
+                cursor.close()
+            except sqlite3.Error as e:
+                logger.warning("Error closing cursor: %s", e)
+
+@timed("db")
+def execute_transaction(statements, shard_key=None, shard=None):
+    """
+    Executes several (query, params) statements in a single transaction.
+    Returns the total number of affected rows, or -1 if any statement failed.
+    """
+    result = _write_via_writer("transaction", resolve_db_path(shard_key, shard), statements)
+    if result is not None:
+        if result != -1 and shard_key is not None:
+            bump_data_version(shard_key)
+        return result
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection(resolve_db_path(shard_key, shard))
+        cursor = conn.cursor()
+        total = 0
+        for query, params in statements:
+            logger.debug("Executing transaction statement: %s with params: %s", query, params)
+            cursor.execute(query, params)
+            total += max(cursor.rowcount, 0)
+        conn.commit()
+        if shard_key is not None:
+            bump_data_version(shard_key)
+        return total
+
+    except sqlite3.Error as e:
+        logger.error("Database Transaction Error: %s", e)
+        if conn:
+            try:
+                conn.rollback()
+                logger.info("Transaction rolled back due to error.")
+            except sqlite3.Error as rollback_e:
+                logger.error("Error rolling back transaction: %s", rollback_e)
+        return -1
+    finally:
+        if cursor:
+            try:
+                cursor.close()
+            except sqlite3.Error as e:
+                logger.warning("Error closing cursor: %s", e)
+
+def shard_job(job, shard):
+    """Checkpoint name for one shard's run of a job (row ids are only unique per shard)."""
+    return job if shard is None else f"{job}:{shard}"
+
+def get_checkpoint(job, default=0, shard=None):
+    """Returns the saved position of a resumable batch job."""
+    row = query_db("SELECT position FROM job_checkpoints WHERE job = ?", (job,), fetchone=True, shard=shard)
+    return row["position"] if row else default
+
+def checkpoint_statement(job, position):
+    """(query, params) that saves a job's position; include it in the batch's transaction."""
+    return (
+        "INSERT INTO job_checkpoints (job, position, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) "
+        "ON CONFLICT(job) DO UPDATE SET position = excluded.position, updated_at = excluded.updated_at",
+        (job, position)
+    )
+
+def query_all_shards(query, params=()):
+    """
+    Fan-out: runs a SELECT on every shard in parallel and returns all rows together
+    (just DB_PATH when sharding is off). Aggregate the combined rows in Python.
+    """
+    shards = shard_indexes()
+    if len(shards) == 1:
+        return query_db(query, params, shard=shards[0])
+    with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        results = pool.map(lambda shard: query_db(query, params, shard=shard), shards)
+    return [row for rows in results for row in rows]
+
+def ensure_column(table, column, definition, shard=None):
+    """Adds a column to an existing table if it is missing (lightweight schema migration)."""
+    columns = [row["name"] for row in query_db(f"PRAGMA table_xinfo({table})", shard=shard)] # xinfo lists generated columns too
+    if column not in columns:
+        execute_db(f"ALTER TABLE {table} ADD COLUMN {column} {definition}", shard=shard)
+        logger.info("Added column %s.%s", table, column)
+
 def init_db():
     """
-    Creates the necessary tables if they don't exist.
+    Creates the necessary tables if they don't exist, in DB_PATH and (when sharding
+    is enabled) in every shard file. Shards carry the full schema but only per-user rows.
     This function should be called once when setting up the application.
     """
+    if SHARD_COUNT > 1:
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        for shard in shard_indexes():
+            _create_schema(shard)
+    _create_schema(None)
+    logger.info("Database tables created successfully (or already existed).")
+
+def _create_schema(shard):
+    """Creates tables, indexes and triggers in DB_PATH (shard=None) or one shard."""
     create_users = """
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -154,6 +592,7 @@ def init_db():
             exercise TEXT,
             duration INTEGER,
             calories_burned REAL,
+            calories_estimated INTEGER DEFAULT 0, -- 1 if calories_burned is a MET estimate
             FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
         );
     """
@@ -167,6 +606,7 @@ def init_db():
             start_date DATE,
             end_date DATE,
             status TEXT,
+            version INTEGER NOT NULL DEFAULT 0, -- Bumped on every change, for optimistic concurrency
             FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
         );
     """
@@ -175,16 +615,197 @@ def init_db():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER,
             user_message TEXT,
-            bot_reply TEXT,
+            bot_reply TEXT, -- or a compressed BLOB, see chat_compression.py
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            kind TEXT DEFAULT 'fitness', -- fitness or nutrition chat
             FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
         );
     """
-    execute_db(create_users)
-    execute_db(create_workouts)
-    execute_db(create_goals)
-    execute_db(create_chat_logs)
-    logger.info("Database tables created successfully (or already existed).")
+    create_weigh_ins = """
+        CREATE TABLE IF NOT EXISTS weigh_ins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            date DATE,
+            weight REAL,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+    """
+    create_goal_suggestions = """
+        CREATE TABLE IF NOT EXISTS goal_suggestions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            chat_log_id INTEGER,
+            goal_type TEXT,
+            target_value REAL,
+            start_date DATE,
+            end_date DATE,
+            description TEXT,
+            status TEXT DEFAULT 'pending', -- pending, accepted or dismissed
+            UNIQUE (chat_log_id, goal_type, target_value),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+    """
+    create_job_checkpoints = """
+        CREATE TABLE IF NOT EXISTS job_checkpoints (
+            job TEXT PRIMARY KEY,
+            position INTEGER,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """
+    create_llm_calls = """
+        CREATE TABLE IF NOT EXISTS llm_calls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT,
+            latency_ms REAL,
+            hedged INTEGER, -- 1 if a duplicate request was sent
+            outcome TEXT, -- primary, hedge or fallback
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """
+    create_user_shards = """
+        CREATE TABLE IF NOT EXISTS user_shards (
+            user_id INTEGER PRIMARY KEY,
+            shard INTEGER NOT NULL
+        );
+    """
+    create_workout_rollups = """
+        CREATE TABLE IF NOT EXISTS workout_rollups (
+            user_id INTEGER,
+            period TEXT, -- week or month
+            period_start DATE,
+            sessions INTEGER,
+            minutes INTEGER,
+            calories REAL,
+            PRIMARY KEY (user_id, period, period_start)
+        );
+    """
+    create_foods = """
+        CREATE TABLE IF NOT EXISTS foods (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE,
+            kcal REAL, -- per 100 g (or 100 ml), like the USDA tables
+            protein REAL,
+            carbs REAL,
+            fat REAL,
+            serving_g REAL, -- grams in one typical serving
+            serving TEXT -- e.g. "1 large egg"
+        );
+    """
+    create_tips = """
+        CREATE TABLE IF NOT EXISTS tips (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT UNIQUE,
+            topics TEXT -- comma-separated, e.g. 'hydration,weight_loss'
+        );
+    """
+    create_user_tips = """
+        CREATE TABLE IF NOT EXISTS user_tips (
+            user_id INTEGER,
+            day DATE,
+            tip_id INTEGER,
+            PRIMARY KEY (user_id, day) -- Filled daily by tips.py precompute; read once per page
+        );
+    """
+    create_sessions = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            token_hash TEXT PRIMARY KEY, -- SHA-256 of the cookie token; the token itself is never stored
+            user_id INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            expires_at DATETIME NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+    """
+    create_coach_summaries = """
+        CREATE TABLE IF NOT EXISTS coach_summaries (
+            user_id INTEGER,
+            week DATE, -- Monday of the summarized week
+            summary TEXT,
+            model TEXT, -- LLM model, or 'template' for weeks without activity
+            tokens INTEGER DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, week) -- Written by coach_summaries.py; a row means that user is done
+        );
+    """
+    create_chat_routes = """
+        CREATE TABLE IF NOT EXISTS chat_routes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            intent TEXT, -- answered locally by intent_router.py; NULL = sent to the LLM
+            latency_ms REAL
+        );
+    """
+    create_chat_dictionaries = """
+        CREATE TABLE IF NOT EXISTS chat_dictionaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, -- stored in each compressed reply; rows are never deleted
+            dictionary BLOB NOT NULL, -- zlib preset dictionary trained by chat_compression.py
+            samples INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """
+    create_maintenance_runs = """
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            path TEXT, -- database file (DB_PATH or a shard), see db_maintenance.py
+            task TEXT, -- checkpoint, optimize, analyze:<table>, vacuum or metrics
+            status TEXT, -- done, partial, busy, interrupted, skipped or error
+            duration_ms REAL,
+            size_bytes INTEGER, -- file metrics after the task
+            free_ratio REAL,
+            wal_bytes INTEGER
+        );
+    """
+    create_food_names = """
+        CREATE TABLE IF NOT EXISTS food_names (
+            name TEXT PRIMARY KEY, -- normalized name or alias, see nutrition_facts.normalize
+            food_id INTEGER NOT NULL,
+            FOREIGN KEY (food_id) REFERENCES foods(id) ON DELETE CASCADE
+        );
+    """
+    create_indexes = [
+        "CREATE INDEX IF NOT EXISTS idx_goals_user_status ON goals(user_id, status);",
+        "CREATE INDEX IF NOT EXISTS idx_weigh_ins_user_date ON weigh_ins(user_id, date);",
+        "CREATE INDEX IF NOT EXISTS idx_goal_suggestions_user_status ON goal_suggestions(user_id, status);",
+        "CREATE INDEX IF NOT EXISTS idx_chat_logs_user_ts ON chat_logs(user_id, ts);",
+        "CREATE INDEX IF NOT EXISTS idx_llm_calls_timestamp ON llm_calls(timestamp);",
+        "CREATE INDEX IF NOT EXISTS idx_workouts_user_day ON workouts(user_id, day);",
+        "CREATE INDEX IF NOT EXISTS idx_chat_logs_user_kind_id ON chat_logs(user_id, kind, id);",
+        "CREATE INDEX IF NOT EXISTS idx_food_names_food ON food_names(food_id);",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at);",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id);",
+        "CREATE INDEX IF NOT EXISTS idx_chat_routes_timestamp ON chat_routes(timestamp);",
+        "CREATE INDEX IF NOT EXISTS idx_maintenance_runs_path_task ON maintenance_runs(path, task, timestamp);",
+    ]
+    for statement in (create_users, create_workouts, create_goals, create_chat_logs, create_weigh_ins,
+                      create_goal_suggestions, create_job_checkpoints, create_llm_calls, create_user_shards,
+                      create_workout_rollups, create_foods, create_food_names, create_tips, create_user_tips,
+                      create_sessions, create_coach_summaries, create_chat_routes,
+                      create_chat_dictionaries, create_maintenance_runs):
+        execute_db(statement, shard=shard)
+    ensure_column("goals", "version", "INTEGER NOT NULL DEFAULT 0", shard=shard)
+    ensure_column("chat_logs", "kind", "TEXT DEFAULT 'fitness'", shard=shard)
+    ensure_column("workouts", "calories_estimated", "INTEGER DEFAULT 0", shard=shard)
+    for table, column, definition in GENERATED_DATE_COLUMNS:
+        ensure_column(table, column, definition, shard=shard)
+    # Replaced by the indexes on the integer columns; building those is the one-off migration
+    for index in ("idx_workouts_user_date", "idx_chat_logs_user_timestamp"):
+        execute_db(f"DROP INDEX IF EXISTS {index}", shard=shard)
+    for statement in create_indexes:
+        execute_db(statement, shard=shard)
+    for name, body in {**GOAL_PROGRESS_TRIGGERS, **WORKOUT_ROLLUP_TRIGGERS}.items():
+        # One transaction, so processes starting at the same time don't race between the two
+        execute_transaction([(f"DROP TRIGGER IF EXISTS {name}", ()), (f"CREATE TRIGGER {name} {body}", ())], shard=shard)
+    # Existing databases get their rollups built once; the triggers keep them current afterwards
+    if not query_db("SELECT 1 FROM workout_rollups LIMIT 1", shard=shard):
+        execute_db(REBUILD_WORKOUT_ROLLUPS.format(user_filter=""), shard=shard)
+    if SHARD_COUNT <= 1:
+        # Give every existing user a baseline weigh-in so later entries produce a delta
+        # (with sharding, registration and sharding.py's migration record it instead)
+        execute_db(
+            "INSERT INTO weigh_ins (user_id, date, weight) "
+            "SELECT id, date('now', 'localtime'), weight FROM users "
+            "WHERE weight IS NOT NULL AND id NOT IN (SELECT user_id FROM weigh_ins)"
+        )
 
 # --- Call init_db() here to ensure tables exist ---
 init_db()
@@ -0,0 +1,319 @@
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+from db import DB_PATH, query_db, execute_db, shard_indexes, shard_path
+
+# Keeps the SQLite files healthy as workouts and chat_logs churn: WAL checkpoints, fresh
+# planner statistics (PRAGMA optimize / ANALYZE) and incremental vacuuming. Work only runs
+# while a file is idle, in passes with a strict time budget, so it never holds up the app.
+
+logger = logging.getLogger(__name__)
+
+MAINTENANCE_ENABLED = os.getenv("FITNESS_MAINTENANCE", "1") == "1" # background thread in the app process
+BUDGET_MS = float(os.getenv("FITNESS_MAINTENANCE_BUDGET_MS", "200")) # per pass, across all files
+IDLE_SECONDS = float(os.getenv("FITNESS_MAINTENANCE_IDLE", "30")) # no writes for this long = idle
+CHECK_INTERVAL = 10 # seconds between idle checks
+
+# Seconds between successful runs of each task per file. A task that didn't finish is
+# retried after RETRY_INTERVAL, doubling with every further busy, interrupted, skipped or
+# failed attempt in a row (up to MAX_RETRY_INTERVAL); a partial run keeps the short wait.
+TASK_INTERVALS = {"metrics": 3600, "checkpoint": 300, "optimize": 3600, "analyze": 86400, "vacuum": 0}
+RETRY_INTERVAL = 60
+MAX_RETRY_INTERVAL = 86400
+
+ANALYSIS_LIMIT = 1000 # rows ANALYZE samples per index; keeps it fast on big tables
+WAL_LIMIT = 16 * 1024 * 1024 # a WAL bigger than this is checkpointed (and truncated) right away
+FREE_RATIO_LIMIT = 0.10 # vacuum once this share of the file is free pages...
+MIN_FREE_PAGES = 256 # ...and there are at least this many
+VACUUM_STEP_PAGES = 256 # pages released per incremental_vacuum step
+# Switching a file to incremental auto-vacuum needs one full VACUUM, which rewrites the whole
+# file and can't finish within a pass's budget; it only runs from `db_maintenance.py run --budget-ms 0`.
+
+
+def database_paths():
+    """Every database file: DB_PATH and, with sharding, each shard."""
+    return [DB_PATH] + [shard_path(shard) for shard in shard_indexes() if shard is not None]
+
+
+def _connect(path):
+    # A short busy timeout: maintenance gives way to the app instead of waiting for locks
+    return sqlite3.connect(path, timeout=0.05, isolation_level=None, check_same_thread=False)
+
+
+def database_metrics(connection, path):
+    """File size, free-page ratio and WAL size of one database."""
+    page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+    page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+    wal_path = path + "-wal"
+    return {
+        "size_bytes": page_size * page_count,
+        "free_pages": free_pages,
+        "free_ratio": free_pages / page_count if page_count else 0.0,
+        "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+        "journal_mode": connection.execute("PRAGMA journal_mode").fetchone()[0],
+        "auto_vacuum": connection.execute("PRAGMA auto_vacuum").fetchone()[0], # 2 = incremental
+    }
+
+
+def _task_ages(path):
+    """
+    {task: (seconds since last success, seconds since last attempt, unfinished attempts in a row)}
+    for one file. Partial runs made progress, so they end a streak like successes do.
+    """
+    rows = query_db(
+        "SELECT r.task, "
+        "(julianday('now') - julianday(MAX(CASE WHEN r.status = 'done' THEN r.timestamp END))) * 86400 AS since_done, "
+        "(julianday('now') - julianday(MAX(r.timestamp))) * 86400 AS since_attempt, "
+        "SUM(r.id > COALESCE((SELECT MAX(p.id) FROM maintenance_runs p WHERE p.path = r.path AND p.task = r.task "
+        "AND p.status IN ('done', 'partial')), 0)) AS unfinished "
+        "FROM maintenance_runs r WHERE r.path = ? GROUP BY r.task",
+        (path,)
+    )
+    return {row["task"]: (row["since_done"], row["since_attempt"], row["unfinished"]) for row in rows}
+
+
+def _retry_wait(unfinished):
+    return min(RETRY_INTERVAL * 2 ** max(unfinished - 1, 0), MAX_RETRY_INTERVAL)
+
+
+def _due(task, ages, interval, backoff=True):
+    since_done, since_attempt, unfinished = ages.get(task, (None, None, 0))
+    if backoff and since_attempt is not None and since_attempt < _retry_wait(unfinished):
+        return False
+    return since_done is None or since_done >= interval
+
+
+def due_tasks(connection, path, metrics, budgeted=True):
+    """
+    The tasks a file needs now, most urgent first. Unbudgeted runs (started by hand) don't
+    wait out the retry backoff.
+    """
+    ages = _task_ages(path)
+    tasks = []
+    if metrics["journal_mode"] == "wal" and (
+        metrics["wal_bytes"] > WAL_LIMIT or _due("checkpoint", ages, TASK_INTERVALS["checkpoint"], budgeted)
+    ):
+        tasks.append("checkpoint")
+    if _due("optimize", ages, TASK_INTERVALS["optimize"], budgeted):
+        tasks.append("optimize")
+    # One task per table, so a large schema is analyzed over several passes
+    tables = connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    ).fetchall()
+    tasks += [
+        f"analyze:{name}" for name, in tables if _due(f"analyze:{name}", ages, TASK_INTERVALS["analyze"], budgeted)
+    ]
+    if (metrics["free_ratio"] > FREE_RATIO_LIMIT and metrics["free_pages"] >= MIN_FREE_PAGES
+            and _due("vacuum", ages, TASK_INTERVALS["vacuum"], budgeted)):
+        tasks.append("vacuum")
+    if not tasks and _due("metrics", ages, TASK_INTERVALS["metrics"], budgeted):
+        tasks.append("metrics") # an hourly sample for the size/fragmentation history
+    return tasks
+
+
+def _run_task(connection, path, task, metrics, deadline):
+    """Runs one task; returns its status (done, partial, busy or skipped)."""
+    if task == "metrics":
+        return "done"
+    if task == "checkpoint":
+        mode = "TRUNCATE" if metrics["wal_bytes"] > WAL_LIMIT else "PASSIVE"
+        busy, _, _ = connection.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        return "busy" if busy else "done"
+    if task == "optimize":
+        connection.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+        connection.execute("PRAGMA optimize")
+        return "done"
+    if task.startswith("analyze:"):
+        connection.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+        connection.execute(f'ANALYZE "{task.split(":", 1)[1]}"')
+        return "done"
+    if task == "vacuum":
+        if metrics["auto_vacuum"] != 2:
+            if deadline is not None:
+                logger.info("%s needs a full VACUUM: run `python db_maintenance.py run --budget-ms 0`", path)
+                return "skipped"
+            connection.execute("PRAGMA auto_vacuum = INCREMENTAL") # takes effect with this VACUUM
+            connection.execute("VACUUM")
+            return "done"
+        # Each step is its own short transaction, released between steps. executescript runs the
+        # pragma to completion; execute() would stop after releasing a single page.
+        while connection.execute("PRAGMA freelist_count").fetchone()[0]:
+            if deadline is not None and time.monotonic() >= deadline:
+                return "partial"
+            connection.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})")
+        return "done"
+    raise ValueError(f"Unknown maintenance task: {task}")
+
+
+def maintain(path, budget_ms=BUDGET_MS, connection=None):
+    """
+    Runs the due tasks on one file until `budget_ms` is used up (0 = no limit). A task still
+    running at the deadline is interrupted and rolled back, and retried in a later pass
+    (see _retry_wait).
+    Returns [(task, status, ms)].
+    """
+    own_connection = connection is None
+    connection = connection or _connect(path)
+    deadline = time.monotonic() + budget_ms / 1000 if budget_ms else None
+    if deadline is not None:
+        # Checked every 1000 SQLite VM steps: returning True aborts the running statement
+        connection.set_progress_handler(lambda: time.monotonic() >= deadline, 1000)
+    results = []
+    try:
+        metrics = database_metrics(connection, path)
+        for task in due_tasks(connection, path, metrics, budgeted=deadline is not None):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            started = time.perf_counter()
+            try:
+                status = _run_task(connection, path, task, metrics, deadline)
+            except sqlite3.OperationalError as e:
+                message = str(e)
+                status = "interrupted" if "interrupt" in message else "busy" if "locked" in message or "busy" in message else "error"
+                if status == "error":
+                    logger.error("Maintenance task %s on %s failed: %s", task, path, e)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if task in ("checkpoint", "vacuum"):
+                metrics = database_metrics(connection, path)
+            execute_db(
+                "INSERT INTO maintenance_runs (path, task, status, duration_ms, size_bytes, free_ratio, wal_bytes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, task, status, round(elapsed_ms, 1), metrics["size_bytes"], round(metrics["free_ratio"], 4), metrics["wal_bytes"])
+            )
+            results.append((task, status, elapsed_ms))
+            logger.debug("Maintenance %s on %s: %s in %.1f ms", task, path, status, elapsed_ms)
+    finally:
+        connection.set_progress_handler(None, 0)
+        if own_connection:
+            connection.close()
+    return results
+
+
+def run_maintenance(budget_ms=BUDGET_MS):
+    """One pass over every database file, sharing `budget_ms` between them. Returns {path: results}."""
+    deadline = time.monotonic() + budget_ms / 1000
+    results = {}
+    for path in database_paths():
+        remaining = (deadline - time.monotonic()) * 1000 if budget_ms else 0
+        if budget_ms and remaining <= 0:
+            break
+        results[path] = maintain(path, remaining)
+    return results
+
+
+class MaintenanceScheduler:
+    """Background thread running a budgeted pass on each file that has been idle long enough."""
+
+    def __init__(self, budget_ms=BUDGET_MS, idle_seconds=IDLE_SECONDS, check_interval=CHECK_INTERVAL):
+        self.budget_ms = budget_ms
+        self.idle_seconds = idle_seconds
+        self.check_interval = check_interval
+        self.connections = {}
+        self.versions = {} # path -> (PRAGMA data_version, when it last changed)
+        self.stopped = threading.Event()
+
+    def _idle(self, path):
+        # data_version changes whenever another connection (any thread or process) commits
+        if path not in self.connections:
+            self.connections[path] = _connect(path)
+        connection = self.connections[path]
+        version = connection.execute("PRAGMA data_version").fetchone()[0]
+        previous, changed = self.versions.get(path, (None, time.monotonic()))
+        if version != previous:
+            changed = time.monotonic() if previous is not None else changed
+            self.versions[path] = (version, changed)
+        return time.monotonic() - changed >= self.idle_seconds
+
+    def run_once(self):
+        """Checks every file once; idle ones get a pass within what's left of the budget."""
+        deadline = time.monotonic() + self.budget_ms / 1000
+        for path in database_paths():
+            remaining = (deadline - time.monotonic()) * 1000
+            if remaining <= 0 or self.stopped.is_set():
+                break
+            if not os.path.exists(path) or not self._idle(path):
+                continue
+            connection = self.connections[path]
+            maintain(path, remaining, connection)
+            # Our own bookkeeping write must not count as activity
+            self.versions[path] = (connection.execute("PRAGMA data_version").fetchone()[0], self.versions[path][1])
+
+    def serve_forever(self):
+        logger.info("Database maintenance: %.0f ms budget per pass after %.0fs idle", self.budget_ms, self.idle_seconds)
+        while not self.stopped.wait(self.check_interval):
+            try:
+                self.run_once()
+            except Exception as e: # keep the thread alive; the next pass tries again
+                logger.error("Database maintenance pass failed: %s", e)
+
+    def stop(self):
+        self.stopped.set()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_maintenance():
+    """Starts the background scheduler once per process (app.py calls this on every rerun)."""
+    global _scheduler
+    if not MAINTENANCE_ENABLED:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = MaintenanceScheduler()
+            threading.Thread(target=_scheduler.serve_forever, name="db-maintenance", daemon=True).start()
+    return _scheduler
+
+
+def maintenance_status(limit=10):
+    """Current metrics of every file plus the most recent maintenance runs."""
+    files = {}
+    for path in database_paths():
+        if not os.path.exists(path):
+            continue
+        connection = _connect(path)
+        try:
+            files[path] = database_metrics(connection, path)
+        finally:
+            connection.close()
+    runs = query_db(
+        "SELECT timestamp, path, task, status, duration_ms FROM maintenance_runs ORDER BY id DESC LIMIT ?", (limit,)
+    )
+    return files, runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite maintenance: checkpoints, statistics and vacuuming")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", help="Run one pass of the due tasks now (e.g. from cron)")
+    run.add_argument("--budget-ms", type=float, default=5000, help="Time budget for the pass; 0 = no limit")
+    serve = subparsers.add_parser("serve", help="Run the idle-time scheduler in this process (set FITNESS_MAINTENANCE=0 for the app)")
+    serve.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    serve.add_argument("--idle-seconds", type=float, default=IDLE_SECONDS)
+    status = subparsers.add_parser("status", help="Show size, free-page ratio, WAL size and recent runs")
+    status.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        for path, results in run_maintenance(args.budget_ms).items():
+            done = ", ".join(f"{task} {status} ({ms:.0f} ms)" for task, status, ms in results) or "nothing due"
+            print(f"✅ {path}: {done}")
+    elif args.command == "serve":
+        try:
+            MaintenanceScheduler(args.budget_ms, args.idle_seconds).serve_forever()
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "status":
+        files, runs = maintenance_status(args.limit)
+        for path, metrics in files.items():
+            print(
+                f"{path}: {metrics['size_bytes']:,} bytes, {metrics['free_ratio']:.1%} free pages, "
+                f"WAL {metrics['wal_bytes']:,} bytes ({metrics['journal_mode']}, auto_vacuum={metrics['auto_vacuum']})"
+            )
+        for row in runs:
+            print(f"  {row['timestamp']} {row['path']} {row['task']}: {row['status']} ({row['duration_ms']:.0f} ms)")
@@ -0,0 +1,440 @@
+import argparse
+import base64
+import json
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+logger = logging.getLogger(__name__)
+
+# With FITNESS_DB_WRITER_SOCKET set, every execute_db / executemany_db / execute_transaction
+# in every app process is sent to one writer daemon (`python db_writer.py serve`) instead of
+# racing the other processes for SQLite's write lock.
+SOCKET_PATH = os.getenv("FITNESS_DB_WRITER_SOCKET", "")
+# Requests queued in the daemon before it stops reading from clients (backpressure)
+MAX_PENDING = int(os.getenv("FITNESS_DB_WRITER_MAX_PENDING", "1000"))
+# Group commit: up to GROUP_MAX requests, or whatever arrives within GROUP_WAIT_MS, share one COMMIT
+GROUP_MAX = int(os.getenv("FITNESS_DB_WRITER_GROUP_MAX", "64"))
+GROUP_WAIT_MS = float(os.getenv("FITNESS_DB_WRITER_GROUP_WAIT_MS", "2"))
+# Seconds a client waits for an acknowledgement, and reconnect attempts after a daemon restart
+CLIENT_TIMEOUT = float(os.getenv("FITNESS_DB_WRITER_TIMEOUT", "10"))
+CLIENT_RETRIES = 5
+# After a failed connect, writes go direct for this many seconds before trying the daemon again
+UNAVAILABLE_COOLDOWN = 5.0
+
+_HEADER = struct.Struct("!I")
+_MAX_FRAME = 64 * 1024 * 1024
+
+_REQUESTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS writer_requests (
+        id TEXT PRIMARY KEY, -- client request id; a retried request is answered from here, not re-run
+        result TEXT,
+        committed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+class WriterUnavailable(Exception):
+    """No daemon is listening; nothing was sent, so writing directly is safe."""
+
+
+# --- Wire format: 4-byte length + JSON ----------------------------------------
+
+def _encode(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"$bytes": base64.b64encode(bytes(value)).decode("ascii")}
+    if isinstance(value, (date, datetime)):
+        return str(value) # What sqlite3's default adapters store
+    raise TypeError(f"Can't send {type(value).__name__} to the DB writer")
+
+
+def _decode(obj):
+    return base64.b64decode(obj["$bytes"]) if set(obj) == {"$bytes"} else obj
+
+
+def _frame(message):
+    payload = json.dumps(message, default=_encode).encode("utf-8")
+    return _HEADER.pack(len(payload)) + payload
+
+
+def _send_frame(sock, message):
+    sock.sendall(_frame(message))
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            raise ConnectionError("DB writer connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_frame(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if size > _MAX_FRAME:
+        raise ConnectionError(f"DB writer frame too large ({size} bytes)")
+    return json.loads(_recv_exact(sock, size), object_hook=_decode)
+
+
+# --- Daemon -------------------------------------------------------------------
+
+class _RowcountMismatch(Exception):
+    pass
+
+
+class WriterServer:
+    """
+    Single-writer daemon. Client threads feed a bounded queue; one writer thread commits
+    requests in groups (one transaction per database file, one savepoint per request) and
+    acknowledges each request only after its group has committed.
+    """
+
+    def __init__(self, socket_path, max_pending=MAX_PENDING, group_max=GROUP_MAX, group_wait_ms=GROUP_WAIT_MS):
+        self.socket_path = socket_path
+        self.requests = queue.Queue(maxsize=max_pending)
+        self.group_max = group_max
+        self.group_wait = group_wait_ms / 1000
+        self.connections = {}
+        self.stats = {"requests": 0, "groups": 0, "failed": 0, "replayed": 0}
+        self._listener = None
+        self._stopped = threading.Event()
+
+    def serve_forever(self):
+        self._bind()
+        threading.Thread(target=self._writer_loop, name="db-writer", daemon=True).start()
+        logger.info("DB writer listening on %s", self.socket_path)
+        try:
+            while not self._stopped.is_set():
+                try:
+                    client, _ = self._listener.accept()
+                except OSError:
+                    break
+                threading.Thread(target=self._read_client, args=(client,), daemon=True).start()
+        finally:
+            self.close()
+
+    def close(self):
+        self._stopped.set()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+    def _bind(self):
+        # A socket file left by a crashed daemon is removed; a live daemon is left alone
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                raise RuntimeError(f"A DB writer is already listening on {self.socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.socket_path)
+            finally:
+                probe.close()
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        self._listener.listen(128)
+
+    def _read_client(self, client):
+        send_lock = threading.Lock()
+
+        def reply(message):
+            with send_lock:
+                try:
+                    _send_frame(client, message)
+                except Exception as e:
+                    logger.warning("Could not acknowledge DB write %s: %s", message.get("id"), e)
+
+        try:
+            while True:
+                request = _recv_frame(client)
+                # Blocks while the queue is full, so a flood of writes slows its senders down
+                self.requests.put((request, reply))
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            client.close()
+
+    def _connection(self, path):
+        if path not in self.connections:
+            connection = sqlite3.connect(path, isolation_level=None, timeout=30, check_same_thread=False)
+            # WAL lets app processes keep reading while the daemon writes; FULL makes every
+            # acknowledged commit durable
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=FULL")
+            connection.execute(_REQUESTS_TABLE)
+            self.connections[path] = connection
+        return self.connections[path]
+
+    def _writer_loop(self):
+        while not self._stopped.is_set():
+            try:
+                group = [self.requests.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.group_wait
+            while len(group) < self.group_max:
+                try:
+                    group.append(self.requests.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            by_path = {}
+            for item in group:
+                by_path.setdefault(item[0].get("path"), []).append(item)
+            for path, items in by_path.items():
+                try:
+                    self._commit_group(path, items)
+                except Exception as e: # the writer thread must outlive any one group
+                    logger.exception("DB writer failed on a group for %s: %s", path, e)
+            self.stats["groups"] += 1
+            if self.stats["groups"] % 1000 == 0:
+                self._prune()
+
+    def _commit_group(self, path, items):
+        """Commits one file's share of a group; every request gets exactly one reply, even on errors."""
+        results = []
+        try:
+            connection = self._connection(path)
+            connection.execute("BEGIN IMMEDIATE")
+            for request, _ in items:
+                results.append(self._apply_once(connection, request))
+            connection.execute("COMMIT")
+        except Exception as e:
+            logger.error("DB writer group commit failed for %s: %s", path, e)
+            try:
+                self.connections[path].execute("ROLLBACK")
+            except (sqlite3.Error, KeyError):
+                pass
+            results = [{"ok": False, "error": f"{type(e).__name__}: {e}"} for _ in items]
+        # Acknowledged only now, after the COMMIT
+        for (request, reply), result in zip(items, results):
+            self.stats["requests"] += 1
+            self.stats["failed"] += not result["ok"]
+            reply({"id": request.get("id"), **result})
+
+    def _apply_once(self, connection, request):
+        done = connection.execute("SELECT result FROM writer_requests WHERE id = ?", (request["id"],)).fetchone()
+        if done:
+            self.stats["replayed"] += 1
+            return json.loads(done[0])
+        connection.execute("SAVEPOINT request")
+        try:
+            result = {"ok": True, "value": self._apply(connection, request)}
+            connection.execute(
+                "INSERT INTO writer_requests (id, result) VALUES (?, ?)", (request["id"], json.dumps(result))
+            )
+            connection.execute("RELEASE request")
+            return result
+        except Exception as e: # e.g. a bad statement, a rowcount mismatch or a malformed request
+            # Only this request is undone; the rest of the group still commits
+            connection.execute("ROLLBACK TO request")
+            connection.execute("RELEASE request")
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    @staticmethod
+    def _apply(connection, request):
+        """Runs one request and returns what the matching db.py function would return."""
+        cursor = connection.cursor()
+        try:
+            op = request["op"]
+            if op == "execute":
+                (query, params), = request["statements"]
+                cursor.execute(query, params)
+                return cursor.lastrowid if cursor.lastrowid is not None else cursor.rowcount
+            if op == "executemany":
+                query, params_seq = request["statements"][0]
+                cursor.executemany(query, params_seq)
+                expected = request.get("expected_rowcount")
+                if expected is not None and cursor.rowcount != expected:
+                    raise _RowcountMismatch(f"Batch affected {cursor.rowcount} rows, expected {expected}")
+                return cursor.rowcount
+            total = 0
+            for query, params in request["statements"]:
+                cursor.execute(query, params)
+                total += max(cursor.rowcount, 0)
+            return total
+        finally:
+            cursor.close()
+
+    def _prune(self):
+        for path, connection in self.connections.items():
+            try:
+                connection.execute("DELETE FROM writer_requests WHERE committed_at < datetime('now', '-1 day')")
+            except sqlite3.Error as e:
+                logger.warning("Could not prune writer_requests in %s: %s", path, e)
+
+
+# --- Client (used by db.py) -----------------------------------------------------
+
+_local = threading.local()
+_unavailable_until = 0.0
+
+
+def _client_socket(socket_path):
+    sockets = getattr(_local, "sockets", None)
+    if sockets is None:
+        sockets = _local.sockets = {}
+    if socket_path not in sockets:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(CLIENT_TIMEOUT)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            sock.close()
+            raise
+        sockets[socket_path] = sock
+    return sockets[socket_path]
+
+
+def _drop_socket(socket_path):
+    sock = getattr(_local, "sockets", {}).pop(socket_path, None)
+    if sock is not None:
+        sock.close()
+
+
+def send_write(op, path, statements, expected_rowcount=None, socket_path=None):
+    """
+    Sends one write ("execute", "executemany" or "transaction") to the daemon and waits
+    for its acknowledgement. Returns the same value as the db.py function, or -1.
+    Raises WriterUnavailable if the daemon can't be reached before anything was sent.
+    If the connection drops after sending, the same request id is resent (after a
+    daemon restart it is answered from writer_requests instead of running twice).
+    """
+    global _unavailable_until
+    socket_path = socket_path or SOCKET_PATH
+    if time.monotonic() < _unavailable_until:
+        raise WriterUnavailable("in cooldown after a failed connect")
+    request = {
+        "id": uuid.uuid4().hex,
+        "op": op,
+        "path": os.path.abspath(path),
+        "statements": [list(statement) for statement in statements],
+        "expected_rowcount": expected_rowcount,
+    }
+    try:
+        frame = _frame(request)
+    except (TypeError, ValueError) as e: # e.g. a Decimal parameter; a direct write would fail too
+        logger.error("Can't send %s on %s to the DB writer: %s", op, path, e)
+        return -1
+    sent = False
+    for attempt in range(CLIENT_RETRIES):
+        try:
+            sock = _client_socket(socket_path)
+        except OSError as e:
+            if not sent:
+                logger.warning("DB writer unavailable (%s); writing directly for %.0fs.", e, UNAVAILABLE_COOLDOWN)
+                _unavailable_until = time.monotonic() + UNAVAILABLE_COOLDOWN
+                raise WriterUnavailable(str(e)) from e
+            time.sleep(0.2 * 2 ** attempt)
+            continue
+        try:
+            sock.sendall(frame)
+            sent = True
+            reply = _recv_frame(sock)
+        except (OSError, ConnectionError) as e:
+            logger.warning("DB writer connection lost (attempt %d): %s", attempt + 1, e)
+            _drop_socket(socket_path)
+            time.sleep(0.2 * 2 ** attempt)
+            continue
+        if not reply["ok"]:
+            logger.error("DB writer rejected %s on %s: %s", op, path, reply.get("error"))
+            return -1
+        return reply["value"]
+    logger.error("DB writer did not acknowledge %s on %s after %d attempts", op, path, CLIENT_RETRIES)
+    return -1
+
+
+# --- Benchmark -------------------------------------------------------------------
+
+def _bench_direct(args):
+    path, writes = args
+    connection = sqlite3.connect(path, timeout=1)
+    failed = 0
+    for i in range(writes):
+        try:
+            connection.execute("INSERT INTO bench (pid, n) VALUES (?, ?)", (os.getpid(), i))
+            connection.commit()
+        except sqlite3.OperationalError: # "database is locked"
+            failed += 1
+    connection.close()
+    return failed
+
+
+def _bench_daemon(args):
+    path, writes, socket_path = args
+    return sum(
+        send_write("execute", path, [("INSERT INTO bench (pid, n) VALUES (?, ?)", (os.getpid(), i))], socket_path=socket_path) == -1
+        for i in range(writes)
+    )
+
+
+def benchmark(processes=8, writes=200):
+    """
+    Concurrent single-row commits from several processes, written directly (1 s busy
+    timeout, like a loaded app) and through an in-process daemon. Returns per-mode stats.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("direct", "daemon"):
+            path = os.path.join(tmp, f"{mode}.db")
+            connection = sqlite3.connect(path)
+            connection.execute("CREATE TABLE bench (id INTEGER PRIMARY KEY, pid INTEGER, n INTEGER)")
+            connection.close()
+            server = None
+            if mode == "daemon":
+                server = WriterServer(os.path.join(tmp, "writer.sock"))
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                while not os.path.exists(server.socket_path):
+                    time.sleep(0.01)
+                jobs = [(path, writes, server.socket_path)] * processes
+                worker = _bench_daemon
+            else:
+                jobs = [(path, writes)] * processes
+                worker = _bench_direct
+            started = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                failed = sum(pool.map(worker, jobs))
+            seconds = time.perf_counter() - started
+            rows = sqlite3.connect(path).execute("SELECT COUNT(*) FROM bench").fetchone()[0]
+            results[mode] = {"rows": rows, "failed": failed, "seconds": seconds, "per_second": rows / seconds}
+            if server is not None:
+                results[mode]["avg_group"] = server.stats["requests"] / max(server.stats["groups"], 1)
+                server.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Single-writer daemon for multi-process deployments")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="Run the writer daemon (set FITNESS_DB_WRITER_SOCKET for the app too)")
+    serve.add_argument("--socket", default=SOCKET_PATH or "db_writer.sock")
+    bench = subparsers.add_parser("benchmark", help="Compare direct concurrent writes with the daemon")
+    bench.add_argument("--processes", type=int, default=8)
+    bench.add_argument("--writes", type=int, default=200, help="Writes per process")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        WriterServer(args.socket).serve_forever()
+    elif args.command == "benchmark":
+        for mode, stats in benchmark(args.processes, args.writes).items():
+            extra = f", {stats['avg_group']:.1f} writes per commit" if "avg_group" in stats else ""
+            print(
+                f"{mode:>6}: {stats['rows']} rows, {stats['failed']} failed writes, "
+                f"{stats['per_second']:.0f} writes/s{extra}"
+            )
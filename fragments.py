@@ -0,0 +1,124 @@
+import argparse
+import csv
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+import streamlit as st
+from profiler import PROFILE_ENABLED, PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Sections wrapped with @fragment rerun on their own when their widgets change instead of
+# rerunning the whole app. FITNESS_FRAGMENTS=0 turns that off (for before/after timings).
+FRAGMENTS_ENABLED = os.getenv("FITNESS_FRAGMENTS", "1") == "1" and hasattr(st, "fragment")
+
+# With FITNESS_PROFILE=1 every full run and fragment rerun is appended here
+RERUN_LOG = os.path.join(PROFILE_DIR, "reruns.csv")
+
+# Thread-local state: set while a full app run is in progress on this script thread
+local_state = threading.local()
+_log_lock = threading.Lock()
+
+
+def _record(scope, name, seconds):
+    """Logs one run; scope is "app" for full reruns and "fragment" for fragment-only reruns."""
+    logger.debug("%s rerun of %s took %.1f ms", scope, name, seconds * 1000)
+    if not PROFILE_ENABLED:
+        return
+    with _log_lock:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        new_file = not os.path.exists(RERUN_LOG)
+        with open(RERUN_LOG, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(["timestamp", "fragments", "scope", "name", "ms"])
+            writer.writerow([
+                datetime.now().isoformat(timespec="seconds"), int(FRAGMENTS_ENABLED),
+                scope, name, f"{seconds * 1000:.2f}",
+            ])
+
+
+@contextmanager
+def app_run():
+    """
+    Times one full script run. Yields a dict; set its "page" key once the page is known.
+    Fragments rendered inside it count as part of the full run, not as their own reruns.
+    """
+    run = {"page": "-"}
+    local_state.full_run = True
+    started = time.perf_counter()
+    try:
+        yield run
+    finally:
+        local_state.full_run = False
+        _record("app", run["page"], time.perf_counter() - started)
+
+
+def fragment(name):
+    """
+    Decorator that makes a view function an independently rerunnable st.fragment
+    (when enabled) and records how long its standalone reruns take.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(local_state, "full_run", False):
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record("fragment", name, time.perf_counter() - started)
+        return st.fragment(wrapper) if FRAGMENTS_ENABLED else wrapper
+    return decorator
+
+
+def rerun_fragment():
+    """Reruns only the current fragment (or the whole app when fragments are disabled)."""
+    if FRAGMENTS_ENABLED:
+        st.rerun(scope="fragment")
+    st.rerun()
+
+
+def rerun_report(path=RERUN_LOG):
+    """
+    Summarizes the rerun log: count, median and p95 milliseconds per
+    (fragments enabled, scope, name). Returns a list of dicts.
+    """
+    samples = defaultdict(list)
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            samples[(row["fragments"] == "1", row["scope"], row["name"])].append(float(row["ms"]))
+    report = []
+    for (enabled, scope, name), values in sorted(samples.items()):
+        values.sort()
+        report.append({
+            "fragments": enabled, "scope": scope, "name": name, "runs": len(values),
+            "median_ms": statistics.median(values),
+            "p95_ms": values[min(int(len(values) * 0.95), len(values) - 1)],
+        })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rerun timings recorded with FITNESS_PROFILE=1")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report = subparsers.add_parser("report", help="Compare full-app reruns with fragment reruns")
+    report.add_argument("--log", default=RERUN_LOG, help="Rerun log to summarize")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        if not os.path.exists(args.log):
+            parser.error(f"{args.log} not found; run the app with FITNESS_PROFILE=1 first")
+        for row in rerun_report(args.log):
+            mode = "fragments on " if row["fragments"] else "fragments off"
+            print(
+                f"[{mode}] {row['scope']:<8} {row['name']:<28} {row['runs']:>5} runs  "
+                f"median {row['median_ms']:8.1f} ms  p95 {row['p95_ms']:8.1f} ms"
+            )
@@ -0,0 +1,172 @@
+import re
+from datetime import datetime, timedelta
+
+# Shared goal extractor used inline by the chat pages and by the chat-log backfill.
+# Kept free of Streamlit/DB imports so process-pool workers can import it cheaply.
+
+DEFAULT_GOAL_DAYS = 30
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+_WEIGHT_UNIT = r"(kgs?|kilograms?|kilos?|lbs?|pounds?)"
+_TIME_UNIT = r"(min|mins|minutes?|hrs?|hours?)"
+_PERIOD = r"(?:(?:per|a|an|every|each)\s+(day|week|month)|(daily|weekly|monthly))"
+_ACTIVITIES = (
+    r"run|running|jog|jogging|walk|walking|cycle|cycling|bike|biking|swim|swimming|"
+    r"yoga|pilates|hiit|cardio|exercise|exercising|work out|workout|working out|"
+    r"train|training|lift|lifting|stretch|stretching|dance|dancing|row|rowing|box|boxing"
+)
+
+# Patterns are compiled once at import instead of on every call
+WEIGHT_CHANGE_PATTERNS = [
+    ("weight_loss", re.compile(
+        rf"\b(?:lose|losing|drop|dropping|shed|shedding|cut|burn off)\s+(?:about\s+|around\s+|another\s+)?"
+        rf"{_NUMBER}\s*{_WEIGHT_UNIT}\b", re.IGNORECASE)),
+    ("weight_gain", re.compile(
+        rf"\b(?:gain|gaining|put on|putting on|bulk up by|add)\s+(?:about\s+|around\s+|another\s+)?"
+        rf"{_NUMBER}\s*{_WEIGHT_UNIT}\b", re.IGNORECASE)),
+]
+TARGET_WEIGHT_PATTERN = re.compile(
+    rf"\b(?:reach|get down to|get up to|get to|weigh|hit)\s+{_NUMBER}\s*{_WEIGHT_UNIT}\b", re.IGNORECASE
+)
+# Activity-first phrasing is tried first so its activity name wins over the generic pattern
+EXERCISE_PATTERNS = [
+    # "run for 30 minutes a day", "do yoga 20 mins every day"
+    re.compile(
+        rf"\b({_ACTIVITIES})\s+(?:for\s+)?(\d+(?:\.\d+)?)\s*{_TIME_UNIT}\s+{_PERIOD}\b",
+        re.IGNORECASE),
+    # "30 minutes of running per day", "1 hour a day", "45 mins cardio daily"
+    re.compile(
+        rf"\b(\d+(?:\.\d+)?)\s*{_TIME_UNIT}(?:\s+(?:of\s+)?([a-z][a-z\- ]{{0,30}}?))?\s+{_PERIOD}\b",
+        re.IGNORECASE),
+]
+TIMEFRAME_PATTERN = re.compile(
+    r"\b(?:in|within|over|for)\s+(?:the\s+next\s+)?(\d+|a|an|one|two|three|four|five|six|eight|ten|twelve)\s*"
+    r"(day|week|month)s?\b", re.IGNORECASE
+)
+
+_NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "eight": 8, "ten": 10, "twelve": 12,
+}
+_PERIOD_DAYS = {"day": 1, "daily": 1, "week": 7, "weekly": 7, "month": 30, "monthly": 30}
+_PERIOD_NAMES = {"daily": "day", "weekly": "week", "monthly": "month"}
+
+
+def _to_kg(value, unit):
+    """Normalizes a weight to kilograms."""
+    return value if unit.lower().startswith("k") else value * 0.453592
+
+
+def _to_minutes(value, unit):
+    """Normalizes a duration to minutes."""
+    return value * 60 if unit.lower().startswith("h") else value
+
+
+def _goal_days(message):
+    """Returns the goal period in days from phrases like "in 2 months" (default 30)."""
+    match = TIMEFRAME_PATTERN.search(message)
+    if not match:
+        return DEFAULT_GOAL_DAYS
+    amount = match.group(1).lower()
+    count = int(amount) if amount.isdigit() else _NUMBER_WORDS[amount]
+    return max(count * _PERIOD_DAYS[match.group(2).lower()], 1)
+
+
+def _overlaps(span, taken):
+    return any(span[0] < end and start < span[1] for start, end in taken)
+
+
+def extract_goals_from_message(user_message, current_weight=None):
+    """
+    Extracts goal suggestions from a chat message using precompiled regex patterns.
+    Recognizes weight changes ("lose 5 kg", "put on 10 lbs"), target weights
+    ("get down to 65 kg", needs `current_weight`) and exercise routines
+    ("30 minutes of running per day", "run for 1 hour every week").
+    Each goal is a dict with goal_type, target_value, duration_days and description;
+    exercise targets are total minutes over the goal period, matching goal tracking.
+    """
+    if not user_message:
+        return []
+
+    duration_days = _goal_days(user_message)
+    goals = []
+    taken = []
+
+    for goal_type, pattern in WEIGHT_CHANGE_PATTERNS:
+        for match in pattern.finditer(user_message):
+            taken.append(match.span())
+            goals.append({
+                "goal_type": goal_type,
+                "target_value": round(_to_kg(float(match.group(1)), match.group(2)), 1),
+                "duration_days": duration_days,
+                "description": f"Goal: {match.group(0).strip()} (from chat)",
+            })
+
+    if current_weight:
+        for match in TARGET_WEIGHT_PATTERN.finditer(user_message):
+            if _overlaps(match.span(), taken):
+                continue
+            difference = round(_to_kg(float(match.group(1)), match.group(2)) - float(current_weight), 1)
+            if difference == 0:
+                continue
+            taken.append(match.span())
+            goals.append({
+                "goal_type": "weight_gain" if difference > 0 else "weight_loss",
+                "target_value": abs(difference),
+                "duration_days": duration_days,
+                "description": f"Goal: {match.group(0).strip()} (from chat, currently {current_weight} kg)",
+            })
+
+    for index, pattern in enumerate(EXERCISE_PATTERNS):
+        for match in pattern.finditer(user_message):
+            if _overlaps(match.span(), taken):
+                continue
+            if index == 0:
+                activity, amount, unit, period, adverb = match.groups()
+            else:
+                amount, unit, activity, period, adverb = match.groups()
+            minutes = _to_minutes(float(amount), unit)
+            period = (period or adverb).lower()
+            period_days = _PERIOD_DAYS[period]
+            activity = (activity or "exercise").strip()
+            target = round(minutes * duration_days / period_days)
+            if target <= 0:
+                continue
+            taken.append(match.span())
+            goals.append({
+                "goal_type": "exercise",
+                "target_value": float(target),
+                "duration_days": duration_days,
+                "description": (
+                    f"Aim to do {activity} for {minutes:g} minutes per {_PERIOD_NAMES.get(period, period)} "
+                    f"({target} minutes over {duration_days} days)."
+                ),
+            })
+
+    return goals
+
+
+def extract_suggestions_from_rows(rows):
+    """
+    Process-pool worker for the chat-log backfill. Takes (chat_log_id, user_id,
+    user_message, timestamp, current_weight) tuples and returns goal_suggestions
+    rows (user_id, chat_log_id, goal_type, target_value, start_date, end_date, description).
+    """
+    suggestions = []
+    for chat_log_id, user_id, message, timestamp, current_weight in rows:
+        for goal in extract_goals_from_message(message, current_weight):
+            suggestions.append(suggestion_row(user_id, chat_log_id, goal, timestamp))
+    return suggestions
+
+
+def suggestion_row(user_id, chat_log_id, goal, timestamp=None):
+    """Builds a goal_suggestions row; the goal period starts on the day of the message."""
+    try:
+        start = datetime.fromisoformat(str(timestamp)[:10]).date() if timestamp else datetime.today().date()
+    except ValueError:
+        start = datetime.today().date()
+    end = start + timedelta(days=goal["duration_days"])
+    return (
+        user_id, chat_log_id, goal["goal_type"], goal["target_value"],
+        start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), goal["description"],
+    )
@@ -0,0 +1,105 @@
+import argparse
+import logging
+from datetime import datetime
+from db import execute_db, execute_transaction, shard_indexes, AUTO_GOAL_TYPES, RECOMPUTE_WEIGHT_PROGRESS
+
+logger = logging.getLogger(__name__)
+
+# Goal progress is normally maintained incrementally by the triggers created in
+# db.init_db(); the statements below rebuild it from history for backfills.
+
+_RECOMPUTE_EXERCISE = """
+    UPDATE goals SET version = version + 1, current_value = COALESCE((
+        SELECT SUM(w.duration) FROM workouts w
+        WHERE w.user_id = goals.user_id AND w.day BETWEEN goals.start_day AND goals.end_day
+    ), 0)
+    WHERE goal_type = 'exercise' AND status = 'active' {goal_filter}
+"""
+
+_RECOMPUTE_COMPLETED = f"""
+    UPDATE goals SET status = 'completed', version = version + 1
+    WHERE status = 'active' AND goal_type IN {AUTO_GOAL_TYPES}
+      AND target_value > 0 AND current_value >= target_value {{goal_filter}}
+"""
+
+
+def log_weigh_in(user_id, weight, date=None):
+    """
+    Records a body-weight entry. Weight-goal progress is updated by the
+    weigh-in trigger, so callers don't need to touch the goals table.
+    """
+    date = date or datetime.today()
+    return execute_db(
+        "INSERT INTO weigh_ins (user_id, date, weight) VALUES (?, ?, ?)",
+        (user_id, date.strftime('%Y-%m-%d'), weight),
+        shard_key=user_id
+    )
+
+
+def goal_insert_statement(user_id, goal_type, target_value, start_date, end_date):
+    """
+    (query, params) adding an active goal with no progress yet. The query is an
+    INSERT ... SELECT, so a caller can append a WHERE clause to make it conditional.
+    """
+    return (
+        "INSERT INTO goals (user_id, goal_type, target_value, current_value, start_date, end_date, status) "
+        "SELECT ?, ?, ?, 0.0, ?, ?, 'active'",
+        (user_id, goal_type, target_value, start_date, end_date)
+    )
+
+
+def create_goal(user_id, goal_type, target_value, start_date, end_date):
+    """
+    Adds an active goal (dates as YYYY-MM-DD) and counts history already inside its
+    period. Returns the new goal id, or -1 on failure.
+    """
+    result = execute_db(*goal_insert_statement(user_id, goal_type, target_value, start_date, end_date), shard_key=user_id)
+    if result != -1:
+        recompute_goal_progress(user_id, goal_id=result)
+    return result
+
+
+def recompute_goal_progress(user_id=None, goal_id=None):
+    """
+    Rebuilds current_value of active auto-tracked goals (all, one user's, or a
+    single goal of that user) from the full workout and weigh-in history, then marks
+    goals that reached their target as completed. Runs in one transaction per shard.
+    Returns the number of affected rows, or -1 on failure.
+    """
+    conditions, params = [], []
+    if user_id is not None:
+        conditions.append("AND user_id = ?")
+        params.append(user_id)
+    if goal_id is not None:
+        conditions.append("AND id = ?")
+        params.append(goal_id)
+    goal_filter, params = " ".join(conditions), tuple(params)
+
+    statements = [
+        (_RECOMPUTE_EXERCISE.format(goal_filter=goal_filter), params),
+        (RECOMPUTE_WEIGHT_PROGRESS.format(goal_filter=goal_filter), params),
+        (_RECOMPUTE_COMPLETED.format(goal_filter=goal_filter), params),
+    ]
+    if user_id is not None:
+        result = execute_transaction(statements, shard_key=user_id)
+    else:
+        # Backfill across every shard (just DB_PATH when sharding is off)
+        results = [execute_transaction(statements, shard=shard) for shard in shard_indexes()]
+        result = -1 if -1 in results else sum(results)
+    logger.info("Recomputed goal progress (user: %s, goal: %s, rows: %s)", user_id, goal_id, result)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Goal progress maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    recompute = subparsers.add_parser("recompute", help="Rebuild goal progress from workout and weigh-in history")
+    recompute.add_argument("--user-id", type=int, default=None, help="Only recompute this user's goals")
+    args = parser.parse_args()
+
+    if args.command == "recompute":
+        rows = recompute_goal_progress(args.user_id)
+        if rows == -1:
+            print("❌ Goal recompute failed, see log for details.")
+        else:
+            print(f"✅ Recomputed goal progress ({rows} rows updated).")
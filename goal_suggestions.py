@@ -0,0 +1,180 @@
+import argparse
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from db import (query_db, execute_db, execute_transaction, shard_job, get_checkpoint,
+                checkpoint_statement, shard_indexes)
+from goal_extraction import extract_goals_from_message, extract_suggestions_from_rows, suggestion_row
+from goal_progress import recompute_goal_progress, goal_insert_statement
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_JOB = "goal_suggestion_backfill"
+
+_INSERT_SUGGESTION = (
+    "INSERT OR IGNORE INTO goal_suggestions "
+    "(user_id, chat_log_id, goal_type, target_value, start_date, end_date, description) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def record_goal_suggestions(user_id, chat_log_id, user_message, current_weight=None):
+    """
+    Runs the goal extractor on a new chat message and stores any goals found as
+    pending suggestions. Returns the extracted goals (empty list if none).
+    """
+    goals = extract_goals_from_message(user_message, current_weight)
+    if goals and chat_log_id not in (None, -1):
+        execute_transaction([
+            (_INSERT_SUGGESTION, suggestion_row(user_id, chat_log_id, goal)) for goal in goals
+        ], shard_key=user_id)
+    return goals
+
+
+def get_pending_suggestions(user_id):
+    """Fetches the user's goal suggestions that haven't been accepted or dismissed."""
+    return query_db(
+        "SELECT id, goal_type, target_value, start_date, end_date, description FROM goal_suggestions "
+        "WHERE user_id = ? AND status = 'pending' ORDER BY id DESC",
+        (user_id,),
+        shard_key=user_id
+    )
+
+
+def accept_suggestion(user_id, suggestion_id):
+    """Turns a suggestion into an active goal. Returns the new goal id, or -1 on failure."""
+    suggestion = query_db(
+        "SELECT goal_type, target_value, start_date, end_date FROM goal_suggestions "
+        "WHERE id = ? AND user_id = ? AND status = 'pending'",
+        (suggestion_id, user_id),
+        fetchone=True,
+        shard_key=user_id
+    )
+    if not suggestion:
+        return -1
+
+    # Suggestions from old chats would already be over; start those from today instead
+    start_date, end_date = suggestion['start_date'], suggestion['end_date']
+    today = datetime.today().strftime('%Y-%m-%d')
+    if end_date < today:
+        span = datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')
+        start_date, end_date = today, (datetime.today() + span).strftime('%Y-%m-%d')
+
+    # One transaction: the goal is only added if this call is the one that accepted the suggestion
+    insert_query, insert_params = goal_insert_statement(
+        user_id, suggestion['goal_type'], suggestion['target_value'], start_date, end_date
+    )
+    result = execute_transaction([
+        (
+            "UPDATE goal_suggestions SET status = 'accepted' WHERE id = ? AND user_id = ? AND status = 'pending'",
+            (suggestion_id, user_id)
+        ),
+        (insert_query + " WHERE changes() = 1", insert_params),
+    ], shard_key=user_id)
+    if result != 2:
+        return -1
+    goal = query_db(
+        "SELECT id FROM goals WHERE user_id = ? AND goal_type = ? AND target_value = ? AND start_date = ? AND end_date = ? "
+        "ORDER BY id DESC LIMIT 1",
+        (user_id, suggestion['goal_type'], suggestion['target_value'], start_date, end_date),
+        fetchone=True,
+        shard_key=user_id
+    )
+    if goal is None:
+        return -1
+    recompute_goal_progress(user_id, goal_id=goal['id'])
+    return goal['id']
+
+
+def dismiss_suggestion(user_id, suggestion_id):
+    """Hides a suggestion from the user."""
+    return execute_db(
+        "UPDATE goal_suggestions SET status = 'dismissed' WHERE id = ? AND user_id = ?",
+        (suggestion_id, user_id),
+        shard_key=user_id
+    )
+
+
+def _user_weights(user_ids):
+    """Current weights for the given users, read from the users table."""
+    user_ids = list(user_ids)
+    placeholders = ",".join("?" * len(user_ids))
+    rows = query_db(f"SELECT id, weight FROM users WHERE id IN ({placeholders})", user_ids)
+    return {row["id"]: row["weight"] for row in rows}
+
+
+def _chat_log_batches(after_id, batch_size, shard=None):
+    """Yields chat-log rows in id order using keyset pagination, starting after `after_id`."""
+    while True:
+        rows = query_db(
+            "SELECT id, user_id, user_message, timestamp FROM chat_logs WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, batch_size),
+            shard=shard
+        )
+        if not rows:
+            return
+        # Users live in the main database, so weights are looked up separately instead of joined
+        weights = _user_weights({row["user_id"] for row in rows})
+        batch = [tuple(row) + (weights.get(row["user_id"]),) for row in rows]
+        yield batch
+        after_id = batch[-1][0]
+
+
+def backfill_goal_suggestions(workers=None, batch_size=2000, reset=False):
+    """
+    Scans all of chat_logs for goals across a process pool, one shard at a time.
+    Batches are extracted in parallel but committed in order, each together with its
+    checkpoint, so an interrupted run resumes after the last committed chat log.
+    Returns (messages_scanned, suggestions_found).
+    """
+    workers = workers or os.cpu_count() or 1
+    scanned = found = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for shard in shard_indexes():
+            job = shard_job(BACKFILL_JOB, shard)
+            if reset:
+                execute_transaction([checkpoint_statement(job, 0)], shard=shard)
+            start_id = get_checkpoint(job, shard=shard)
+            logger.info("Goal suggestion backfill (%s) starting after chat log %d with %d workers", job, start_id, workers)
+
+            pending = deque()
+            for batch in _chat_log_batches(start_id, batch_size, shard):
+                pending.append((batch, pool.submit(extract_suggestions_from_rows, batch)))
+                # Keep a bounded number of batches in flight so memory stays flat
+                while len(pending) >= workers * 2:
+                    scanned, found = _commit_batch(pending.popleft(), scanned, found, shard)
+            while pending:
+                scanned, found = _commit_batch(pending.popleft(), scanned, found, shard)
+
+    elapsed = time.perf_counter() - started
+    logger.info("Goal suggestion backfill scanned %d messages, found %d goals in %.1fs", scanned, found, elapsed)
+    return scanned, found
+
+
+def _commit_batch(item, scanned, found, shard=None):
+    """Writes one batch's suggestions and advances the checkpoint in a single transaction."""
+    batch, future = item
+    suggestions = future.result()
+    statements = [(_INSERT_SUGGESTION, row) for row in suggestions]
+    statements.append(checkpoint_statement(shard_job(BACKFILL_JOB, shard), batch[-1][0]))
+    if execute_transaction(statements, shard=shard) == -1:
+        raise RuntimeError(f"Failed to write goal suggestions for chat logs up to {batch[-1][0]}")
+    return scanned + len(batch), found + len(suggestions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Goal suggestion maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill = subparsers.add_parser("backfill", help="Extract goal suggestions from historical chat logs")
+    backfill.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    backfill.add_argument("--batch-size", type=int, default=2000, help="Chat logs per batch")
+    backfill.add_argument("--reset", action="store_true", help="Ignore the checkpoint and rescan everything")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        messages, goals = backfill_goal_suggestions(args.workers, args.batch_size, args.reset)
+        print(f"✅ Scanned {messages} chat messages, found {goals} goal suggestions.")
@@ -1,62 +1,27 @@
 import streamlit as st
-import re # Import the re module for regular expressions
+import uuid
 from datetime import datetime, timedelta
-from db import query_db, execute_db
-from groq import Groq # Import Groq client if goal extraction logic is here
+from db import query_db, execute_db, executemany_db, data_version
+from goal_progress import create_goal
+from goal_extraction import extract_goals_from_message
+from goal_suggestions import get_pending_suggestions, accept_suggestion, dismiss_suggestion
+from fragments import fragment, rerun_fragment
 
-# Initialize the Groq client using the API key from environment variables
-# Note: This client initialization might be better placed where it's actually used
-# or handled differently if the API key loading isn't working elsewhere.
-# For now, keeping it here as it was.
-client = Groq()
-
-def extract_goals_from_message(user_message):
-    """
-    Attempts to extract goal information from the user's message using regex.
-    This is a basic example, can be enhanced with NLP or handled in chatbot.py.
-    """
-    # Example patterns (case-insensitive search)
-    patterns = {
-        "weight_loss": r"lose\s+(\d+(?:\.\d+)?)\s*(kg|kilograms|lbs|pounds)",
-        "weight_gain": r"gain\s+(\d+(?:\.\d+)?)\s*(kg|kilograms|lbs|pounds)",
-        "exercise": r"(\d+)\s*(?:minute|minutes|hour|hours)\s+(.*?)\s+per\s+(day|week|month)",
-        # Add more patterns as needed
-    }
-
-    goals = []
-    for goal_type, pattern in patterns.items():
-        matches = re.findall(pattern, user_message, re.IGNORECASE)
-        for match in matches:
-            if goal_type.startswith("weight_"):
-                value = float(match[0])
-                unit = match[1]
-                # Normalize unit to kg for target_value (adjust logic as needed)
-                normalized_value = value if unit.lower() in ['kg', 'kilograms'] else value * 0.453592 # lbs to kg
-                goals.append({
-                    "goal_type": goal_type,
-                    "target_value": normalized_value,
-                    "description": f"Goal: {user_message}"
-                })
-            elif goal_type == "exercise":
-                duration = int(match[0])
-                exercise = match[1]
-                frequency = match[2]
-                # Example: Store as a text description or define a specific type
-                goals.append({
-                    "goal_type": "Exercise",
-                    "target_value": duration,
-                    "description": f"Aim to do {exercise} for {duration} minutes per {frequency}. Extracted from: {user_message}"
-                })
-
-    return goals
+# Statuses a goal can be moved between in the goal editor
+GOAL_STATUSES = ["active", "completed", "on hold", "abandoned"]
 
+@fragment("Goals / set goal")
 def set_goal(user_id):
     """Displays the interface for setting a new goal."""
     st.subheader("🎯 Set a New Goal")
 
     # Option 1: User selects goal type and inputs details
     goal_type = st.selectbox("Goal Type", ["Weight Loss", "Weight Gain", "Exercise", "Other"])
-    target_value = st.number_input("Target Value", min_value=0.0, value=0.0, step=0.1)
+    target_value = st.number_input(
+        "Target Value", min_value=0.0, value=0.0, step=0.1,
+        help="Weight Loss/Gain: kg to lose or gain. Exercise: total workout minutes in the goal period. "
+             "These goals update automatically as you log workouts and weight."
+    )
     start_date = st.date_input("Start Date", value=datetime.today())
     end_date = st.date_input("End Date", value=datetime.today() + timedelta(days=30))
 
@@ -68,13 +33,13 @@ def set_goal(user_id):
             internal_goal_type = goal_type.lower().replace(" ", "_")
 
             # Insert the new goal into the database
-            result = execute_db(
-                "INSERT INTO goals (user_id, goal_type, target_value, current_value, start_date, end_date, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (user_id, internal_goal_type, target_value, 0.0, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'), 'active') # Default current_value to 0
+            result = create_goal(
+                user_id, internal_goal_type, target_value, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
             )
             if result != -1:
+                reset_goal_snapshot(user_id) # Show the new goal in the editor
                 st.success(f"Goal '{goal_type}' set successfully!")
-                st.rerun() # Refresh the view to show the new goal
+                st.rerun() # Full rerun: the goal list is a separate fragment
             else:
                 st.error("Failed to set goal. Please try again.")
 
@@ -97,117 +62,187 @@ def set_goal(user_id):
     #         st.warning("Please enter a goal description.")
 
 
-def view_goals(user_id):
-    """Displays the user's current goals and allows updating status."""
-    st.subheader("📋 Your Goals")
-
-    # Fetch goals from the database
-    goals = query_db(
-        "SELECT id, goal_type, target_value, current_value, start_date, end_date, status FROM goals WHERE user_id = ? ORDER BY start_date DESC",
-        (user_id,)
-    )
-
-    if not goals:
-        st.info("You haven't set any goals yet. Use the 'Set a New Goal' section above.")
+@fragment("Goals / suggestions")
+def show_goal_suggestions(user_id):
+    """Lists goals spotted in the user's chats and lets them add or dismiss each one."""
+    suggestions = get_pending_suggestions(user_id)
+    if not suggestions:
         return
 
-    # Display each goal with update options
-    for goal in goals:
-        col1, col2, col3 = st.columns([2, 1, 1]) # Adjust column ratios as needed
+    st.subheader("💡 Suggested Goals From Your Chats")
+    for suggestion in suggestions:
+        col1, col2, col3 = st.columns([4, 1, 1])
         with col1:
-            st.write(f"**{goal['goal_type'].title()}**")
-            st.progress(min(goal['current_value'] / goal['target_value'], 1.0)) # Show progress bar
-            st.caption(f"Progress: {goal['current_value']:.1f} / {goal['target_value']:.1f}")
+            st.write(f"**{suggestion['goal_type'].replace('_', ' ').title()}** — target {suggestion['target_value']:g}")
+            st.caption(suggestion['description'])
         with col2:
-            # Update current value (example: for weight loss/gain goals)
-            new_current_value = st.number_input(
-                f"Update Current Value (ID: {goal['id']})", # Label includes ID for clarity
-                value=goal['current_value'],
-                min_value=0.0,
-                step=0.1,
-                key=f"current_val_{goal['id']}" # Unique key for Streamlit widget state
-            )
-            if st.button(f"Update Value", key=f"update_btn_{goal['id']}"):
-                 execute_db(
-                    "UPDATE goals SET current_value = ? WHERE id = ?",
-                    (new_current_value, goal['id'])
-                )
-                 st.rerun() # Refresh the view after update
+            if st.button("➕ Add", key=f"accept_suggestion_{suggestion['id']}"):
+                if accept_suggestion(user_id, suggestion['id']) != -1:
+                    reset_goal_snapshot(user_id)
+                    st.rerun() # Full rerun so the goal list shows the new goal
+                else:
+                    st.error("Failed to add goal. Please try again.")
         with col3:
-            # Update status (active, completed, etc.)
-            new_status = st.selectbox(
-                f"Status (ID: {goal['id']})",
-                options=["active", "completed", "on hold", "abandoned"],
-                index=["active", "completed", "on hold", "abandoned"].index(goal['status']),
-                key=f"status_{goal['id']}" # Unique key for Streamlit widget state
-            )
-            if st.button(f"Update Status", key=f"status_btn_{goal['id']}"):
-                execute_db(
-                    "UPDATE goals SET status = ? WHERE id = ?",
-                    (new_status, goal['id'])
-                )
-                st.rerun() # Refresh the view after update
-
-        # Display dates
-        st.caption(f"Start: {goal['start_date']} | End: {goal['end_date']} | Status: {goal['status']}")
-        st.divider() # Add a line between goals
+            if st.button("✖ Dismiss", key=f"dismiss_suggestion_{suggestion['id']}"):
+                dismiss_suggestion(user_id, suggestion['id'])
+                rerun_fragment()
+    st.divider()
+
+
+def _load_goal_snapshot(user_id, refresh=False):
+    """
+    Returns the user's goals as they were when editing started. The snapshot (and its
+    row versions) is kept in session state so saving can detect concurrent changes.
+    It is reloaded whenever the user's data version moves, e.g. after a logged workout
+    or weigh-in updated goal progress through the triggers.
+    """
+    key = f"goal_snapshot_{user_id}"
+    snapshot = st.session_state.get(key)
+    version = data_version(user_id)
+    if refresh or snapshot is None or snapshot["data_version"] != version:
+        goals = [dict(g) for g in query_db(
+            "SELECT id, goal_type, target_value, current_value, start_date, end_date, status, version "
+            "FROM goals WHERE user_id = ? ORDER BY start_date DESC",
+            (user_id,),
+            shard_key=user_id
+        )]
+        if refresh or snapshot is None or snapshot["goals"] != goals:
+            editor_key = f"goal_editor_{user_id}_{uuid.uuid4().hex[:8]}" # New key discards stale edits
+        else:
+            editor_key = snapshot["editor_key"] # Nothing changed: keep the edits in progress
+        st.session_state[key] = snapshot = {"editor_key": editor_key, "goals": goals, "data_version": version}
+    return snapshot
+
+
+def reset_goal_snapshot(user_id):
+    """Forces the goal editor to reload from the database on the next render."""
+    st.session_state.pop(f"goal_snapshot_{user_id}", None)
+
+
+def _edited_number(value, fallback):
+    """Returns an edited numeric cell as float, or the original value if it was cleared."""
+    if value is None or value != value: # Cleared cells come back as None/NaN
+        return fallback
+    return float(value)
+
+
+def save_goal_edits(user_id, original_goals, edited_rows):
+    """
+    Applies all edited goals in one executemany transaction. Each UPDATE only matches
+    the version the user started from, so a goal changed by another session (or by
+    automatic progress tracking) in the meantime is not overwritten.
+    Returns (rows_saved, conflicting_goal_ids); rows_saved is -1 if nothing was saved.
+    """
+    if hasattr(edited_rows, "to_dict"): # data_editor may hand back a DataFrame
+        edited_rows = edited_rows.to_dict("records")
+
+    originals = {g['id']: g for g in original_goals}
+    updates = []
+    for row in edited_rows:
+        goal = originals.get(int(row["ID"]))
+        if goal is None:
+            continue
+        target = _edited_number(row["Target"], goal['target_value'])
+        current = _edited_number(row["Current"], goal['current_value'])
+        status = row["Status"] or goal['status']
+        if (target, current, status) != (goal['target_value'], goal['current_value'], goal['status']):
+            updates.append((target, current, status, goal['id'], user_id, goal['version']))
+
+    if not updates:
+        return 0, []
+
+    result = executemany_db(
+        "UPDATE goals SET target_value = ?, current_value = ?, status = ?, version = version + 1 "
+        "WHERE id = ? AND user_id = ? AND version = ?",
+        updates,
+        expected_rowcount=len(updates),
+        shard_key=user_id
+    )
+    if result != -1:
+        return result, []
+
+    # Work out which goals were changed underneath us
+    goal_ids = [u[3] for u in updates]
+    placeholders = ", ".join("?" * len(goal_ids))
+    current_versions = {
+        r['id']: r['version']
+        for r in query_db(f"SELECT id, version FROM goals WHERE id IN ({placeholders})", goal_ids, shard_key=user_id)
+    }
+    conflicts = [u[3] for u in updates if current_versions.get(u[3]) != u[5]]
+    return -1, conflicts
+
+
+@fragment("Goals / editor")
 def view_goals(user_id):
-    """Displays the user's current goals and allows updating status."""
+    """Displays the user's goals in a table; edits are applied together with one save."""
     st.subheader("📋 Your Goals")
 
-    # Fetch goals from the database
-    goals = query_db(
-        "SELECT id, goal_type, target_value, current_value, start_date, end_date, status FROM goals WHERE user_id = ? ORDER BY start_date DESC",
-        (user_id,)
-    )
+    flash = st.session_state.pop(f"goal_flash_{user_id}", None)
+    if flash:
+        st.success(flash)
+
+    snapshot = _load_goal_snapshot(user_id)
+    goals = snapshot["goals"]
 
     if not goals:
         st.info("You haven't set any goals yet. Use the 'Set a New Goal' section above.")
         return
 
-    # Display each goal with update options
+    rows = []
     for goal in goals:
-        col1, col2, col3 = st.columns([2, 1, 1]) # Adjust column ratios as needed
+        if goal['target_value']:
+            progress = min(max(goal['current_value'] / goal['target_value'], 0.0), 1.0) * 100
+        else:
+            progress = 0.0  # If target is 0, progress is 0%
+        rows.append({
+            "ID": goal['id'],
+            "Goal": goal['goal_type'].replace('_', ' ').title(),
+            "Target": goal['target_value'],
+            "Current": goal['current_value'],
+            "Progress": progress,
+            "Status": goal['status'] if goal['status'] in GOAL_STATUSES else "active",
+            "Period": f"{goal['start_date']} → {goal['end_date']}",
+        })
+
+    # Edits stay in the browser until "Save Changes" submits the form
+    with st.form(f"goal_batch_form_{user_id}"):
+        edited_rows = st.data_editor(
+            rows,
+            key=snapshot["editor_key"],
+            hide_index=True,
+            use_container_width=True,
+            num_rows="fixed",
+            disabled=["ID", "Goal", "Progress", "Period"],
+            column_config={
+                "ID": st.column_config.NumberColumn("ID", width="small"),
+                "Target": st.column_config.NumberColumn("Target", min_value=0.0, step=0.1, format="%.1f"),
+                "Current": st.column_config.NumberColumn("Current", step=0.1, format="%.1f"),
+                "Progress": st.column_config.ProgressColumn("Progress", min_value=0, max_value=100, format="%.0f%%"),
+                "Status": st.column_config.SelectboxColumn("Status", options=GOAL_STATUSES, required=True),
+            },
+        )
+        col1, col2 = st.columns(2)
         with col1:
-            st.write(f"**{goal['goal_type'].title()}**")
-            # --- FIX: Check for zero target value before division ---
-            if goal['target_value'] != 0:
-                progress_value = min(goal['current_value'] / goal['target_value'], 1.0)
-            else:
-                progress_value = 0.0  # If target is 0, progress is 0%
-            # ---
-            st.progress(progress_value) # Show progress bar
-            st.caption(f"Progress: {goal['current_value']:.1f} / {goal['target_value']:.1f}")
+            submitted = st.form_submit_button("💾 Save Changes", type="primary", use_container_width=True)
         with col2:
-            # Update current value (example: for weight loss/gain goals)
-            new_current_value = st.number_input(
-                f"Update Current Value (ID: {goal['id']})", # Label includes ID for clarity
-                value=goal['current_value'],
-                min_value=0.0,
-                step=0.1,
-                key=f"current_val_{goal['id']}" # Unique key for Streamlit widget state
+            reload_clicked = st.form_submit_button("🔄 Discard & Reload", use_container_width=True)
+
+    if reload_clicked:
+        reset_goal_snapshot(user_id)
+        rerun_fragment()
+
+    if submitted:
+        saved, conflicts = save_goal_edits(user_id, goals, edited_rows)
+        if saved == 0:
+            st.info("No changes to save.")
+        elif saved > 0:
+            st.session_state[f"goal_flash_{user_id}"] = f"✅ Saved {saved} goal update(s)."
+            reset_goal_snapshot(user_id)
+            rerun_fragment() # One rerun of the editor for the whole batch
+        elif conflicts:
+            st.error(
+                f"Goal(s) {', '.join(map(str, conflicts))} were changed elsewhere since you opened them. "
+                "Nothing was saved; click 'Discard & Reload' to see the latest values."
             )
-            if st.button(f"Update Value", key=f"update_btn_{goal['id']}"):
-                 execute_db(
-                    "UPDATE goals SET current_value = ? WHERE id = ?",
-                    (new_current_value, goal['id'])
-                )
-                 st.rerun() # Refresh the view after update
-        with col3:
-            # Update status (active, completed, etc.)
-            new_status = st.selectbox(
-                f"Status (ID: {goal['id']})",
-                options=["active", "completed", "on hold", "abandoned"],
-                index=["active", "completed", "on hold", "abandoned"].index(goal['status']),
-                key=f"status_{goal['id']}" # Unique key for Streamlit widget state
-            )
-            if st.button(f"Update Status", key=f"status_btn_{goal['id']}"):
-                execute_db(
-                    "UPDATE goals SET status = ? WHERE id = ?",
-                    (new_status, goal['id'])
-                )
-                st.rerun() # Refresh the view after update
-
-        # Display dates
-        st.caption(f"Start: {goal['start_date']} | End: {goal['end_date']} | Status: {goal['status']}")
-        st.divider() # Add a line between goals
\ No newline at end of file
+        else:
+            st.error("Failed to save goal changes. Please try again.")
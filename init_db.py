@@ -1,72 +1,10 @@
 # init_db.py
-import sqlite3
-
-DB_PATH = "Fitness Assistant.db"
+from db import DB_PATH, init_db
 
 def init_database():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # Enable foreign key support
-    cursor.execute("PRAGMA foreign_keys = ON;")
-
-    # Create users table
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        email TEXT UNIQUE,
-        password TEXT,
-        age INTEGER,
-        gender TEXT,
-        height REAL,
-        weight REAL
-    );
-    """)
-
-    # Create workouts table
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS workouts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        date DATE,
-        exercise TEXT,
-        duration INTEGER,
-        calories_burned REAL,
-        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-    );
-    """)
-
-    # Create goals table
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS goals (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        goal_type TEXT,
-        target_value REAL,
-        current_value REAL,
-        start_date DATE,
-        end_date DATE,
-        status TEXT,
-        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-    );
-    """)
-
-    # Create chat_logs table
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS chat_logs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        user_message TEXT,
-        bot_reply TEXT,
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-    );
-    """)
-
-    conn.commit()
-    conn.close()
-    print("✅ Database initialized successfully!")
+    # db.init_db() owns the schema (tables, indexes and goal-progress triggers)
+    init_db()
+    print(f"✅ Database initialized successfully! ({DB_PATH})")
 
 if __name__ == "__main__":
-    init_database()
\ No newline at end of file
+    init_database()
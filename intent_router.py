@@ -0,0 +1,366 @@
+import argparse
+import logging
+import re
+import time
+from calendar import monthrange
+from datetime import date, timedelta
+from db import query_db, execute_db, to_day
+from body_metrics import ACTIVITY_FACTORS, calculate_bmi, get_bmi_category, calculate_bmr, calculate_tdee
+from calorie_estimation import weight_on
+
+logger = logging.getLogger(__name__)
+
+# Chat messages that only ask for something the app can compute exactly (BMI, calorie
+# needs, recent workouts, goal progress) are answered here in milliseconds; anything
+# else, including these topics combined with a request for advice, goes to the LLM.
+MAX_WORDS = 25
+
+# Checked in this order; a message may match several (e.g. "my bmi and bmr"). Every pattern
+# asks about the user's own numbers ("my bmi", "what did I do"); the topic alone is not enough.
+# They only apply to questions and commands (_QUESTION), not statements ("my bmi is 30").
+INTENT_PATTERNS = {
+    "calorie_needs": re.compile(
+        r"\b(my (tdee|maintenance calories|daily calories|calorie (target|goal|budget|needs?|intake))"
+        r"|how (many|much) (calories|kcal) ((should|do|can|must) )?i (eat|consume|have|take|need)( to (eat|consume|have))?"
+        r"( (a|per|each) day| daily| to (lose|gain|maintain|cut|bulk)( (some |my )?weight)?| for (weight|fat) loss)?$)"
+    ),
+    "bmr": re.compile(
+        r"\b(my (bmi and )?(bmr|basal metabolic rate|resting metabolic rate)|(calories|kcal) (do )?i burn at rest)\b"
+    ),
+    "bmi": re.compile(r"\b(my (bmr and )?(current )?(bmi|body mass index)|(bmi|body mass index) for me)\b"),
+    "last_workout": re.compile(
+        r"\b((when|what) (was|is) my (last|latest|most recent|previous) (workout|session|training|exercise)"
+        r"|when did i last (work ?out|exercise|train)|when did i (work ?out|exercise|train) last)\b"
+    ),
+    # Also needs a time span (_TIME_SPAN): "what did I do" alone is as likely about technique as about a log
+    "activity": re.compile(
+        r"\b(what (did|have) i (do|done)|how (many|much) (workouts?|sessions|minutes|exercise|training|calories|kcal) (did|have) i"
+        r"|(calories|kcal) (did|have) i burn(ed|t)?|how active (was|have|am) i"
+        r"|my (workouts?|activity|training|exercise)|(show|list|summari[sz]e|recap) my (workouts?|activity|week|training))\b"
+    ),
+    "goal_progress": re.compile(
+        r"\b(my goal progress|progress (on|towards?|with|of) my goals?|my goals?('s)? (status|progress)"
+        r"|how (am i doing|close am i|far am i) (on|with|to|from|toward|towards) my goals?"
+        r"|what are my (current |active )?goals)\b"
+    ),
+}
+
+# Asking for advice, explanation, plans or a judgement ("is my bmi healthy?") means the LLM should answer
+_ADVICE = re.compile(
+    r"\b(why|how (can|do|could|should) i|improve|plan|program|routine|tips?|advice|recommend\w*|suggest\w*"
+    r"|explain|meals?|foods?|diet|what should i|healthy|unhealthy|normal|good|bad|okay|too (high|low|much|little)"
+    r"|wrong|mistakes?|form|technique)\b"
+)
+# So does asking what something is or how it is worked out ("what is bmr", "bmi formula")
+_DEFINITION = re.compile(
+    r"\b(what( is|'s| are| does) (?!my\b|i\b)|whats (?!my\b)|formula|calculator|define|definition|meaning|means?"
+    r"|stand for|how (is|are|do you|does one|to) (calculate|compute|work out|measure))"
+)
+_SELF = re.compile(r"\b(i|me|my|i'm|i've)\b")
+_METRIC = r"(bmi|body mass index|bmr|basal metabolic rate|resting metabolic rate|tdee|maintenance calories)"
+# Starts like a question or a command (after a greeting), or is just the thing asked for ("my bmi?")
+_QUESTION = re.compile(
+    r"^((hey|hi|hello|nova|ok|okay|so|and|please)[ ,]+)*"
+    r"(what|what's|whats|when|how|show|list|tell|give|calculate|compute|check|get|summari[sz]e|recap|can you|could you)\b"
+    rf"|^my (current )?({_METRIC}|goals?|goal progress)( and (my )?{_METRIC})?$"
+)
+# "past week" and "last/past N days|weeks|months" are rolling spans ending today
+_ROLLING = re.compile(r"\b(?:(?:last|past) (\d{1,3})|past) (day|week|month)s?\b")
+_TIME_SPAN = re.compile(
+    r"\b(today|yesterday|(this|last|past|my) (week|month)|so far|(last|past) \d{1,3} (days?|weeks?|months?))\b"
+)
+_LOSE = re.compile(r"\b(lose|losing|cut|cutting|deficit|drop|shed|slim)\b")
+_GAIN = re.compile(r"\b(gain|gaining|bulk|bulking|surplus|put on|build muscle)\b")
+
+# What classify() should return for typical messages; `python intent_router.py check` runs them
+CLASSIFY_EXAMPLES = [
+    ("What is my BMI?", ["bmi"]),
+    ("calculate my bmi", ["bmi"]),
+    ("my bmi and bmr", ["bmr", "bmi"]),
+    ("what's my basal metabolic rate", ["bmr"]),
+    ("What is my TDEE?", ["calorie_needs"]),
+    ("how many calories should I eat to lose weight", ["calorie_needs"]),
+    ("how many calories do i need a day?", ["calorie_needs"]),
+    ("When was my last workout?", ["last_workout"]),
+    ("what did I do last week", ["activity"]),
+    ("how many minutes did I train in the last 10 days", ["activity"]),
+    ("show my workouts from yesterday", ["activity"]),
+    ("hey nova, show me my workouts from the past 2 weeks", ["activity"]),
+    ("how am I doing on my goals", ["goal_progress"]),
+    ("what are my goals", ["goal_progress"]),
+    ("what is the bmi of an elephant", []),
+    ("bmi calculator formula", []),
+    ("what is bmr", []),
+    ("what is tdee", []),
+    ("what did I do wrong in my squat form", []),
+    ("what did I do wrong yesterday", []),
+    ("how many workouts have I done", []),
+    ("how many calories do i need to eat for a marathon", []),
+    ("how many calories to lose weight", []),
+    ("is my bmi healthy?", []),
+    ("how can I lower my bmi", []),
+    ("goal progress", []),
+    ("my bmi is 30, should I worry?", []),
+    ("my workout yesterday hurt my knee", []),
+]
+
+
+def _normalize(message):
+    return " ".join((message or "").lower().replace("’", "'").split()).rstrip("?!. ")
+
+
+def classify(message):
+    """Intents a message can be answered with locally (in INTENT_PATTERNS order), or [] for the LLM."""
+    text = _normalize(message)
+    if (not text or len(text.split()) > MAX_WORDS or not _SELF.search(text) or not _QUESTION.search(text)
+            or _ADVICE.search(text) or _DEFINITION.search(text)):
+        return []
+    return [
+        intent for intent, pattern in INTENT_PATTERNS.items()
+        if pattern.search(text) and (intent != "activity" or _TIME_SPAN.search(text))
+    ]
+
+
+def check_examples():
+    """CLASSIFY_EXAMPLES whose classification differs from the expected one, as (message, expected, got)."""
+    return [
+        (message, expected, classify(message))
+        for message, expected in CLASSIFY_EXAMPLES
+        if classify(message) != expected
+    ]
+
+
+def _period(text, today):
+    """(start, end, label) of the time span a message asks about; this week by default."""
+    rolling = _ROLLING.search(text)
+    if rolling:
+        count, unit = max(int(rolling.group(1) or 1), 1), rolling.group(2) # "last 0 days" means today
+        if unit == "month":
+            months = today.year * 12 + today.month - 1 - count
+            year, month = divmod(months, 12)
+            start = date(year, month + 1, min(today.day, monthrange(year, month + 1)[1])) + timedelta(days=1)
+        else:
+            start = today - timedelta(days=count * (7 if unit == "week" else 1) - 1)
+        span = f"{count} {unit}s" if count != 1 else unit
+        return start, today, f"in the past {span}"
+    if "yesterday" in text:
+        day = today - timedelta(days=1)
+        return day, day, "yesterday"
+    if "today" in text:
+        return today, today, "today"
+    if "last week" in text:
+        start = today - timedelta(days=today.weekday() + 7)
+        return start, start + timedelta(days=6), "last week"
+    if "last month" in text:
+        end = today.replace(day=1) - timedelta(days=1)
+        return end.replace(day=1), end, "last month"
+    if "this month" in text or "month" in text:
+        return today.replace(day=1), today, "this month"
+    return today - timedelta(days=today.weekday()), today, "this week"
+
+
+def _profile(user_id, today):
+    user = query_db("SELECT age, gender, height, weight FROM users WHERE id = ?", (user_id,), fetchone=True)
+    if user is None:
+        return None
+    profile = dict(user)
+    profile["weight"] = weight_on(user_id, today.isoformat()) or profile["weight"]
+    return profile
+
+
+def _missing_profile(profile, fields):
+    missing = [field for field in fields if not profile or not profile.get(field)]
+    if missing:
+        return f"I need your {' and '.join(missing)} for that — add them to your profile and ask again."
+    return None
+
+
+def _activity_level(user_id, today):
+    """ACTIVITY_FACTORS key from the number of days with workouts in the last four weeks."""
+    row = query_db(
+        "SELECT COUNT(DISTINCT day) AS days FROM workouts WHERE user_id = ? AND day > ? AND day <= ?",
+        (user_id, to_day(today) - 28, to_day(today)),
+        fetchone=True,
+        shard_key=user_id
+    )
+    per_week = (row["days"] if row else 0) / 4
+    levels = list(ACTIVITY_FACTORS)
+    if per_week < 0.5:
+        return levels[0]
+    if per_week <= 3:
+        return levels[1]
+    if per_week <= 5:
+        return levels[2]
+    return levels[3]
+
+
+def answer_bmi(user_id, text, today):
+    profile = _profile(user_id, today)
+    missing = _missing_profile(profile, ("height", "weight"))
+    if missing:
+        return missing
+    bmi, _ = calculate_bmi(profile["weight"], profile["height"])
+    category, _ = get_bmi_category(bmi)
+    return f"Your BMI is **{bmi:.1f}** ({category}), from {profile['weight']:g} kg and {profile['height']:g} cm."
+
+
+def answer_bmr(user_id, text, today):
+    profile = _profile(user_id, today)
+    missing = _missing_profile(profile, ("height", "weight", "age"))
+    if missing:
+        return missing
+    bmr = calculate_bmr(profile["weight"], profile["height"], profile["age"], profile["gender"])
+    return f"Your basal metabolic rate (BMR) is about **{bmr:.0f} kcal/day** — what your body burns at rest."
+
+
+def answer_calorie_needs(user_id, text, today):
+    profile = _profile(user_id, today)
+    missing = _missing_profile(profile, ("height", "weight", "age"))
+    if missing:
+        return missing
+    level = _activity_level(user_id, today)
+    tdee = calculate_tdee(calculate_bmr(profile["weight"], profile["height"], profile["age"], profile["gender"]), level)
+    # Same targets as the BMI page
+    lose, gain = max(tdee - 500, 1200), tdee + 500
+    basis = f"based on your profile and the last four weeks of workouts ({level.split(' (')[0].lower()})"
+    if _LOSE.search(text):
+        return f"To lose about 0.5 kg a week, aim for **{lose:.0f} kcal/day** (maintenance is {tdee:.0f} kcal), {basis}."
+    if _GAIN.search(text):
+        return f"To gain weight steadily, aim for **{gain:.0f} kcal/day** (maintenance is {tdee:.0f} kcal), {basis}."
+    return (
+        f"Your maintenance calories are about **{tdee:.0f} kcal/day**, {basis}. "
+        f"To lose weight aim for {lose:.0f} kcal; to gain, {gain:.0f} kcal."
+    )
+
+
+def answer_activity(user_id, text, today):
+    start, end, label = _period(text, today)
+    rows = query_db(
+        "SELECT exercise, COUNT(*) AS sessions, SUM(duration) AS minutes, SUM(calories_burned) AS calories "
+        "FROM workouts WHERE user_id = ? AND day BETWEEN ? AND ? GROUP BY exercise ORDER BY minutes DESC",
+        (user_id, to_day(start), to_day(end)),
+        shard_key=user_id
+    )
+    if not rows:
+        return f"You haven't logged any workouts {label} yet."
+    sessions = sum(row["sessions"] for row in rows)
+    minutes = sum(row["minutes"] or 0 for row in rows)
+    calories = sum(row["calories"] or 0 for row in rows)
+    detail = ", ".join(f"{row['exercise']} {row['sessions']}× ({row['minutes'] or 0:.0f} min)" for row in rows)
+    return (
+        f"{label[0].upper()}{label[1:]} you logged **{sessions} workout{'s' if sessions != 1 else ''}** — "
+        f"{minutes:.0f} minutes, ≈ {calories:.0f} kcal: {detail}."
+    )
+
+
+def answer_last_workout(user_id, text, today):
+    row = query_db(
+        "SELECT date, exercise, duration, calories_burned FROM workouts WHERE user_id = ? "
+        "ORDER BY day DESC, id DESC LIMIT 1",
+        (user_id,),
+        fetchone=True,
+        shard_key=user_id
+    )
+    if row is None:
+        return "You haven't logged a workout yet."
+    calories = f", ≈ {row['calories_burned']:.0f} kcal" if row["calories_burned"] else ""
+    return f"Your last workout was **{row['exercise']}** for {row['duration']} min on {row['date']}{calories}."
+
+
+def answer_goal_progress(user_id, text, today):
+    goals = query_db(
+        "SELECT goal_type, target_value, current_value, end_date FROM goals "
+        "WHERE user_id = ? AND status = 'active' ORDER BY end_date",
+        (user_id,),
+        shard_key=user_id
+    )
+    if not goals:
+        return "You don't have any active goals — set one on the Goals page."
+    lines = ["Your active goals:"]
+    for goal in goals:
+        target, current = goal["target_value"] or 0, goal["current_value"] or 0
+        percent = f" ({current / target:.0%})" if target else ""
+        lines.append(f"- {goal['goal_type'].replace('_', ' ')}: {current:g} of {target:g}{percent}, ends {goal['end_date']}")
+    return "\n".join(lines)
+
+
+ANSWERS = {
+    "calorie_needs": answer_calorie_needs,
+    "bmr": answer_bmr,
+    "bmi": answer_bmi,
+    "last_workout": answer_last_workout,
+    "activity": answer_activity,
+    "goal_progress": answer_goal_progress,
+}
+
+
+def route_message(user_id, message, today=None):
+    """
+    Answers a chat message locally if classify() recognizes it: returns (intents, text).
+    Returns None when it should go to the LLM. Every call is recorded in chat_routes.
+    """
+    started = time.perf_counter()
+    intents = classify(message)
+    text = None
+    if intents:
+        today = today or date.today()
+        normalized = _normalize(message)
+        try:
+            text = "\n\n".join(ANSWERS[intent](user_id, normalized, today) for intent in intents)
+        except Exception as e: # never let a local answer break the chat; the LLM can still reply
+            logger.warning("Local answer for %s failed: %s", intents, e)
+            intents, text = [], None
+    execute_db(
+        "INSERT INTO chat_routes (intent, latency_ms) VALUES (?, ?)",
+        (",".join(intents) or None, round((time.perf_counter() - started) * 1000, 2))
+    )
+    return (intents, text) if text else None
+
+
+def get_routing_stats(days=7):
+    """Messages seen, the share answered locally, and per-intent counts over the last `days` days."""
+    since = (f"-{int(days)} days",)
+    totals = query_db(
+        "SELECT COUNT(*) AS messages, COALESCE(SUM(intent IS NOT NULL), 0) AS local, "
+        "AVG(CASE WHEN intent IS NOT NULL THEN latency_ms END) AS local_ms "
+        "FROM chat_routes WHERE timestamp >= datetime('now', ?)",
+        since,
+        fetchone=True
+    )
+    intents = query_db(
+        "SELECT intent, COUNT(*) AS messages FROM chat_routes "
+        "WHERE timestamp >= datetime('now', ?) AND intent IS NOT NULL GROUP BY intent ORDER BY messages DESC",
+        since
+    )
+    return totals, intents
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local chat intent routing")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    stats = subparsers.add_parser("stats", help="Routing hit rate")
+    stats.add_argument("--days", type=int, default=7)
+    classify_parser = subparsers.add_parser("classify", help="Show the intents a message would be answered with")
+    classify_parser.add_argument("message")
+    subparsers.add_parser("check", help="Run classify() over CLASSIFY_EXAMPLES")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        totals, intents = get_routing_stats(args.days)
+        if not totals["messages"]:
+            print("No chat messages routed in this window.")
+        else:
+            print(
+                f"{totals['messages']} messages, {totals['local']} answered locally "
+                f"({totals['local'] / totals['messages']:.1%} hit rate, avg {totals['local_ms'] or 0:.1f} ms)"
+            )
+            for row in intents:
+                print(f"  {row['intent']}: {row['messages']}")
+    elif args.command == "classify":
+        print(", ".join(classify(args.message)) or "→ LLM")
+    elif args.command == "check":
+        failures = check_examples()
+        for message, expected, got in failures:
+            print(f"❌ {message!r}: expected {', '.join(expected) or 'LLM'}, got {', '.join(got) or 'LLM'}")
+        if not failures:
+            print(f"✅ All {len(CLASSIFY_EXAMPLES)} examples classified as expected.")
@@ -0,0 +1,262 @@
+import argparse
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from groq import Groq
+from datetime import date
+from db import query_db, execute_db, to_day
+from chat_compression import reply_text
+
+logger = logging.getLogger(__name__)
+
+MODEL = "llama-3.1-8b-instant"
+
+# Total latency budget for one chat answer, in seconds
+LLM_DEADLINE = float(os.getenv("FITNESS_LLM_DEADLINE", "8"))
+
+# A hedged duplicate request is sent once the primary is slower than this
+# percentile of recent latencies (HEDGE_DEFAULT is used until enough samples exist)
+HEDGE_PERCENTILE = float(os.getenv("FITNESS_LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_DEFAULT = float(os.getenv("FITNESS_LLM_HEDGE_AFTER", "2.5"))
+HEDGE_MIN_SAMPLES = 20
+
+# Replies served from the local fallback start with this marker so they are never reused as cache
+FALLBACK_MARKER = "⏱️"
+SIMILARITY_THRESHOLD = 0.6
+
+# The SDK's own timeout backs up the deadline so abandoned requests don't pile up
+client = Groq(timeout=LLM_DEADLINE, max_retries=0)
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm")
+_latencies = deque(maxlen=200)
+_latencies_lock = threading.Lock()
+_latencies_loaded = False
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "the", "i", "me", "my", "is", "are", "am", "to", "of", "and", "or", "for", "in",
+    "on", "it", "do", "can", "you", "what", "how", "should", "with", "be", "this", "that",
+}
+
+
+def _hedge_delay():
+    """Seconds to wait before hedging: the configured percentile of recent latencies."""
+    global _latencies_loaded
+    with _latencies_lock:
+        if not _latencies_loaded:
+            rows = query_db(
+                "SELECT latency_ms FROM llm_calls WHERE outcome = 'primary' ORDER BY id DESC LIMIT ?",
+                (_latencies.maxlen,)
+            )
+            _latencies.extend(row["latency_ms"] / 1000 for row in reversed(rows))
+            _latencies_loaded = True
+        samples = sorted(_latencies)
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return min(HEDGE_DEFAULT, LLM_DEADLINE)
+    index = min(int(len(samples) * HEDGE_PERCENTILE / 100), len(samples) - 1)
+    return min(samples[index], LLM_DEADLINE)
+
+
+def _create(messages, model):
+    response = client.chat.completions.create(messages=messages, model=model)
+    return response.choices[0].message.content
+
+
+def complete_with_deadline(messages, fallback, kind="chat", model=MODEL, deadline=None):
+    """
+    Runs a chat completion under a latency budget. If the first request hasn't answered
+    by the hedge threshold (or fails early) a duplicate request is sent; the first answer
+    wins. If nothing arrives before the deadline, `fallback()` supplies a local answer.
+    Returns (text, outcome) where outcome is "primary", "hedge" or "fallback".
+    """
+    deadline = deadline or LLM_DEADLINE
+    started = time.perf_counter()
+    hedge_at = started + _hedge_delay()
+    end_at = started + deadline
+
+    futures = {_executor.submit(_create, messages, model): "primary"}
+    hedged = False
+    text, outcome = None, "fallback"
+
+    while futures and text is None:
+        now = time.perf_counter()
+        if now >= end_at:
+            break
+        timeout = (hedge_at if not hedged else end_at) - now
+        done, _ = wait(futures, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+        for future in done:
+            label = futures.pop(future)
+            try:
+                text, outcome = future.result(), label
+                break
+            except Exception as e:
+                logger.warning("LLM %s request failed: %s", label, e)
+        if text is None and not hedged and (not futures or time.perf_counter() >= hedge_at):
+            futures[_executor.submit(_create, messages, model)] = "hedge"
+            hedged = True
+
+    latency = time.perf_counter() - started
+    if text is None:
+        text = fallback()
+        outcome = "fallback"
+    elif outcome == "primary":
+        with _latencies_lock:
+            _latencies.append(latency)
+
+    execute_db(
+        "INSERT INTO llm_calls (kind, latency_ms, hedged, outcome) VALUES (?, ?, ?, ?)",
+        (kind, round(latency * 1000, 1), int(hedged), outcome)
+    )
+    return text, outcome
+
+
+_STREAM_END = object()
+
+
+def _stream(messages, model, chunks):
+    """Feeds the text deltas of a streamed completion (or the error) into the `chunks` queue."""
+    try:
+        for chunk in client.chat.completions.create(messages=messages, model=model, stream=True):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                chunks.put(delta)
+    except Exception as e:
+        chunks.put(e)
+    finally:
+        chunks.put(_STREAM_END)
+
+
+def stream_with_deadline(messages, fallback, kind="chat", model=MODEL, deadline=None):
+    """
+    Streams a chat completion as text deltas. If no text has arrived by the deadline (or
+    the request fails first), `fallback()` is yielded as a single chunk instead. Use as
+    `outcome = yield from stream_with_deadline(...)`; outcome is "primary" or "fallback".
+    """
+    deadline = deadline or LLM_DEADLINE
+    started = time.perf_counter()
+    chunks = queue.Queue()
+    _executor.submit(_stream, messages, model, chunks)
+    outcome = "fallback"
+
+    while True:
+        # The deadline covers the first token; after that a stalled stream gets the same budget per chunk
+        timeout = started + deadline - time.perf_counter() if outcome == "fallback" else deadline
+        try:
+            item = chunks.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            logger.warning("LLM stream timed out after %.1fs (%s)", time.perf_counter() - started, outcome)
+            break
+        if item is _STREAM_END:
+            break
+        if isinstance(item, Exception):
+            logger.warning("LLM stream failed: %s", item)
+            break
+        outcome = "primary"
+        yield item
+
+    latency = time.perf_counter() - started
+    if outcome == "fallback":
+        yield fallback()
+    else:
+        with _latencies_lock:
+            _latencies.append(latency)
+    execute_db(
+        "INSERT INTO llm_calls (kind, latency_ms, hedged, outcome) VALUES (?, ?, ?, ?)",
+        (kind, round(latency * 1000, 1), 0, outcome)
+    )
+    return outcome
+
+
+def _tokens(text):
+    return {word for word in _WORD.findall((text or "").lower()) if word not in _STOPWORDS}
+
+
+def find_similar_reply(user_id, message, limit=200):
+    """Returns the stored reply to the user's most similar earlier question, or None."""
+    wanted = _tokens(message)
+    if not wanted:
+        return None
+    rows = query_db(
+        "SELECT user_message, bot_reply FROM chat_logs WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+        (user_id, limit),
+        shard_key=user_id
+    )
+    best, best_score = None, 0.0
+    for row in rows:
+        reply = reply_text(row["bot_reply"]) or ""
+        if reply.startswith(FALLBACK_MARKER) or reply.startswith("Sorry, I couldn't process"):
+            continue
+        seen = _tokens(row["user_message"])
+        if not seen:
+            continue
+        score = len(wanted & seen) / len(wanted | seen)
+        if score > best_score:
+            best, best_score = reply, score
+    return best if best_score >= SIMILARITY_THRESHOLD else None
+
+
+def templated_reply(user_id):
+    """Builds a short answer from the user's own data when no model answer is available."""
+    user = query_db("SELECT name, height, weight FROM users WHERE id = ?", (user_id,), fetchone=True)
+    goals = query_db(
+        "SELECT goal_type, target_value, current_value FROM goals WHERE user_id = ? AND status = 'active' LIMIT 3",
+        (user_id,),
+        shard_key=user_id
+    )
+    workouts = query_db(
+        "SELECT COUNT(*) AS sessions, COALESCE(SUM(duration), 0) AS minutes FROM workouts "
+        "WHERE user_id = ? AND day >= ?",
+        (user_id, to_day(date.today()) - 7), fetchone=True, shard_key=user_id
+    )
+
+    lines = [f"{FALLBACK_MARKER} Nova is taking longer than usual to respond, so here's a quick summary from your data:"]
+    if user and user["height"]:
+        bmi = user["weight"] / ((user["height"] / 100) ** 2)
+        lines.append(f"- Your BMI is **{bmi:.1f}** at {user['weight']} kg.")
+    if workouts:
+        lines.append(f"- In the last 7 days you logged **{workouts['sessions']}** workouts ({workouts['minutes']} minutes).")
+    for goal in goals:
+        lines.append(
+            f"- Goal **{goal['goal_type'].replace('_', ' ')}**: {goal['current_value']:.1f} / {goal['target_value']:.1f}."
+        )
+    lines.append("\nStay hydrated, keep moving, and please ask again in a moment for a full answer.")
+    return "\n".join(lines)
+
+
+def local_fallback_reply(user_id, message):
+    """Best locally available answer: a reply to a similar earlier question, else a template."""
+    cached = find_similar_reply(user_id, message)
+    if cached:
+        return f"{FALLBACK_MARKER} Nova is slow right now — here's what I told you about a similar question earlier:\n\n{cached}"
+    return templated_reply(user_id)
+
+
+def get_llm_call_stats(days=7):
+    """Hedge and fallback rates over the last `days` days, overall and per call kind."""
+    return query_db(
+        "SELECT kind, COUNT(*) AS calls, AVG(hedged) AS hedge_rate, "
+        "AVG(outcome = 'fallback') AS fallback_rate, AVG(outcome = 'hedge') AS hedge_win_rate, "
+        "AVG(latency_ms) AS avg_latency_ms "
+        "FROM llm_calls WHERE timestamp >= datetime('now', ?) GROUP BY kind",
+        (f"-{int(days)} days",)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM call statistics")
+    parser.add_argument("--days", type=int, default=7, help="Window to report on")
+    args = parser.parse_args()
+
+    stats = get_llm_call_stats(args.days)
+    if not stats:
+        print("No LLM calls recorded in this window.")
+    for row in stats:
+        print(
+            f"{row['kind']}: {row['calls']} calls, hedged {row['hedge_rate']:.1%}, "
+            f"hedge won {row['hedge_win_rate']:.1%}, fallback {row['fallback_rate']:.1%}, "
+            f"avg {row['avg_latency_ms']:.0f} ms"
+        )
@@ -0,0 +1,156 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+# Root level and output format ("text" or "json")
+LOG_LEVEL = os.getenv("FITNESS_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("FITNESS_LOG_FORMAT", "text").lower()
+
+# Optional log file; console output is always on
+LOG_FILE = os.getenv("FITNESS_LOG_FILE", "")
+
+# Per-module levels, e.g. "db=DEBUG,profiler=WARNING"
+LOG_LEVELS = os.getenv("FITNESS_LOG_LEVELS", "")
+
+# Fraction of DEBUG records kept per module, e.g. "db=0.01"
+LOG_SAMPLE = os.getenv("FITNESS_LOG_SAMPLE", "")
+
+# Attributes every LogRecord carries; anything else came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+def _level(name):
+    """Converts a level name such as "debug" to its numeric value."""
+    level = logging.getLevelName(name.upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {name}")
+    return level
+
+
+def _parse_mapping(spec, convert):
+    """Parses "name=value,name=value" into a dict, skipping malformed entries."""
+    mapping = {}
+    for item in spec.split(","):
+        name, sep, value = item.partition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            mapping[name.strip()] = convert(value.strip())
+        except ValueError:
+            continue
+    return mapping
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, including any `extra=` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Keeps only a fraction of DEBUG records for the configured logger hierarchies."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._resolved = {}
+
+    def _rate_for(self, name):
+        if name not in self._resolved:
+            rate, probe = 1.0, name
+            while probe:
+                if probe in self.rates:
+                    rate = self.rates[probe]
+                    break
+                probe = probe.rpartition(".")[0]
+            self._resolved[name] = rate
+        return self._resolved[name]
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self._rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records without formatting them, so %-style arguments are only
+    rendered on the listener thread. Arguments must not be mutated after logging.
+    """
+
+    def prepare(self, record):
+        return logging.makeLogRecord(vars(record))
+
+
+def setup_logging():
+    """
+    Routes all logging through an in-memory queue drained by a background
+    QueueListener, so console/file I/O never runs on the Streamlit script thread.
+    Safe to call more than once; only the first call configures logging.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s")
+
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if LOG_FILE:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=10 * 1024 * 1024, backupCount=5, encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(_parse_mapping(LOG_SAMPLE, float)))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    try:
+        root.setLevel(_level(LOG_LEVEL))
+    except ValueError:
+        root.setLevel(logging.INFO)
+
+    for name, level in _parse_mapping(LOG_LEVELS, _level).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,41 +1,58 @@
 import streamlit as st
-from groq import Groq
 from db import query_db, execute_db
-import tempfile
-import os
-import fitz  # PyMuPDF for PDF text extraction
+from chat_compression import compress_reply
+from profiler import segment
+from fragments import fragment
+from chat_history import get_chat_history, remember_turn, render_chat_history
+from llm_client import complete_with_deadline, local_fallback_reply
+from goal_suggestions import record_goal_suggestions
+from pdf_extraction import extract_pdf_text, PdfTooLarge
+from nutrition_facts import (
+    analyze_meal_text, merge_meal_facts, format_nutrition_summary, is_totals_question, answer_totals_question,
+)
 from dotenv import load_dotenv
 
-# Load environment variables and initialize Groq client
+# Load environment variables (the Groq client itself lives in llm_client)
 load_dotenv()
-client = Groq()
 
-def extract_text_from_pdf(uploaded_file):
-    """Extracts text content from an uploaded PDF file using PyMuPDF."""
-    text = ""
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            temp_path = tmp_file.name
-
-        doc = fitz.open(temp_path)
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text += page.get_text()
-        doc.close()
-        os.unlink(temp_path)
+def extract_text_from_pdf(uploaded_file, user_id=None):
+    """
+    Extracts text content from an uploaded PDF file (see pdf_extraction for the
+    limits), showing progress as page ranges finish. The text is kept in session
+    state so the same upload isn't extracted again for every message.
+    """
+    cache_key = f"pdf_text_{user_id}"
+    file_key = (getattr(uploaded_file, "file_id", None), uploaded_file.name, uploaded_file.size)
+    cached = st.session_state.get(cache_key)
+    if cached and cached["file"] == file_key:
+        return cached["text"]
 
+    progress = st.progress(0.0, text="Reading your meal plan...")
+    try:
+        result = extract_pdf_text(
+            uploaded_file,
+            on_progress=lambda done, total: progress.progress(done / total, text=f"Read {done} of {total} pages...")
+        )
+    except PdfTooLarge as e:
+        st.error(f"Meal plan not read: {e}")
+        return ""
     except Exception as e:
         st.error(f"Error processing PDF: {e}")
         return ""
+    finally:
+        progress.empty()
 
-    return text
+    if result["limited"]:
+        st.warning(f"Your meal plan was only partly read: {result['limited']}.")
+    st.session_state[cache_key] = {"file": file_key, "text": result["text"]}
+    return result["text"]
 
 def log_nutrition_chat_interaction(user_id, user_message, bot_reply):
-    """Logs the nutrition chat interaction to the database."""
-    execute_db(
-        "INSERT INTO chat_logs (user_id, user_message, bot_reply) VALUES (?, ?, ?)",
-        (user_id, user_message, bot_reply)
+    """Logs the nutrition chat interaction to the database and returns the new chat log id."""
+    return execute_db(
+        "INSERT INTO chat_logs (user_id, user_message, bot_reply, kind) VALUES (?, ?, ?, 'nutrition')",
+        (user_id, user_message, compress_reply(bot_reply)),
+        shard_key=user_id
     )
 
 def get_user_context(user_id):
@@ -44,7 +61,7 @@ def get_user_context(user_id):
     if not user_data:
         return "User data not found."
 
-    goals = query_db("SELECT goal_type, target_value, current_value, status FROM goals WHERE user_id = ? AND status != 'completed'", (user_id,))
+    goals = query_db("SELECT goal_type, target_value, current_value, status FROM goals WHERE user_id = ? AND status != 'completed'", (user_id,), shard_key=user_id)
 
     context = f"""
     User Profile:
@@ -65,21 +82,18 @@ def get_user_context(user_id):
 
     return context
 
+@fragment("Nutrition / chat")
 def nutrition_chat(user_id):
     """Displays the nutrition chat interface and handles interactions."""
     st.subheader("🥗 Nutrition Assistant (Nova AI)")
 
-    if f"nutrition_messages_{user_id}" not in st.session_state:
-        st.session_state[f"nutrition_messages_{user_id}"] = []
-
-    for message in st.session_state[f"nutrition_messages_{user_id}"]:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    # Bounded history: recent messages plus turns paged in with "Load earlier"
+    history = get_chat_history(user_id, "nutrition")
+    render_chat_history(user_id, "nutrition", history)
 
     uploaded_file = st.file_uploader("Upload your meal plan (PDF or Text)", type=['pdf', 'txt'])
 
     if prompt := st.chat_input("Ask about your nutrition, meal plan, calories, macros, etc."):
-        st.session_state[f"nutrition_messages_{user_id}"].append({"role": "user", "content": prompt})
         with st.chat_message("user"):
             st.markdown(prompt)
 
@@ -88,13 +102,20 @@ def nutrition_chat(user_id):
         file_content = ""
         if uploaded_file is not None:
             if uploaded_file.type == "application/pdf":
-                file_content = extract_text_from_pdf(uploaded_file)
+                file_content = extract_text_from_pdf(uploaded_file, user_id)
             elif uploaded_file.type == "text/plain":
                 file_content = uploaded_file.getvalue().decode("utf-8")
             else:
                 st.error("Unsupported file type. Please upload a PDF or TXT file.")
                 return
 
+        # Foods and amounts are totalled from the local food table instead of guessed by the LLM:
+        # the uploaded plan's, plus any the message adds
+        facts = analyze_meal_text(prompt)
+        if file_content:
+            facts = merge_meal_facts(analyze_meal_text(file_content), facts)
+        nutrition_facts = format_nutrition_summary(facts) if facts["items"] else "No foods recognized."
+
         full_prompt = f"""
         User Context:
         {user_context}
@@ -102,34 +123,45 @@ def nutrition_chat(user_id):
         Meal Plan Content (if uploaded):
         {file_content}
 
+        Nutrition Facts (computed from a food composition table; use these numbers instead of estimating):
+        {nutrition_facts}
+
         User Message:
         {prompt}
 
         Please provide a helpful, friendly, and accurate response related to nutrition, diet, calories, macros, or meal planning based on the user's context and the meal plan content (if provided).
         """
 
-        try:
-            chat_completion = client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are Nova, a friendly and knowledgeable AI nutrition assistant. Provide helpful, encouraging, and scientifically-backed advice on nutrition, diet, calories, and meal planning. Use the user's context (profile, goals) and the provided meal plan content (if any) to personalize your responses."
-                    },
-                    {
-                        "role": "user",
-                        "content": full_prompt
-                    }
-                ],
-                model="llama-3.1-8b-instant",  # ✅ FIXED: Updated to supported model
-            )
-
-            response_text = chat_completion.choices[0].message.content
-
-        except Exception as e:
-            st.error(f"Error calling Groq API: {e}")
-            response_text = "Sorry, I couldn't process your request at the moment. Please try again later."
-
-        st.session_state[f"nutrition_messages_{user_id}"].append({"role": "assistant", "content": response_text})
-        log_nutrition_chat_interaction(user_id, prompt, response_text)
+        if facts["items"] and is_totals_question(prompt):
+            # Plain "how many calories / how much protein" questions don't need the LLM at all
+            response_text, outcome = answer_totals_question(facts), "food_table"
+        else:
+            # Get AI response using Groq, within a latency budget (hedged, with a local fallback)
+            with segment("llm"):
+                response_text, outcome = complete_with_deadline(
+                    [
+                        {
+                            "role": "system",
+                            "content": "You are Nova, a friendly and knowledgeable AI nutrition assistant. Provide helpful, encouraging, and scientifically-backed advice on nutrition, diet, calories, and meal planning. Use the user's context (profile, goals) and the provided meal plan content (if any) to personalize your responses."
+                        },
+                        {
+                            "role": "user",
+                            "content": full_prompt
+                        }
+                    ],
+                    fallback=lambda: local_fallback_reply(user_id, prompt),
+                    kind="nutrition",
+                )
+
+        chat_log_id = log_nutrition_chat_interaction(user_id, prompt, response_text)
+        remember_turn(history, prompt, response_text, chat_log_id)
         with st.chat_message("assistant"):
-            st.markdown(response_text)
\ No newline at end of file
+            st.markdown(response_text)
+            if outcome == "fallback":
+                st.caption("Nova AI didn't answer in time, so this reply was put together from your saved data.")
+            elif outcome == "food_table":
+                st.caption(f"Calculated from the built-in food table in {facts['ms']:.0f} ms.")
+
+        current_weight = st.session_state.get("user", {}).get("weight")
+        if record_goal_suggestions(user_id, chat_log_id, prompt, current_weight):
+            st.info("🎯 I noticed a goal in your message — you can add it from the Goals page.")
\ No newline at end of file
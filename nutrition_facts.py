@@ -0,0 +1,381 @@
+import argparse
+import csv
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from db import query_db, execute_transaction
+
+logger = logging.getLogger(__name__)
+
+# Bundled USDA-style composition table (per 100 g); `python nutrition_facts.py load --csv`
+# replaces it with a larger export in the same format
+FOODS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "foods.csv")
+
+# Grams per unit for mass and (water-density) volume units
+UNIT_GRAMS = {
+    "g": 1, "gram": 1, "gm": 1, "gms": 1, "mg": 0.001, "kg": 1000, "kilo": 1000,
+    "oz": 28.35, "ounce": 28.35, "lb": 453.6, "lbs": 453.6, "pound": 453.6,
+    "ml": 1, "l": 1000, "liter": 1000, "litre": 1000,
+    "cup": 240, "glass": 250, "tbsp": 15, "tablespoon": 15, "tbs": 15, "tsp": 5, "teaspoon": 5,
+}
+# Units that mean "one serving" of whatever follows
+SERVING_UNITS = {"serving", "portion", "piece", "pc", "pcs", "slice", "handful", "bowl", "can", "bottle", "scoop", "bar"}
+SIZE_WORDS = {"small": 0.75, "medium": 1, "large": 1.25, "big": 1.25}
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "half": 0.5, "quarter": 0.25, "dozen": 12,
+}
+NEGATIONS = {"no", "without", "skip", "avoid", "instead"}
+
+# Numbers, words and the separators that stop a match or quantity from running across them
+_TOKEN = re.compile(r"\d+(?:[.,/]\d+)?|[a-z]+|[\n;]")
+_FRACTIONS = {"½": " 1/2", "¼": " 1/4", "¾": " 3/4", "⅓": " 1/3"}
+
+TOTALS_QUESTION = re.compile(
+    r"\b(how many|how much|total|count|what are|what's|what is|calculate)\b.*"
+    r"\b(calories|calorie|kcal|protein|carbs?|carbohydrates?|fats?|macros?)\b", re.IGNORECASE
+)
+# Questions asking for judgement still go to the LLM, with the computed totals in the prompt
+ADVICE_WORDS = re.compile(
+    r"\b(should|good|bad|enough|better|healthy|why|recommend|improve|replace|swap|lose|gain|too|suggest|change)\b",
+    re.IGNORECASE
+)
+
+_matcher = None
+_matcher_lock = threading.RLock()
+
+
+def _singular(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and (word.endswith("oes") or word.endswith("sses")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """
+    Lowercases, strips accents and splits text into (token, start, end) with plurals
+    folded; start/end are offsets into the original text.
+    """
+    if text.isascii():
+        return [(_singular(m.group()), m.start(), m.end()) for m in _TOKEN.finditer(text.lower())]
+    # Fold character by character so offsets still point into the original text
+    folded, origin = [], []
+    for i, char in enumerate(text):
+        replacement = _FRACTIONS.get(char) or unicodedata.normalize("NFKD", char).encode("ascii", "ignore").decode("ascii").lower()
+        folded.append(replacement)
+        origin.extend([i] * len(replacement))
+    return [
+        (_singular(m.group()), origin[m.start()], origin[m.end() - 1] + 1)
+        for m in _TOKEN.finditer("".join(folded))
+    ]
+
+
+def normalize(name):
+    """Normalized form of a food name or alias, as stored in food_names."""
+    return " ".join(token for token, _, _ in tokenize(name))
+
+
+class FoodMatcher:
+    """
+    Aho-Corasick automaton over word tokens: one pass over a document finds every
+    food name and alias in it, however many names the table holds.
+    """
+
+    def __init__(self, names):
+        # names: {normalized name: food row}
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for name, food in names.items():
+            words = name.split()
+            state = 0
+            for word in words:
+                if word not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][word] = len(self.goto) - 1
+                state = self.goto[state][word]
+            self.output[state].append((len(words), food))
+
+        # Breadth-first failure links; each state also reports the matches of its suffixes
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(word, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find(self, tokens):
+        """Leftmost-longest, non-overlapping matches as (start, end, food) token index ranges."""
+        found = []
+        state = 0
+        for i, (token, _, _) in enumerate(tokens):
+            while state and token not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(token, 0)
+            for length, food in self.output[state]:
+                found.append((i + 1 - length, i + 1, food))
+        found.sort(key=lambda match: (match[0], -match[1]))
+        matches, last_end = [], 0
+        for start, end, food in found:
+            if start >= last_end:
+                matches.append((start, end, food))
+                last_end = end
+        return matches
+
+
+def load_foods(csv_path=FOODS_CSV):
+    """Replaces the foods and food_names tables with a CSV export. Returns the number of foods, or -1."""
+    statements = [("DELETE FROM food_names", ()), ("DELETE FROM foods", ())]
+    foods = 0
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for food_id, row in enumerate(csv.DictReader(f), start=1):
+            statements.append((
+                "INSERT INTO foods (id, name, kcal, protein, carbs, fat, serving_g, serving) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (food_id, row["name"], float(row["kcal"]), float(row["protein"]), float(row["carbs"]),
+                 float(row["fat"]), float(row["serving_g"]), row["serving"])
+            ))
+            for name in [row["name"], *row["aliases"].split("|")]:
+                if name.strip():
+                    statements.append((
+                        "INSERT OR IGNORE INTO food_names (name, food_id) VALUES (?, ?)", (normalize(name), food_id)
+                    ))
+            foods += 1
+    if execute_transaction(statements) == -1:
+        return -1
+    reset_matcher()
+    logger.info("Loaded %d foods from %s", foods, csv_path)
+    return foods
+
+
+def reset_matcher():
+    """Drops the cached matcher so the next lookup rebuilds it from the database."""
+    global _matcher
+    with _matcher_lock:
+        _matcher = None
+
+
+def get_food_matcher():
+    """Process-wide matcher, built from the food tables once (seeding them from FOODS_CSV if empty)."""
+    global _matcher
+    with _matcher_lock:
+        if _matcher is None:
+            if not query_db("SELECT 1 FROM foods LIMIT 1") and os.path.exists(FOODS_CSV):
+                load_foods()
+            rows = query_db(
+                "SELECT n.name AS alias, f.* FROM food_names n JOIN foods f ON f.id = n.food_id"
+            )
+            names = {row["alias"]: dict(row) for row in rows}
+            for food in names.values():
+                food["serving_amount"], food["serving_unit"] = _serving_unit(food["serving"])
+            _matcher = FoodMatcher(names)
+            logger.info("Built food matcher over %d names", len(names))
+        return _matcher
+
+
+def _serving_unit(serving):
+    """Splits "2 tbsp" / "1/2 cup dry" / "1 large egg" into (amount, unit or None)."""
+    tokens = [token for token, _, _ in tokenize(serving or "")]
+    amount = _number(tokens[0]) if tokens else None
+    unit = tokens[1] if len(tokens) > 1 and (tokens[1] in UNIT_GRAMS or tokens[1] in SERVING_UNITS) else None
+    return amount or 1, unit
+
+
+def _number(token):
+    if token in NUMBER_WORDS:
+        return NUMBER_WORDS[token]
+    if token[0].isdigit():
+        if "/" in token:
+            numerator, denominator = token.split("/")
+            return float(numerator) / float(denominator) if float(denominator) else None
+        return float(token.replace(",", "."))
+    return None
+
+
+def _quantity_before(tokens, start, taken):
+    """Reads "2 large", "150 g of", "half a cup of", "1/2 cup" before a match. Returns (amount, unit, first index)."""
+    i = start - 1
+    unit = size = None
+    if i >= 0 and tokens[i][0] == "of":
+        i -= 1
+    if i >= 0 and tokens[i][0] in SIZE_WORDS:
+        size = tokens[i][0]
+        i -= 1
+    if i >= 0 and (tokens[i][0] in UNIT_GRAMS or tokens[i][0] in SERVING_UNITS):
+        unit = tokens[i][0]
+        i -= 1
+    if i >= 0 and tokens[i][0] == "x":
+        i -= 1
+    amount = _number(tokens[i][0]) if i >= 0 and i not in taken else None
+    if amount is None:
+        return None, None, start
+    # "half a cup of"
+    if i >= 1 and tokens[i][0] in ("a", "an") and tokens[i - 1][0] == "half":
+        amount, i = 0.5, i - 1
+    if size and not unit:
+        amount *= SIZE_WORDS[size]
+    return amount, unit, i
+
+
+def _quantity_after(tokens, end, taken):
+    """Reads a weight or volume right after a match: "chicken breast 150 g", "milk: 200ml"."""
+    if end + 1 < len(tokens) and end not in taken and tokens[end + 1][0] in UNIT_GRAMS:
+        amount = _number(tokens[end][0])
+        if amount is not None and tokens[end][0][0].isdigit():
+            return amount, tokens[end + 1][0]
+    return None, None
+
+
+def _grams(food, amount, unit):
+    if unit is not None and unit == food["serving_unit"]:
+        return amount * food["serving_g"] / food["serving_amount"]
+    if unit in UNIT_GRAMS:
+        return amount * UNIT_GRAMS[unit]
+    return amount * food["serving_g"]
+
+
+def analyze_meal_text(text, matcher=None):
+    """
+    Finds foods and their quantities in meal-plan or question text and totals them
+    from the food table. Foods without a quantity count as one typical serving.
+    Returns {"items": [...], "totals": {kcal, protein, carbs, fat}, "assumed": n, "ms": scan time}.
+    """
+    started = time.perf_counter()
+    matcher = matcher or get_food_matcher()
+    tokens = tokenize(text)
+    matches = matcher.find(tokens)
+    items, taken = [], set()
+    for start, end, food in matches:
+        taken.update(range(start, end))
+
+    # Quantities in front ("2 eggs") win; trailing ones ("chicken 150 g") only fill the gaps
+    quantities = []
+    for start, end, food in matches:
+        amount, unit, first = _quantity_before(tokens, start, taken)
+        if amount is not None:
+            taken.update(range(first, start))
+        quantities.append((amount, unit, first))
+    for (start, end, food), (amount, unit, first) in zip(matches, quantities):
+        if amount is None:
+            amount, unit = _quantity_after(tokens, end, taken)
+            if amount is not None:
+                taken.update((end, end + 1))
+        before = tokens[first - 1][0] if first > 0 else None
+        after = tokens[end][0] if end < len(tokens) else None
+        if before in NEGATIONS or after == "free":
+            continue
+
+        assumed = amount is None
+        grams = _grams(food, 1 if assumed else amount, unit)
+        factor = grams / 100
+        items.append({
+            "food": food["name"],
+            "text": text[tokens[first][1]:tokens[end - 1][2]],
+            "grams": grams,
+            "kcal": food["kcal"] * factor,
+            "protein": food["protein"] * factor,
+            "carbs": food["carbs"] * factor,
+            "fat": food["fat"] * factor,
+            "assumed": assumed,
+        })
+
+    totals = {key: sum(item[key] for item in items) for key in ("kcal", "protein", "carbs", "fat")}
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.debug("Matched %d foods in %d tokens in %.2f ms", len(items), len(tokens), elapsed_ms)
+    return {
+        "items": items,
+        "totals": totals,
+        "assumed": sum(item["assumed"] for item in items),
+        "ms": elapsed_ms,
+    }
+
+
+def merge_meal_facts(primary, extra):
+    """
+    Combines two analyze_meal_text() results, e.g. an uploaded meal plan and the typed
+    question. Foods already in `primary` aren't counted again ("how much protein is in the chicken?").
+    """
+    known = {item["food"] for item in primary["items"]}
+    items = primary["items"] + [item for item in extra["items"] if item["food"] not in known]
+    return {
+        "items": items,
+        "totals": {key: sum(item[key] for item in items) for key in ("kcal", "protein", "carbs", "fat")},
+        "assumed": sum(item["assumed"] for item in items),
+        "ms": primary["ms"] + extra["ms"],
+    }
+
+
+def format_nutrition_summary(result):
+    """Plain-text breakdown for the LLM prompt."""
+    lines = []
+    for item in result["items"]:
+        note = ", 1 typical serving assumed" if item["assumed"] else ""
+        lines.append(
+            f"- {item['text']} ({item['food']}, {item['grams']:.0f} g{note}): {item['kcal']:.0f} kcal, "
+            f"protein {item['protein']:.1f} g, carbs {item['carbs']:.1f} g, fat {item['fat']:.1f} g"
+        )
+    totals = result["totals"]
+    lines.append(
+        f"Total: {totals['kcal']:.0f} kcal, protein {totals['protein']:.0f} g, "
+        f"carbs {totals['carbs']:.0f} g, fat {totals['fat']:.0f} g"
+    )
+    return "\n".join(lines)
+
+
+def is_totals_question(question):
+    """True for plain "how many calories / how much protein" questions the food table can answer alone."""
+    return bool(TOTALS_QUESTION.search(question)) and not ADVICE_WORDS.search(question)
+
+
+def answer_totals_question(result):
+    """Markdown answer with the per-food breakdown and totals."""
+    totals = result["totals"]
+    lines = [
+        f"By my food table, that comes to about **{totals['kcal']:.0f} kcal** — "
+        f"**{totals['protein']:.0f} g protein**, {totals['carbs']:.0f} g carbs and {totals['fat']:.0f} g fat.",
+        "",
+        "| Food | Amount | kcal | Protein | Carbs | Fat |",
+        "|---|---|---|---|---|---|",
+    ]
+    for item in result["items"]:
+        amount = f"{item['grams']:.0f} g" + (" *" if item["assumed"] else "")
+        lines.append(
+            f"| {item['text']} | {amount} | {item['kcal']:.0f} | {item['protein']:.1f} g | "
+            f"{item['carbs']:.1f} g | {item['fat']:.1f} g |"
+        )
+    if result["assumed"]:
+        lines += ["", "\\* No amount given, so I counted one typical serving. Tell me the amounts for a closer number."]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Food composition table and meal-plan matcher")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    load = subparsers.add_parser("load", help="(Re)load the foods table from a CSV export")
+    load.add_argument("--csv", default=FOODS_CSV, help="CSV with name,aliases,kcal,protein,carbs,fat,serving_g,serving")
+    scan = subparsers.add_parser("scan", help="Total the foods in a text file")
+    scan.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "load":
+        count = load_foods(args.csv)
+        print("❌ Food table load failed, see log for details." if count == -1 else f"✅ Loaded {count} foods.")
+    elif args.command == "scan":
+        with open(args.path, encoding="utf-8") as f:
+            result = analyze_meal_text(f.read())
+        print(format_nutrition_summary(result))
+        print(f"({len(result['items'])} foods matched in {result['ms']:.1f} ms)")
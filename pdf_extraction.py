@@ -0,0 +1,151 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+import fitz  # PyMuPDF
+
+# Kept free of Streamlit/DB imports so process-pool workers can import it cheaply
+
+logger = logging.getLogger(__name__)
+
+# Limits for uploaded meal plans; anything beyond them is skipped and reported
+PDF_MAX_BYTES = int(os.getenv("FITNESS_PDF_MAX_BYTES", str(20 * 1024 * 1024)))
+PDF_MAX_PAGES = int(os.getenv("FITNESS_PDF_MAX_PAGES", "100"))
+PDF_TIMEOUT = float(os.getenv("FITNESS_PDF_TIMEOUT", "20"))
+
+# Pages per worker task, and worker processes (documents up to one task run inline)
+PDF_PAGES_PER_TASK = int(os.getenv("FITNESS_PDF_PAGES_PER_TASK", "8"))
+PDF_WORKERS = int(os.getenv("FITNESS_PDF_WORKERS", str(min(os.cpu_count() or 1, 4))))
+
+_COPY_CHUNK = 1024 * 1024
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PdfTooLarge(ValueError):
+    """Raised when an upload exceeds PDF_MAX_BYTES."""
+
+
+def _get_pool():
+    """Shared worker pool; spawned (not forked) because the app process runs threads."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _reset_pool():
+    """Drops a broken pool so the next extraction starts fresh workers."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def extract_page_range(path, start, end):
+    """Worker: returns the text of pages [start, end) as a list of strings."""
+    with fitz.open(path) as doc:
+        return [doc.load_page(number).get_text() for number in range(start, end)]
+
+
+def _spool(fileobj, max_bytes):
+    """Copies an upload to a temporary file in chunks, stopping once it exceeds `max_bytes`."""
+    size = getattr(fileobj, "size", None)
+    if size is not None and size > max_bytes:
+        raise PdfTooLarge(f"File is {size / 1e6:.1f} MB; the limit is {max_bytes / 1e6:.1f} MB.")
+    fileobj.seek(0)
+    written = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+        try:
+            while chunk := fileobj.read(_COPY_CHUNK):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise PdfTooLarge(f"File is larger than the {max_bytes / 1e6:.1f} MB limit.")
+                tmp_file.write(chunk)
+        except BaseException:
+            tmp_file.close()
+            os.unlink(tmp_file.name)
+            raise
+    return tmp_file.name
+
+
+def extract_pdf_text(fileobj, on_progress=None, max_pages=None, timeout=None, max_bytes=None):
+    """
+    Extracts the text of a PDF upload. Page ranges are extracted in parallel on a
+    process pool and joined once, in page order, at the end. `on_progress(done, total)`
+    is called as ranges finish. Pages past `max_pages` or not done within `timeout`
+    seconds are skipped.
+    Returns a dict with text, pages (in the document), pages_extracted and limited
+    (None, or a short reason why the text is partial). Raises PdfTooLarge.
+    """
+    max_pages = max_pages or PDF_MAX_PAGES
+    timeout = timeout or PDF_TIMEOUT
+    path = _spool(fileobj, max_bytes or PDF_MAX_BYTES)
+    started = time.perf_counter()
+    try:
+        with fitz.open(path) as doc:
+            page_count = len(doc)
+        wanted = min(page_count, max_pages)
+        limited = f"only the first {wanted} of {page_count} pages were read" if wanted < page_count else None
+
+        ranges = [(start, min(start + PDF_PAGES_PER_TASK, wanted)) for start in range(0, wanted, PDF_PAGES_PER_TASK)]
+        chunks = {}
+        if len(ranges) <= 1:
+            for start, end in ranges:
+                chunks[start] = extract_page_range(path, start, end)
+        else:
+            pool = _get_pool()
+            futures = {pool.submit(extract_page_range, path, start, end): start for start, end in ranges}
+            done = 0
+            try:
+                for future in as_completed(futures, timeout=timeout):
+                    chunks[futures[future]] = future.result()
+                    done += len(chunks[futures[future]])
+                    if on_progress:
+                        on_progress(done, wanted)
+            except FuturesTimeout:
+                for future in futures:
+                    future.cancel()
+                limited = (limited + "; " if limited else "") + f"stopped after {timeout:g}s"
+            except BrokenProcessPool as e:
+                # A worker died (e.g. out of memory); finish the remaining pages here
+                logger.warning("PDF worker pool failed, extracting inline: %s", e)
+                _reset_pool()
+                for start, end in ranges:
+                    if start not in chunks:
+                        chunks[start] = extract_page_range(path, start, end)
+
+        # One join at the end, in page order; ranges that didn't finish are marked
+        parts, extracted = [], 0
+        for start, end in ranges:
+            if start in chunks:
+                parts.extend(chunks[start])
+                extracted += len(chunks[start])
+            else:
+                parts.append(f"\n[pages {start + 1}-{end} not extracted]\n")
+        if limited and extracted < wanted:
+            limited += f" ({extracted} of {wanted} pages extracted)"
+        logger.info(
+            "Extracted %d/%d PDF pages in %.2fs%s", extracted, page_count,
+            time.perf_counter() - started, f" ({limited})" if limited else ""
+        )
+        return {
+            "text": "".join(parts),
+            "pages": page_count,
+            "pages_extracted": extracted,
+            "limited": limited,
+        }
+    finally:
+        try:
+            os.unlink(path)
+        except OSError as e: # Workers may still hold the file after a timeout
+            logger.warning("Could not remove temporary PDF %s: %s", path, e)
@@ -1,5 +1,6 @@
 import streamlit as st
-from db import query_db, execute_db
+from db import query_db, execute_db, bump_data_version
+from goal_progress import log_weigh_in
 
 
 def manage_profile(user_id):
@@ -60,6 +61,9 @@ def manage_profile(user_id):
                 (new_name.strip(), new_age, new_gender, new_height, new_weight, user_id)
             )
             if result != -1:
+                bump_data_version(user_id) # Refresh cached views that show profile data
+                if new_weight != weight:
+                    log_weigh_in(user_id, new_weight) # Updates weight-goal progress
                 st.success("✅ Profile updated successfully!")
                 # Keep session state in sync so the sidebar name updates immediately
                 if "user" in st.session_state:
@@ -0,0 +1,115 @@
+import cProfile
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# Profiling is opt-in: set FITNESS_PROFILE=1 before `streamlit run app.py`
+PROFILE_ENABLED = os.getenv("FITNESS_PROFILE", "0") == "1"
+
+# Directory where captured cProfile dumps (.prof) are written
+PROFILE_DIR = os.getenv("FITNESS_PROFILE_DIR", "profiles")
+
+# Segments a page's render time is broken down into; the rest is reported as "other"
+SEGMENTS = ("db", "llm", "chart")
+
+# Thread-local state: Streamlit renders each session on its own script thread
+local_state = threading.local()
+
+
+@contextmanager
+def profile_page(page_name, capture=False):
+    """
+    Times one routed page render and breaks it down into DB, LLM and chart segments.
+    When `capture` is True a cProfile dump of the render is saved under PROFILE_DIR
+    (open it with snakeviz, or convert it with flameprof for a flamegraph).
+    Yields the stats dict, or None when profiling is disabled.
+    """
+    if not (PROFILE_ENABLED or capture):
+        yield None
+        return
+
+    stats = {
+        "page": page_name,
+        "total": 0.0,
+        "other": 0.0,
+        "segments": dict.fromkeys(SEGMENTS, 0.0),
+        "calls": dict.fromkeys(SEGMENTS, 0),
+        "profile_path": None,
+    }
+    local_state.page = stats
+    local_state.active_segment = None
+
+    profile = cProfile.Profile() if capture else None
+    start = time.perf_counter()
+    if profile:
+        profile.enable()
+    try:
+        yield stats
+    finally:
+        if profile:
+            profile.disable()
+        stats["total"] = time.perf_counter() - start
+        stats["other"] = max(stats["total"] - sum(stats["segments"].values()), 0.0)
+        local_state.page = None
+        if profile:
+            stats["profile_path"] = _dump_profile(profile, page_name)
+        logger.info(
+            "Page %s rendered in %.1f ms (db %.1f ms / %d, llm %.1f ms / %d, chart %.1f ms / %d)",
+            page_name, stats["total"] * 1000,
+            stats["segments"]["db"] * 1000, stats["calls"]["db"],
+            stats["segments"]["llm"] * 1000, stats["calls"]["llm"],
+            stats["segments"]["chart"] * 1000, stats["calls"]["chart"],
+        )
+
+
+@contextmanager
+def segment(kind):
+    """
+    Attributes the wrapped block's wall time to `kind` on the page being profiled.
+    Nested segments are counted once, against the outermost one.
+    """
+    stats = getattr(local_state, "page", None)
+    if stats is None or local_state.active_segment is not None:
+        yield
+        return
+
+    local_state.active_segment = kind
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats["segments"][kind] += time.perf_counter() - start
+        stats["calls"][kind] += 1
+        local_state.active_segment = None
+
+
+def timed(kind):
+    """Decorator form of `segment` for functions that always belong to one segment."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with segment(kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _dump_profile(profile, page_name):
+    """Writes a cProfile dump for the page and returns its path (None on failure)."""
+    safe_name = re.sub(r"[^A-Za-z0-9]+", "_", page_name).strip("_") or "page"
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    path = os.path.join(PROFILE_DIR, f"{safe_name}_{timestamp}.prof")
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile.dump_stats(path)
+    except OSError as e:
+        logger.error("Failed to write profile %s: %s", path, e)
+        return None
+    return path
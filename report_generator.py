@@ -1,75 +1,138 @@
+import argparse
+import hashlib
+import io
+import json
+import logging
 import os
-from datetime import datetime
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date, timedelta
+from xml.sax.saxutils import escape
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from db import query_db
+from db import (
+    query_db, query_all_shards, execute_transaction, get_checkpoint, checkpoint_statement,
+    shard_for_user, SHARD_COUNT, to_day, to_epoch
+)
+from chat_compression import reply_text
 
-def generate_user_report(user_id, user_name):
-    """
-    Generates a personalized PDF fitness report for the user.
-    
-    Args:
-        user_id (int): The ID of the user.
-        user_name (str): The name of the user.
-    
-    Returns:
-        str: The file path to the generated PDF.
-    """
-    # Define the output file path
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"Fitness_Report_{user_name}_{timestamp}.pdf"
-    filepath = os.path.join("reports", filename)
+logger = logging.getLogger(__name__)
 
-    # Ensure the 'reports' directory exists
-    os.makedirs("reports", exist_ok=True)
+REPORT_DIR = "reports"
+BULK_JOB = "bulk_reports"
 
-    # Fetch user data
-    user_data = query_db("SELECT * FROM users WHERE id = ?", (user_id,), fetchone=True)
-    if not user_data:
-        raise ValueError("User not found")
+# Optional on-disk cache of finished in-app reports, capped at FITNESS_REPORT_CACHE_MB
+# (least recently downloaded reports are evicted first); 0 renders every report in memory only
+REPORT_CACHE_DIR = os.getenv("FITNESS_REPORT_CACHE_DIR", os.path.join(REPORT_DIR, "cache"))
+REPORT_CACHE_MB = float(os.getenv("FITNESS_REPORT_CACHE_MB", "0"))
+_cache_lock = threading.Lock()
 
-    # Calculate BMI
-    height_m = user_data['height'] / 100 if user_data['height'] else 0
-    bmi = round(user_data['weight'] / (height_m ** 2), 2) if height_m > 0 else 0
+# Built once per process (each bulk worker builds its own copy at startup)
+_styles = None
 
-    # Fetch goals
-    goals = query_db("SELECT * FROM goals WHERE user_id = ?", (user_id,))
 
-    # Fetch recent workouts (last 14 days)
-    workouts = query_db(
-        "SELECT date, exercise, duration, calories_burned FROM workouts WHERE user_id = ? ORDER BY date DESC LIMIT 20",
-        (user_id,)
-    )
+def report_styles():
+    """The stylesheet, title style and table styles shared by every report."""
+    global _styles
+    if _styles is None:
+        sheet = getSampleStyleSheet()
+        _styles = {
+            "sheet": sheet,
+            "title": ParagraphStyle(
+                'CustomTitle',
+                parent=sheet['Heading1'],
+                fontSize=24,
+                spaceAfter=30,
+                alignment=1  # Center
+            ),
+            "profile_table": _table_style(colors.lightgrey, 10),
+            "goal_table": _table_style(colors.lightblue, 9),
+            "workout_table": _table_style(colors.lightgreen, 9),
+        }
+    return _styles
+
+
+def _table_style(header_color, font_size):
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), header_color),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), font_size),
+    ])
+
 
-    # Fetch recent chat logs (last 10)
-    chat_logs = query_db(
-        "SELECT user_message, bot_reply, timestamp FROM chat_logs WHERE user_id = ? ORDER BY timestamp DESC LIMIT 10",
-        (user_id,)
+def _per_user_limited(columns, table, user_ids, order, limit, shard):
+    """Rows of many users in one query, at most `limit` per user (the first ones by `order`)."""
+    where = f"WHERE user_id IN ({','.join('?' * len(user_ids))})"
+    if limit is None:
+        return query_db(f"SELECT {columns} FROM {table} {where} ORDER BY user_id, {order}", user_ids, shard=shard)
+    return query_db(
+        f"SELECT * FROM (SELECT {columns}, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY {order}) AS position "
+        f"FROM {table} {where}) WHERE position <= ? ORDER BY user_id, position",
+        [*user_ids, limit],
+        shard=shard
     )
 
+
+def fetch_report_data(user_ids, max_workout_entries=20, max_goal_entries=None, max_chat_entries=10):
+    """
+    Everything a report needs for several users, in a handful of batched queries
+    (one per table and shard). Returns {user_id: data} with plain dicts, so it can be
+    sent to worker processes; users that don't exist are left out.
+    """
+    user_ids = [int(user_id) for user_id in user_ids]
+    placeholders = ",".join("?" * len(user_ids))
+    users = query_db(f"SELECT id, name, age, gender, height, weight FROM users WHERE id IN ({placeholders})", user_ids)
+    data = {
+        row["id"]: {"user": dict(row), "goals": [], "workouts": [], "chat_logs": []}
+        for row in users
+    }
+
+    by_shard = defaultdict(list)
+    for user_id in data:
+        by_shard[shard_for_user(user_id) if SHARD_COUNT > 1 else None].append(user_id)
+    for shard, ids in by_shard.items():
+        for table, columns, order, limit in (
+            ("goals", "*", "id", max_goal_entries),
+            ("workouts", "user_id, date, exercise, duration, calories_burned", "day DESC, id DESC", max_workout_entries),
+            ("chat_logs", "user_id, user_message, bot_reply, timestamp", "ts DESC, id DESC", max_chat_entries),
+        ):
+            for row in _per_user_limited(columns, table, ids, order, limit, shard):
+                row = dict(row)
+                if table == "chat_logs":
+                    row["bot_reply"] = reply_text(row["bot_reply"])
+                data[row["user_id"]][table].append(row)
+    return data
+
+
+def render_report(data, output):
+    """Builds the PDF for one user's prefetched data into `output` (a path or a binary file object)."""
+    styles = report_styles()
+    sheet = styles["sheet"]
+    user_data = data["user"]
+    user_name = user_data["name"] or "Member"
+
+    # Calculate BMI
+    height_m = user_data['height'] / 100 if user_data['height'] else 0
+    bmi = round(user_data['weight'] / (height_m ** 2), 2) if height_m > 0 and user_data['weight'] else 0
+
     # Create PDF document
-    doc = SimpleDocTemplate(filepath, pagesize=letter)
-    styles = getSampleStyleSheet()
+    doc = SimpleDocTemplate(output, pagesize=letter)
     story = []
 
     # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        alignment=1  # Center
-    )
-    story.append(Paragraph("🏋️ Fitness Assistant – Personalized Report", title_style))
-    story.append(Paragraph(f"Prepared for: <b>{user_name}</b>", styles['Normal']))
-    story.append(Paragraph(f"Date: {datetime.now().strftime('%B %d, %Y')}", styles['Normal']))
+    story.append(Paragraph("🏋️ Fitness Assistant – Personalized Report", styles["title"]))
+    story.append(Paragraph(f"Prepared for: <b>{escape(user_name)}</b>", sheet['Normal']))
+    story.append(Paragraph(f"Date: {datetime.now().strftime('%B %d, %Y')}", sheet['Normal']))
     story.append(Spacer(1, 0.3 * inch))
 
     # --- Section: User Profile & BMI ---
-    story.append(Paragraph("👤 User Profile & BMI", styles['Heading2']))
+    story.append(Paragraph("👤 User Profile & BMI", sheet['Heading2']))
     profile_data = [
         ["Name", user_data['name']],
         ["Age", str(user_data['age']) if user_data['age'] else "N/A"],
@@ -79,42 +142,34 @@ def generate_user_report(user_id, user_name):
         ["BMI", f"{bmi} ({get_bmi_category(bmi)})" if bmi > 0 else "N/A"]
     ]
     profile_table = Table(profile_data, colWidths=[2*inch, 3*inch])
-    profile_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-    ]))
+    profile_table.setStyle(styles["profile_table"])
     story.append(profile_table)
     story.append(Spacer(1, 0.2 * inch))
 
     # --- Section: Fitness Goals ---
-    story.append(Paragraph("🎯 Fitness Goals", styles['Heading2']))
+    story.append(Paragraph("🎯 Fitness Goals", sheet['Heading2']))
+    goals = data["goals"]
     if goals:
         goal_data = [["Goal Type", "Target", "Current", "Status", "Period"]]
         for g in goals:
             period = f"{g['start_date']} → {g['end_date']}" if g['start_date'] and g['end_date'] else "N/A"
             goal_data.append([
-                g['goal_type'].replace('_', ' ').title(),
+                (g['goal_type'] or "").replace('_', ' ').title(),
                 str(g['target_value']),
                 str(g['current_value']),
-                g['status'].title(),
+                (g['status'] or "").title(),
                 period
             ])
         goal_table = Table(goal_data, colWidths=[1.5*inch, 1*inch, 1*inch, 1*inch, 2*inch])
-        goal_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ]))
+        goal_table.setStyle(styles["goal_table"])
         story.append(goal_table)
     else:
-        story.append(Paragraph("No goals have been set yet.", styles['Normal']))
+        story.append(Paragraph("No goals have been set yet.", sheet['Normal']))
     story.append(Spacer(1, 0.2 * inch))
 
     # --- Section: Workout History ---
-    story.append(Paragraph("🏋️ Recent Workouts", styles['Heading2']))
+    story.append(Paragraph("🏋️ Recent Workouts", sheet['Heading2']))
+    workouts = data["workouts"]
     if workouts:
         workout_data = [["Date", "Exercise", "Duration (min)", "Calories"]]
         for w in workouts:
@@ -125,30 +180,104 @@ def generate_user_report(user_id, user_name):
                 f"{w['calories_burned']:.0f}" if w['calories_burned'] else "N/A"
             ])
         workout_table = Table(workout_data, colWidths=[1.2*inch, 2.5*inch, 1.2*inch, 1.2*inch])
-        workout_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgreen),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ]))
+        workout_table.setStyle(styles["workout_table"])
         story.append(workout_table)
     else:
-        story.append(Paragraph("No workouts logged yet.", styles['Normal']))
+        story.append(Paragraph("No workouts logged yet.", sheet['Normal']))
     story.append(Spacer(1, 0.2 * inch))
 
     # --- Section: Chat Summary ---
-    story.append(Paragraph("💬 Chat Summary (Last 10 Interactions)", styles['Heading2']))
+    chat_logs = data["chat_logs"]
+    story.append(Paragraph(f"💬 Chat Summary (Last {len(chat_logs) or 10} Interactions)", sheet['Heading2']))
     if chat_logs:
         for log in chat_logs:
-            story.append(Paragraph(f"<b>You:</b> {log['user_message']}", styles['Normal']))
-            story.append(Paragraph(f"<b>Nova AI:</b> {log['bot_reply']}", styles['Normal']))
+            # Chat text is escaped so "<" or "&" in a message can't break the paragraph markup
+            story.append(Paragraph(f"<b>You:</b> {escape(log['user_message'] or '')}", sheet['Normal']))
+            story.append(Paragraph(f"<b>Nova AI:</b> {escape(log['bot_reply'] or '')}", sheet['Normal']))
             story.append(Spacer(1, 0.1 * inch))
     else:
-        story.append(Paragraph("No chat history found.", styles['Normal']))
+        story.append(Paragraph("No chat history found.", sheet['Normal']))
 
     # Build the PDF
     doc.build(story)
-    return filepath
+    return output
+
+
+def generate_user_report(user_id, user_name, max_workout_entries=20, max_goal_entries=None, max_chat_entries=10):
+    """
+    Generates a personalized PDF fitness report for the user, in memory.
+
+    Args:
+        user_id (int): The ID of the user.
+        user_name (str): The name of the user.
+        max_workout_entries, max_goal_entries, max_chat_entries (int or None): Rows per section.
+
+    Returns:
+        tuple: (download file name, PDF bytes).
+    """
+    filename = f"Fitness_Report_{user_name}_{datetime.now().strftime('%Y%m%d')}.pdf"
+    data = fetch_report_data([user_id], max_workout_entries, max_goal_entries, max_chat_entries).get(int(user_id))
+    if not data:
+        raise ValueError("User not found")
+
+    # The report only changes with its data (and the date printed on it), so that is the cache key
+    key = hashlib.sha256(
+        json.dumps([data, date.today().isoformat()], sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    pdf = _cache_get(key)
+    if pdf is None:
+        buffer = io.BytesIO()
+        render_report(data, buffer)
+        pdf = buffer.getvalue()
+        _cache_put(key, pdf)
+    return filename, pdf
+
+
+def _cache_get(key):
+    """Cached report bytes, or None; a hit marks the file as recently used."""
+    if REPORT_CACHE_MB <= 0:
+        return None
+    path = os.path.join(REPORT_CACHE_DIR, f"{key}.pdf")
+    try:
+        with open(path, "rb") as f:
+            pdf = f.read()
+        os.utime(path)
+        return pdf
+    except OSError:
+        return None
+
+
+def _cache_put(key, pdf):
+    """Stores a report and evicts least recently used ones until the cache fits REPORT_CACHE_MB."""
+    if REPORT_CACHE_MB <= 0:
+        return
+    limit = REPORT_CACHE_MB * 1024 * 1024
+    if len(pdf) > limit:
+        return
+    with _cache_lock:
+        try:
+            os.makedirs(REPORT_CACHE_DIR, exist_ok=True)
+            path = os.path.join(REPORT_CACHE_DIR, f"{key}.pdf")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(pdf)
+            os.replace(tmp_path, path) # Readers never see a half-written report
+            entries = []
+            with os.scandir(REPORT_CACHE_DIR) as it:
+                for entry in it:
+                    if entry.name.endswith(".pdf"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, old_path in sorted(entries):
+                if total <= limit:
+                    break
+                os.remove(old_path)
+                total -= size
+                logger.debug("Evicted cached report %s", old_path)
+        except OSError as e: # The cache is an optimization; never fail the download over it
+            logger.warning("Could not cache report: %s", e)
+
 
 def get_bmi_category(bmi):
     """Returns BMI category text for display in the report."""
@@ -159,4 +288,130 @@ def get_bmi_category(bmi):
     elif 25 <= bmi < 30:
         return "Overweight"
     else:
-        return "Obese"
\ No newline at end of file
+        return "Obese"
+
+
+def _init_worker():
+    """Bulk worker start-up: build the styles once, before the first report."""
+    report_styles()
+
+
+def render_report_batch(batch, out_dir):
+    """Worker: renders (user_id, data) pairs to out_dir. Returns (written paths, [(user_id, error)])."""
+    written, failed = [], []
+    for user_id, data in batch:
+        path = os.path.join(out_dir, f"Fitness_Report_{user_id}.pdf")
+        try:
+            render_report(data, path)
+            written.append(path)
+        except Exception as e: # One bad report shouldn't stop the rest of the batch
+            failed.append((user_id, f"{type(e).__name__}: {e}"))
+    return written, failed
+
+
+def select_report_users(user_ids=None, active_days=None):
+    """Ids of the users to report on, ascending: all, the given ones, and/or those active in the last N days."""
+    users = [row["id"] for row in query_db("SELECT id FROM users ORDER BY id")]
+    if user_ids:
+        wanted = {int(user_id) for user_id in user_ids}
+        users = [user_id for user_id in users if user_id in wanted]
+    if active_days is not None:
+        since = date.today() - timedelta(days=active_days)
+        active = {row["user_id"] for row in query_all_shards(
+            "SELECT user_id FROM workouts WHERE day >= ? UNION SELECT user_id FROM chat_logs WHERE ts >= ?",
+            (to_day(since), to_epoch(since))
+        )}
+        users = [user_id for user_id in users if user_id in active]
+    return users
+
+
+def _bulk_job(run, user_ids, active_days):
+    """Checkpoint name of a run; the user filters are part of it, so differently filtered runs don't share progress."""
+    if not user_ids and active_days is None:
+        return f"{BULK_JOB}:{run}"
+    filters = json.dumps({"user_ids": sorted({int(user_id) for user_id in user_ids or ()}), "active_days": active_days})
+    return f"{BULK_JOB}:{run}:{hashlib.sha1(filters.encode()).hexdigest()[:12]}"
+
+
+def generate_reports(user_ids=None, active_days=None, workers=None, batch_size=25, run=None, out_dir=None, reset=False):
+    """
+    Generates a report for every selected user across a process pool. Data is prefetched
+    one batch at a time in batched queries, rendered in parallel, and committed in user-id
+    order together with a checkpoint per run (default: the ISO week) and filter set, so
+    rerunning the same run resumes after the last finished batch. The checkpoint never
+    moves past a failed user, so a rerun retries it.
+    Returns a dict with reports, failed [(user_id, error)], seconds, per_second and out_dir.
+    """
+    workers = workers or os.cpu_count() or 1
+    run = run or date.today().strftime("%G-W%V")
+    out_dir = out_dir or os.path.join(REPORT_DIR, run)
+    job = _bulk_job(run, user_ids, active_days)
+    os.makedirs(out_dir, exist_ok=True)
+
+    if reset:
+        execute_transaction([checkpoint_statement(job, 0)])
+    after = get_checkpoint(job)
+    users = [user_id for user_id in select_report_users(user_ids, active_days) if user_id > after]
+    logger.info("Bulk reports (%s): %d users after user %d, %d workers", job, len(users), after, workers)
+
+    reports, failed = 0, []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        pending = deque()
+        for i in range(0, len(users), batch_size):
+            ids = users[i:i + batch_size]
+            data = fetch_report_data(ids)
+            batch = [(user_id, data[user_id]) for user_id in ids if user_id in data]
+            pending.append((ids, pool.submit(render_report_batch, batch, out_dir)))
+            # Keep a bounded number of batches in flight so memory stays flat
+            while len(pending) >= workers * 2:
+                reports += _commit_batch(pending.popleft(), job, failed)
+        while pending:
+            reports += _commit_batch(pending.popleft(), job, failed)
+
+    seconds = time.perf_counter() - started
+    per_second = reports / seconds if seconds > 0 else 0.0
+    logger.info("Bulk reports (%s): %d written, %d failed in %.1fs (%.1f reports/s)", job, reports, len(failed), seconds, per_second)
+    return {"reports": reports, "failed": failed, "seconds": seconds, "per_second": per_second, "out_dir": out_dir}
+
+
+def _commit_batch(item, job, failed):
+    """
+    Waits for one batch and advances the run's checkpoint past its users, but only up to
+    the first failure of the run: batches are committed in order, so everything before
+    the checkpoint succeeded.
+    """
+    ids, future = item
+    written, batch_failed = future.result()
+    if not failed:
+        first_failed = min((user_id for user_id, _ in batch_failed), default=None)
+        done = [user_id for user_id in ids if first_failed is None or user_id < first_failed]
+        if done and execute_transaction([checkpoint_statement(job, done[-1])]) == -1:
+            raise RuntimeError(f"Failed to save the report checkpoint at user {done[-1]}")
+    failed.extend(batch_failed)
+    return len(written)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fitness report generation")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bulk = subparsers.add_parser("bulk", help="Generate reports for all (or selected) users")
+    bulk.add_argument("--user-id", type=int, action="append", help="Only this user (repeatable)")
+    bulk.add_argument("--active-days", type=int, default=None, help="Only users with workouts or chats in the last N days")
+    bulk.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    bulk.add_argument("--batch-size", type=int, default=25, help="Users per prefetch/render batch")
+    bulk.add_argument("--run", default=None, help="Run label used for the output folder and checkpoint (default: ISO week)")
+    bulk.add_argument("--out-dir", default=None, help="Output folder (default: reports/<run>)")
+    bulk.add_argument("--reset", action="store_true", help="Ignore the checkpoint and regenerate every report")
+    args = parser.parse_args()
+
+    if args.command == "bulk":
+        result = generate_reports(
+            args.user_id, args.active_days, args.workers, args.batch_size, args.run, args.out_dir, args.reset
+        )
+        print(
+            f"✅ {result['reports']} reports in {result['out_dir']} in {result['seconds']:.1f}s "
+            f"({result['per_second']:.1f} reports/s)"
+        )
+        for user_id, error in result["failed"]:
+            print(f"❌ User {user_id}: {error}")
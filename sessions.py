@@ -0,0 +1,169 @@
+import argparse
+import bcrypt
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import statistics
+import time
+from db import query_db, execute_db
+
+logger = logging.getLogger(__name__)
+
+# Logins are remembered in a signed cookie backed by a row in the sessions table, so a
+# refresh or new tab is restored with one primary-key lookup instead of bcrypt.
+COOKIE_NAME = "fitnova_session"
+SESSION_DAYS = int(os.getenv("FITNESS_SESSION_DAYS", "14"))
+SECRET_FILE = os.getenv("FITNESS_SESSION_SECRET_FILE", ".session_secret")
+# Secure cookies are only sent over HTTPS (browsers also accept them on http://localhost);
+# set FITNESS_COOKIE_SECURE=0 only for plain-HTTP deployments on other hosts
+COOKIE_SECURE = os.getenv("FITNESS_COOKIE_SECURE", "1") == "1"
+
+_secret = None
+
+
+def _get_secret():
+    """HMAC key: FITNESS_SESSION_SECRET, else a random key generated once into SECRET_FILE."""
+    global _secret
+    if _secret is None:
+        configured = os.getenv("FITNESS_SESSION_SECRET")
+        if configured:
+            _secret = configured.encode("utf-8")
+        else:
+            try:
+                with open(SECRET_FILE, "rb") as f:
+                    _secret = f.read().strip()
+            except FileNotFoundError:
+                _secret = _create_secret_file()
+    return _secret
+
+
+def _create_secret_file():
+    """
+    Writes a new random key to SECRET_FILE, or returns the one another process wrote first.
+    The key is written to a temporary file and linked into place, so SECRET_FILE never
+    appears half-written.
+    """
+    secret = secrets.token_hex(32).encode("ascii")
+    temporary = f"{SECRET_FILE}.{os.getpid()}.tmp"
+    fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(secret)
+    try:
+        os.link(temporary, SECRET_FILE)
+        logger.info("Generated a session signing key in %s", SECRET_FILE)
+    except FileExistsError: # another process got there first: use its key
+        with open(SECRET_FILE, "rb") as f:
+            secret = f.read().strip()
+    finally:
+        os.unlink(temporary)
+    return secret
+
+
+def _signature(token):
+    return hmac.new(_get_secret(), token.encode("ascii"), hashlib.sha256).hexdigest()
+
+
+def _token_hash(token):
+    return hashlib.sha256(token.encode("ascii")).hexdigest()
+
+
+def _verified_token(cookie_value):
+    """The token from a "token.signature" cookie value, or None if the signature doesn't match."""
+    token, _, signature = (cookie_value or "").partition(".")
+    if not token or not signature or not hmac.compare_digest(signature, _signature(token)):
+        return None
+    return token
+
+
+def verify_password(user, password):
+    """True if `password` matches the user row's bcrypt hash."""
+    return bcrypt.checkpw(password.encode('utf-8'), user["password"].encode('utf-8'))
+
+
+def create_session(user_id, days=None):
+    """Stores a new session for the user and returns the signed cookie value (or None on failure)."""
+    token = secrets.token_urlsafe(32)
+    # Expired sessions are cleared here, where the expiry index makes it cheap
+    execute_db("DELETE FROM sessions WHERE expires_at <= CURRENT_TIMESTAMP")
+    result = execute_db(
+        "INSERT INTO sessions (token_hash, user_id, expires_at) VALUES (?, ?, datetime('now', ?))",
+        (_token_hash(token), user_id, f"+{days or SESSION_DAYS} days")
+    )
+    if result == -1:
+        return None
+    return f"{token}.{_signature(token)}"
+
+
+def restore_session(cookie_value):
+    """The user row for a valid, unexpired session cookie, else None. No password hashing involved."""
+    token = _verified_token(cookie_value)
+    if token is None:
+        return None
+    return query_db(
+        "SELECT u.* FROM sessions s JOIN users u ON u.id = s.user_id "
+        "WHERE s.token_hash = ? AND s.expires_at > CURRENT_TIMESTAMP",
+        (_token_hash(token),),
+        fetchone=True
+    )
+
+
+def end_session(cookie_value):
+    """Deletes the session behind a cookie (logout); the cookie is useless afterwards."""
+    token = _verified_token(cookie_value)
+    if token is not None:
+        execute_db("DELETE FROM sessions WHERE token_hash = ?", (_token_hash(token),))
+
+
+def end_user_sessions(user_id):
+    """Logs a user out everywhere (e.g. after a password change)."""
+    execute_db("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+
+def benchmark(runs=20):
+    """
+    Median latency of a password login (user lookup + bcrypt check) versus restoring a
+    session from its cookie, using a throwaway user. Returns a dict of milliseconds.
+    """
+    email = f"benchmark-{secrets.token_hex(4)}@example.invalid"
+    password = secrets.token_urlsafe(12)
+    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    user_id = execute_db("INSERT INTO users (name, email, password) VALUES (?, ?, ?)", ("Benchmark", email, hashed))
+    try:
+        login_ms, restore_ms = [], []
+        for _ in range(runs):
+            started = time.perf_counter()
+            user = query_db("SELECT * FROM users WHERE email = ?", (email,), fetchone=True)
+            assert bcrypt.checkpw(password.encode("utf-8"), user["password"].encode("utf-8"))
+            login_ms.append((time.perf_counter() - started) * 1000)
+        cookie = create_session(user_id)
+        for _ in range(runs):
+            started = time.perf_counter()
+            assert restore_session(cookie) is not None
+            restore_ms.append((time.perf_counter() - started) * 1000)
+    finally:
+        end_user_sessions(user_id)
+        execute_db("DELETE FROM users WHERE id = ?", (user_id,))
+    return {"login_ms": statistics.median(login_ms), "restore_ms": statistics.median(restore_ms)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Login sessions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench = subparsers.add_parser("benchmark", help="Compare password login with session restore latency")
+    bench.add_argument("--runs", type=int, default=20)
+    subparsers.add_parser("purge", help="Delete expired sessions")
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        result = benchmark(args.runs)
+        print(
+            f"Password login (lookup + bcrypt): {result['login_ms']:.1f} ms median\n"
+            f"Session restore (signed cookie + indexed lookup): {result['restore_ms']:.2f} ms median"
+        )
+    elif args.command == "purge":
+        if execute_db("DELETE FROM sessions WHERE expires_at <= CURRENT_TIMESTAMP") == -1:
+            print("❌ Purge failed, see log for details.")
+        else:
+            print("✅ Expired sessions removed.")
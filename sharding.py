@@ -0,0 +1,207 @@
+import argparse
+import logging
+import os
+import sqlite3
+from collections import defaultdict
+from db import (
+    DB_PATH, SHARD_COUNT, SHARDED_TABLES, query_db, execute_db, query_all_shards,
+    shard_indexes, shard_path, shard_for_user, forget_shard_assignment,
+)
+
+logger = logging.getLogger(__name__)
+
+# Admin tooling for FITNESS_SHARDS > 1: move existing data into shards, inspect them
+# and move users between shards. Running app processes cache user -> shard assignments,
+# so restart them (or call db.forget_shard_assignment) after a rebalance.
+
+# Copy order matters: goals are copied after workouts and weigh-ins so the progress
+# triggers in the target don't add history that current_value already includes.
+# Workout rollups aren't copied; the target's triggers rebuild them from the copied workouts.
+_COPY_ORDER = ("workouts", "weigh_ins", "chat_logs", "goals", "goal_suggestions")
+
+# Goals go first so deleting workouts doesn't fire progress triggers for them
+_DELETE_ORDER = ("goals", "workouts", "weigh_ins", "chat_logs", "goal_suggestions", "workout_rollups")
+
+
+def _connect(path):
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def _columns(connection, table):
+    return [row["name"] for row in connection.execute(f"PRAGMA table_info({table})")]
+
+
+def _copy_rows(source, target, table, user_id, chat_log_ids=None):
+    """Copies one user's rows of `table`; ids are reassigned by the target. Returns {old_id: new_id}."""
+    columns = [c for c in _columns(target, table) if c != "id" and c in _columns(source, table)]
+    insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    id_map = {}
+    for row in source.execute(f"SELECT * FROM {table} WHERE user_id = ? ORDER BY id", (user_id,)):
+        values = [row[c] for c in columns]
+        if chat_log_ids is not None and "chat_log_id" in columns:
+            index = columns.index("chat_log_id")
+            values[index] = chat_log_ids.get(values[index], values[index])
+        cursor = target.execute(insert, values)
+        id_map[row["id"]] = cursor.lastrowid
+    return id_map
+
+
+def move_user(user_id, target_shard, source_path=None):
+    """
+    Moves all of a user's per-user rows to `target_shard`. The target is written and
+    committed first, then the directory is updated, then the source rows are deleted,
+    so an interrupted move leaves the user readable; re-running it is safe because
+    leftovers in the target are cleared before copying.
+    Returns the number of rows copied.
+    """
+    source_path = source_path or shard_path(shard_for_user(user_id))
+    target_path = shard_path(target_shard)
+    if os.path.abspath(source_path) == os.path.abspath(target_path):
+        return 0
+
+    source, target = _connect(source_path), _connect(target_path)
+    try:
+        with target:
+            for table in _DELETE_ORDER:
+                target.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+            copied = 0
+            chat_log_ids = {}
+            for table in _COPY_ORDER:
+                id_map = _copy_rows(source, target, table, user_id, chat_log_ids)
+                if table == "chat_logs":
+                    chat_log_ids = id_map
+                copied += len(id_map)
+
+        execute_db(
+            "INSERT INTO user_shards (user_id, shard) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET shard = excluded.shard",
+            (user_id, target_shard)
+        )
+        forget_shard_assignment(user_id)
+
+        with source:
+            for table in _DELETE_ORDER:
+                source.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+    finally:
+        source.close()
+        target.close()
+
+    logger.info("Moved user %s (%d rows) from %s to shard %d", user_id, copied, source_path, target_shard)
+    return copied
+
+
+def split_main_database():
+    """
+    One-off migration: moves per-user rows that still live in DB_PATH (from before
+    sharding was enabled) into each user's shard. Returns (users_moved, rows_copied).
+    """
+    user_ids = set()
+    for table in SHARDED_TABLES:
+        user_ids.update(row["user_id"] for row in query_db(f"SELECT DISTINCT user_id FROM {table}"))
+    users = rows = 0
+    for user_id in sorted(u for u in user_ids if u is not None):
+        rows += move_user(user_id, shard_for_user(user_id), source_path=DB_PATH)
+        users += 1
+    return users, rows
+
+
+def shard_stats():
+    """Per-shard row counts (users, each per-user table) plus totals across all shards."""
+    stats = {}
+    for shard in shard_indexes():
+        counts = {"users": query_db(
+            "SELECT COUNT(*) AS n FROM user_shards WHERE shard = ?", (shard,), fetchone=True
+        )["n"]}
+        for table in SHARDED_TABLES:
+            counts[table] = query_db(f"SELECT COUNT(*) AS n FROM {table}", shard=shard, fetchone=True)["n"]
+        stats[shard] = counts
+
+    # Admin analytics go through the fan-out helper and are combined here
+    minutes = query_all_shards("SELECT COALESCE(SUM(duration), 0) AS minutes FROM workouts")
+    active = query_all_shards("SELECT COUNT(*) AS n FROM goals WHERE status = 'active'")
+    totals = {table: sum(counts[table] for counts in stats.values()) for table in SHARDED_TABLES}
+    totals["workout_minutes"] = sum(row["minutes"] for row in minutes)
+    totals["active_goals"] = sum(row["n"] for row in active)
+    return stats, totals
+
+
+def user_loads():
+    """Returns {user_id: (shard, rows)} where rows counts the user's per-user rows."""
+    loads = defaultdict(int)
+    for table in SHARDED_TABLES:
+        for row in query_all_shards(f"SELECT user_id, COUNT(*) AS n FROM {table} GROUP BY user_id"):
+            loads[row["user_id"]] += row["n"]
+    return {user_id: (shard_for_user(user_id), rows) for user_id, rows in loads.items()}
+
+
+def plan_rebalance(max_moves=50):
+    """
+    Greedy plan that repeatedly moves the user that best closes the gap from the heaviest
+    shard to the lightest one, until no move narrows the gap. Returns [(user_id, from, to)].
+    """
+    loads = user_loads()
+    shard_rows = {shard: 0 for shard in shard_indexes()}
+    by_shard = defaultdict(list)
+    for user_id, (shard, rows) in loads.items():
+        shard_rows[shard] += rows
+        by_shard[shard].append((rows, user_id))
+
+    moves = []
+    while len(moves) < max_moves:
+        heaviest = max(shard_rows, key=shard_rows.get)
+        lightest = min(shard_rows, key=shard_rows.get)
+        gap = shard_rows[heaviest] - shard_rows[lightest]
+        # Moving a user of size r changes the gap to |gap - 2r|, so only r < gap helps
+        candidates = [c for c in by_shard[heaviest] if 0 < c[0] < gap]
+        if not candidates:
+            break
+        rows, user_id = min(candidates, key=lambda c: abs(gap - 2 * c[0]))
+        by_shard[heaviest].remove((rows, user_id))
+        by_shard[lightest].append((rows, user_id))
+        shard_rows[heaviest] -= rows
+        shard_rows[lightest] += rows
+        moves.append((user_id, heaviest, lightest))
+    return moves
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shard maintenance (requires FITNESS_SHARDS > 1)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("split", help="Move per-user rows from the main database into shards")
+    subparsers.add_parser("stats", help="Show row counts per shard and totals")
+    rebalance = subparsers.add_parser("rebalance", help="Move users between shards")
+    rebalance.add_argument("--user-id", type=int, help="Move this user...")
+    rebalance.add_argument("--to", type=int, help="...to this shard")
+    rebalance.add_argument("--auto", action="store_true", help="Plan moves that even out shard sizes")
+    rebalance.add_argument("--max-moves", type=int, default=50, help="Upper bound for --auto")
+    rebalance.add_argument("--dry-run", action="store_true", help="Only print the --auto plan")
+    args = parser.parse_args()
+
+    if SHARD_COUNT <= 1:
+        parser.error("sharding is off; set FITNESS_SHARDS to the number of shards first")
+
+    if args.command == "split":
+        users, rows = split_main_database()
+        print(f"✅ Moved {rows} rows for {users} users into {SHARD_COUNT} shards.")
+    elif args.command == "stats":
+        stats, totals = shard_stats()
+        for shard, counts in stats.items():
+            print(f"shard {shard:02d}: " + ", ".join(f"{name}={value}" for name, value in counts.items()))
+        print("total: " + ", ".join(f"{name}={value}" for name, value in totals.items()))
+    elif args.command == "rebalance":
+        if args.auto:
+            moves = plan_rebalance(args.max_moves)
+            for user_id, source, target in moves:
+                print(f"user {user_id}: shard {source} -> {target}")
+                if not args.dry_run:
+                    move_user(user_id, target)
+            print(f"{'Planned' if args.dry_run else '✅ Made'} {len(moves)} moves.")
+        elif args.user_id is not None and args.to is not None:
+            if not 0 <= args.to < SHARD_COUNT:
+                parser.error(f"--to must be between 0 and {SHARD_COUNT - 1}")
+            rows = move_user(args.user_id, args.to)
+            print(f"✅ Moved user {args.user_id} ({rows} rows) to shard {args.to}.")
+        else:
+            parser.error("use --user-id with --to, or --auto")
@@ -1,44 +1,231 @@
 import streamlit as st
+import argparse
+import logging
 import random
+import zlib
+from datetime import date, timedelta
+from db import query_db, query_all_shards, executemany_db, execute_db, to_day
+
+logger = logging.getLogger(__name__)
+
+# Tip catalog: (text, comma-separated topics). Seeded into the tips table by ensure_tip_catalog().
+TIP_CATALOG = [
+    ("💧 Stay hydrated! Aim for at least 8 glasses of water per day.", "hydration,general"),
+    ("🚶‍♂️ Move more! Try to take a 10-minute walk after every meal.", "movement,weight_loss,beginner"),
+    ("😴 Prioritize sleep! Aim for 7-9 hours of quality sleep each night.", "sleep,recovery"),
+    ("🥦 Eat your veggies! Fill half your plate with colorful vegetables.", "nutrition,weight_loss"),
+    ("🏋️‍♀️ Consistency beats intensity. Regular, moderate exercise is key.", "consistency,beginner"),
+    ("🍎 Choose whole foods. Opt for fruits, vegetables, whole grains, and lean proteins.", "nutrition"),
+    ("📉 Don't skip breakfast. A healthy morning meal kickstarts your metabolism.", "nutrition,weight_gain"),
+    ("📊 Track your progress. Logging your workouts and meals helps you stay accountable.", "consistency,goals"),
+    ("🧘‍♂️ Manage stress. Practice deep breathing, meditation, or yoga.", "stress,recovery"),
+    ("🍽️ Practice mindful eating. Slow down and savor your food.", "nutrition,weight_loss"),
+    ("🧃 Limit sugary drinks. Choose water, unsweetened tea, or sparkling water instead.", "hydration,weight_loss"),
+    ("💪 Strength train 2-3 times a week. It builds muscle and boosts your metabolism.", "strength,weight_gain"),
+    ("📅 Set realistic goals. Break down big goals into smaller, achievable steps.", "goals,beginner"),
+    ("🔥 Remember: Nutrition is 80% of the fitness equation.", "nutrition,weight_loss"),
+    ("🌟 Celebrate non-scale victories! Improved energy, better sleep, or fitting into old clothes are wins!", "motivation,weight_loss"),
+    ("🚫 Avoid crash diets. Sustainable lifestyle changes lead to lasting results.", "weight_loss,nutrition"),
+    ("🤝 Consider working with a professional. A certified trainer or dietitian can provide personalized guidance.", "general,goals"),
+    ("📅 Schedule your workouts. Treat them like important appointments.", "consistency,motivation"),
+    ("🥬 Don't fear healthy fats. Avocados, nuts, and olive oil are essential for health.", "nutrition,weight_gain"),
+    ("🎉 You've got this! Every step you take is progress.", "motivation,beginner"),
+    ("🍗 Add a protein source to every meal to help your muscles grow and recover.", "nutrition,strength,weight_gain"),
+    ("🥜 Trying to gain? Calorie-dense snacks like nuts, yogurt and smoothies make it easier.", "weight_gain,nutrition"),
+    ("🛌 Training hard? Schedule at least one full rest day a week so your body can adapt.", "recovery,sleep"),
+    ("🧊 Sore after a big week? An easy walk or light stretching speeds recovery.", "recovery,movement"),
+    ("🏃 Mix in some cardio. Two or three 20-minute sessions a week strengthen your heart.", "cardio,weight_loss"),
+    ("🚴 Keep cardio fun: alternate running, cycling, swimming or dancing.", "cardio,motivation"),
+    ("🏋️ Pair your cardio with two strength sessions a week to protect muscle.", "strength"),
+    ("⏱️ Short on time? A 10-minute workout still counts — start small and build up.", "beginner,movement,motivation"),
+    ("📈 Progressive overload: add a little weight or a few reps each week.", "strength,goals"),
+    ("🎯 Set a goal for this month on the Goals page — a clear target keeps you going.", "goals,motivation"),
+]
+
+# Workout names counted as cardio or strength when looking at a user's recent pattern
+CARDIO_EXERCISES = ("running", "walking", "cycling", "swimming", "hiit", "jump rope", "rowing", "boxing", "dancing")
+STRENGTH_EXERCISES = ("weight training", "push-ups", "pull-ups", "pilates")
+RECENT_DAYS = 14
+HISTORY_DAYS = 30
+
+_GOAL_TOPICS = {
+    "weight_loss": {"weight_loss": 2, "nutrition": 1},
+    "weight_gain": {"weight_gain": 2, "strength": 1},
+    "exercise": {"consistency": 1.5, "goals": 1},
+}
+_BMI_TOPICS = {
+    "Underweight": {"weight_gain": 2, "nutrition": 1},
+    "Normal weight": {"consistency": 1, "strength": 0.5},
+    "Overweight": {"weight_loss": 2, "movement": 1, "cardio": 0.5},
+    "Obese": {"weight_loss": 2, "movement": 1.5},
+}
+
+
+def ensure_tip_catalog():
+    """Adds any catalog tips missing from the tips table."""
+    executemany_db("INSERT OR IGNORE INTO tips (text, topics) VALUES (?, ?)", TIP_CATALOG)
+
+
+def _bmi_category(height, weight):
+    if not height or not weight:
+        return None
+    bmi = weight / ((height / 100) ** 2)
+    if bmi < 18.5:
+        return "Underweight"
+    if bmi < 25:
+        return "Normal weight"
+    if bmi < 30:
+        return "Overweight"
+    return "Obese"
+
+
+def topic_weights(bmi_category, goal_types, sessions=0, cardio=0, strength=0):
+    """How much each topic matters to a user right now, from their BMI, active goals and recent workouts."""
+    weights = {}
+
+    def add(topics):
+        for topic, weight in topics.items():
+            weights[topic] = weights.get(topic, 0) + weight
+
+    add(_BMI_TOPICS.get(bmi_category, {}))
+    for goal_type in goal_types:
+        add(_GOAL_TOPICS.get(goal_type, {"goals": 1}))
+    if not goal_types:
+        add({"goals": 1.5})
+    if sessions == 0:
+        add({"movement": 2, "motivation": 1.5, "beginner": 1})
+    elif sessions <= 2:
+        add({"consistency": 1.5})
+    elif sessions >= 6:
+        add({"recovery": 2, "sleep": 1})
+    if cardio and not strength:
+        add({"strength": 1.5})
+    if strength and not cardio:
+        add({"cardio": 1.5})
+    return weights
+
+
+def rank_tips(user_id, day, tips, weights, recent_tip_ids=()):
+    """
+    Tip ids best first: topic score, minus a penalty for tips shown in the last weeks,
+    with a small per-day jitter so near-equal tips take turns.
+    """
+    def score(tip):
+        topical = sum(weights.get(topic, 0) for topic in tip["topics"].split(","))
+        repeat = 3 if tip["id"] in recent_tip_ids else 0
+        jitter = zlib.crc32(f"{user_id}:{day}:{tip['id']}".encode()) / 2 ** 32 * 0.5
+        return topical - repeat + jitter
+    return [tip["id"] for tip in sorted(tips, key=score, reverse=True)]
+
+
+def _per_user(query, params, user_ids, user_filter="AND user_id = ?"):
+    """Runs a per-user query on every shard, or only for `user_ids` on their own shards."""
+    if user_ids is None:
+        return query_all_shards(query.format(user_filter=""), params)
+    rows = []
+    for user_id in user_ids:
+        rows.extend(query_db(query.format(user_filter=user_filter), (*params, user_id), shard_key=user_id))
+    return rows
+
+
+def precompute_tips(day=None, user_ids=None):
+    """
+    Ranks the catalog for every user (or just `user_ids`) and stores each user's tip for
+    `day` in user_tips. Meant to run once a day; returns the number of users assigned.
+    """
+    day = day or date.today().isoformat()
+    ensure_tip_catalog()
+    tips = query_db("SELECT id, topics FROM tips")
+    if not tips:
+        return 0
+
+    if user_ids is None:
+        users = query_db("SELECT id, height, weight FROM users")
+    else:
+        placeholders = ",".join("?" * len(user_ids))
+        users = query_db(f"SELECT id, height, weight FROM users WHERE id IN ({placeholders})", list(user_ids))
+
+    goals = {}
+    for row in _per_user("SELECT user_id, goal_type FROM goals WHERE status = 'active' {user_filter}", (), user_ids):
+        goals.setdefault(row["user_id"], []).append(row["goal_type"])
+
+    since = (date.fromisoformat(day) - timedelta(days=RECENT_DAYS)).isoformat()
+    cardio = ",".join("?" * len(CARDIO_EXERCISES))
+    strength = ",".join("?" * len(STRENGTH_EXERCISES))
+    activity = {row["user_id"]: row for row in _per_user(
+        f"SELECT user_id, COUNT(*) AS sessions, SUM(LOWER(exercise) IN ({cardio})) AS cardio, "
+        f"SUM(LOWER(exercise) IN ({strength})) AS strength "
+        "FROM workouts WHERE day >= ? AND day <= ? {user_filter} GROUP BY user_id",
+        (*CARDIO_EXERCISES, *STRENGTH_EXERCISES, to_day(since), to_day(day)),
+        user_ids
+    )}
+
+    recent = {}
+    for row in query_db("SELECT user_id, tip_id FROM user_tips WHERE day >= ? AND day < ?", (since, day)):
+        recent.setdefault(row["user_id"], set()).add(row["tip_id"])
+
+    assignments = []
+    for user in users:
+        stats = activity.get(user["id"])
+        weights = topic_weights(
+            _bmi_category(user["height"], user["weight"]),
+            goals.get(user["id"], []),
+            stats["sessions"] if stats else 0,
+            stats["cardio"] if stats else 0,
+            stats["strength"] if stats else 0,
+        )
+        best = rank_tips(user["id"], day, tips, weights, recent.get(user["id"], set()))[0]
+        assignments.append((user["id"], day, best))
+
+    if executemany_db("INSERT OR REPLACE INTO user_tips (user_id, day, tip_id) VALUES (?, ?, ?)", assignments) == -1:
+        return -1
+    if user_ids is None:
+        oldest = (date.fromisoformat(day) - timedelta(days=HISTORY_DAYS)).isoformat()
+        execute_db("DELETE FROM user_tips WHERE day < ?", (oldest,))
+    logger.info("Assigned tips for %s to %d users", day, len(assignments))
+    return len(assignments)
+
+
+def get_tip_for_user(user_id, day=None):
+    """
+    Today's precomputed tip: one primary-key lookup. Users the daily job hasn't covered
+    yet (e.g. new sign-ups) are ranked once here and stored for the rest of the day.
+    """
+    day = day or date.today().isoformat()
+    lookup = (
+        "SELECT t.text FROM user_tips u JOIN tips t ON t.id = u.tip_id WHERE u.user_id = ? AND u.day = ?"
+    )
+    row = query_db(lookup, (user_id, day), fetchone=True)
+    if row is None and precompute_tips(day, [user_id]) > 0:
+        row = query_db(lookup, (user_id, day), fetchone=True)
+    return row["text"] if row else random.choice(TIP_CATALOG)[0]
+
 
 def show_tip(user_id):
     """
-    Displays a random fitness or nutrition tip to the user.
+    Displays the user's tip of the day (see precompute_tips for how it is picked).
     This function is designed to be called in the main app (app.py) after login.
     """
-    # List of fitness and nutrition tips
-    tips = [
-        "💧 Stay hydrated! Aim for at least 8 glasses of water per day.",
-        "🚶‍♂️ Move more! Try to take a 10-minute walk after every meal.",
-        "😴 Prioritize sleep! Aim for 7-9 hours of quality sleep each night.",
-        "🥦 Eat your veggies! Fill half your plate with colorful vegetables.",
-        "🏋️‍♀️ Consistency beats intensity. Regular, moderate exercise is key.",
-        "🍎 Choose whole foods. Opt for fruits, vegetables, whole grains, and lean proteins.",
-        "📉 Don't skip breakfast. A healthy morning meal kickstarts your metabolism.",
-        "📊 Track your progress. Logging your workouts and meals helps you stay accountable.",
-        "🧘‍♂️ Manage stress. Practice deep breathing, meditation, or yoga.",
-        "🍽️ Practice mindful eating. Slow down and savor your food.",
-        "🧃 Limit sugary drinks. Choose water, unsweetened tea, or sparkling water instead.",
-        "💪 Strength train 2-3 times a week. It builds muscle and boosts your metabolism.",
-        "📅 Set realistic goals. Break down big goals into smaller, achievable steps.",
-        "🔥 Remember: Nutrition is 80% of the fitness equation.",
-        "🌟 Celebrate non-scale victories! Improved energy, better sleep, or fitting into old clothes are wins!",
-        "🚫 Avoid crash diets. Sustainable lifestyle changes lead to lasting results.",
-        "🤝 Consider working with a professional. A certified trainer or dietitian can provide personalized guidance.",
-        "📅 Schedule your workouts. Treat them like important appointments.",
-        "🥬 Don't fear healthy fats. Avocados, nuts, and olive oil are essential for health.",
-        "🎉 You've got this! Every step you take is progress."
-    ]
-
-    # Select a random tip
-    random_tip = random.choice(tips)
+    tip = get_tip_for_user(user_id)
 
     # Display the tip in a styled container
     st.markdown(
         f"""
         <div style='background-color: #f0f8ff; padding: 15px; border-radius: 10px; border-left: 5px solid #4682B4; margin: 15px 0;'>
-            <p style='font-size: 16px; color: #2c3e50; margin: 0;'><strong>💡 Fitness Tip:</strong> {random_tip}</p>
+            <p style='font-size: 16px; color: #2c3e50; margin: 0;'><strong>💡 Fitness Tip:</strong> {tip}</p>
         </div>
         """,
         unsafe_allow_html=True
-    )
\ No newline at end of file
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Personalized tips")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    precompute = subparsers.add_parser("precompute", help="Pick every user's tip for a day (run daily, e.g. from cron)")
+    precompute.add_argument("--day", default=None, help="YYYY-MM-DD (default: today)")
+    args = parser.parse_args()
+
+    if args.command == "precompute":
+        count = precompute_tips(args.day)
+        print("❌ Tip precompute failed, see log for details." if count == -1 else f"✅ Assigned tips to {count} users.")
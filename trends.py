@@ -0,0 +1,183 @@
+import argparse
+import logging
+import os
+from datetime import date, timedelta
+from db import query_db, execute_transaction, shard_indexes, ROLLUP_PERIODS, REBUILD_WORKOUT_ROLLUPS, to_day, to_epoch
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on points per chart trace, whatever the selected range
+MAX_CHART_POINTS = int(os.getenv("FITNESS_CHART_POINTS", "500"))
+
+# Dashboard time ranges: label -> days of history (None = everything)
+TIME_RANGES = {
+    "Last 7 days": 7,
+    "Last 30 days": 30,
+    "Last 90 days": 90,
+    "Last year": 365,
+    "Last 2 years": 730,
+    "All time": None,
+}
+RESOLUTIONS = ("Auto", "Daily", "Weekly", "Monthly")
+
+_PERIODS = {"weekly": "week", "monthly": "month"}
+
+
+def pick_resolution(days, resolution="Auto"):
+    """Returns "daily", "weekly" or "monthly"; Auto picks raw days up to 90 days of history."""
+    if resolution != "Auto":
+        return resolution.lower()
+    if days is not None and days <= 90:
+        return "daily"
+    if days is not None and days <= 730:
+        return "weekly"
+    return "monthly"
+
+
+def range_start(days, resolution="daily"):
+    """First date to include, aligned to the start of its week or month for rollups."""
+    if days is None:
+        return "0001-01-01"
+    start = date.today() - timedelta(days=days)
+    if resolution == "weekly":
+        start -= timedelta(days=start.weekday())
+    elif resolution == "monthly":
+        start = start.replace(day=1)
+    return start.strftime('%Y-%m-%d')
+
+
+def lttb_indices(xs, ys, threshold):
+    """
+    Largest-Triangle-Three-Buckets: picks `threshold` indices that keep the visual
+    shape of the series (peaks and dips survive). Always keeps the first and last point.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    bucket_size = (n - 2) / (threshold - 2)
+    selected = [0]
+    previous = 0
+    for bucket in range(threshold - 2):
+        # Average of the next bucket is the third corner of the triangle
+        next_start = int((bucket + 1) * bucket_size) + 1
+        next_end = min(int((bucket + 2) * bucket_size) + 1, n)
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_y = sum(ys[next_start:next_end]) / count
+
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        prev_x, prev_y = xs[previous], ys[previous]
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            area = abs((prev_x - avg_x) * (ys[i] - prev_y) - (prev_x - xs[i]) * (avg_y - prev_y))
+            if area > best_area:
+                best, best_area = i, area
+        selected.append(best)
+        previous = best
+    selected.append(n - 1)
+    return selected
+
+
+def downsample(dates, values, max_points=None):
+    """Downsamples a date-indexed series (dates or "YYYY-MM-DD" strings) with LTTB. Returns (dates, values)."""
+    max_points = max_points or MAX_CHART_POINTS
+    if len(dates) <= max_points:
+        return list(dates), list(values)
+    xs = [d.toordinal() if isinstance(d, date) else date.fromisoformat(str(d)[:10]).toordinal() for d in dates]
+    ys = [value or 0 for value in values]
+    indices = lttb_indices(xs, ys, max_points)
+    return [dates[i] for i in indices], [values[i] for i in indices]
+
+
+def workout_totals(user_id, days=None):
+    """Number of workouts and calories burned in the range (exact, not bucket-aligned)."""
+    return query_db(
+        "SELECT COUNT(*) AS sessions, COALESCE(SUM(calories_burned), 0) AS calories "
+        "FROM workouts WHERE user_id = ? AND day >= ?",
+        (user_id, to_day(range_start(days))),
+        fetchone=True,
+        shard_key=user_id
+    )
+
+
+def workout_series(user_id, days=None, resolution="daily"):
+    """
+    Workout totals per day, week or month: rows of (period_start, sessions, minutes, calories)
+    oldest first. Daily period_start is a date; weekly and monthly come from the workout_rollups
+    table as "YYYY-MM-DD" strings.
+    """
+    since = range_start(days, resolution)
+    if resolution == "daily":
+        return query_db(
+            'SELECT day AS "period_start [day]", COUNT(*) AS sessions, COALESCE(SUM(duration), 0) AS minutes, '
+            "COALESCE(SUM(calories_burned), 0) AS calories "
+            "FROM workouts WHERE user_id = ? AND day >= ? GROUP BY day ORDER BY day",
+            (user_id, to_day(since)),
+            shard_key=user_id
+        )
+    return query_db(
+        "SELECT period_start, sessions, minutes, calories FROM workout_rollups "
+        "WHERE user_id = ? AND period = ? AND period_start >= ? ORDER BY period_start",
+        (user_id, _PERIODS[resolution], since),
+        shard_key=user_id
+    )
+
+
+def chat_series(user_id, days=None, resolution="daily"):
+    """Messages per day, week or month: rows of (period_start, messages) oldest first."""
+    since = range_start(days, resolution)
+    if resolution == "daily":
+        bucket = 'ts / 86400 AS "period_start [day]"' # UTC days, like date(timestamp)
+    else:
+        bucket = ROLLUP_PERIODS[_PERIODS[resolution]].format(column="timestamp") + " AS period_start"
+    return query_db(
+        f"SELECT {bucket}, COUNT(*) AS messages FROM chat_logs "
+        "WHERE user_id = ? AND ts >= ? GROUP BY 1 ORDER BY 1",
+        (user_id, to_epoch(since)),
+        shard_key=user_id
+    )
+
+
+def weight_series(user_id, days=None):
+    """Raw weigh-ins in the range: rows of (date, weight) oldest first."""
+    return query_db(
+        "SELECT date, weight FROM weigh_ins WHERE user_id = ? AND date >= ? ORDER BY date, id",
+        (user_id, range_start(days)),
+        shard_key=user_id
+    )
+
+
+def rebuild_workout_rollups(user_id=None):
+    """
+    Rebuilds workout_rollups from the workouts table (all users or one), e.g. after a
+    bulk import with triggers disabled. Returns the number of rows changed, or -1.
+    """
+    user_filter, params = ("AND user_id = ?", (user_id, user_id)) if user_id is not None else ("", ())
+    statements = [
+        (f"DELETE FROM workout_rollups WHERE 1 = 1 {user_filter}", params[:1]),
+        (REBUILD_WORKOUT_ROLLUPS.format(user_filter=user_filter), params),
+    ]
+    if user_id is not None:
+        result = execute_transaction(statements, shard_key=user_id)
+    else:
+        results = [execute_transaction(statements, shard=shard) for shard in shard_indexes()]
+        result = -1 if -1 in results else sum(results)
+    logger.info("Rebuilt workout rollups (user: %s, rows: %s)", user_id, result)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Workout rollup maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild = subparsers.add_parser("rebuild", help="Rebuild weekly/monthly workout rollups from workouts")
+    rebuild.add_argument("--user-id", type=int, default=None, help="Only rebuild this user's rollups")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        rows = rebuild_workout_rollups(args.user_id)
+        if rows == -1:
+            print("❌ Rollup rebuild failed, see log for details.")
+        else:
+            print(f"✅ Rebuilt workout rollups ({rows} rows changed).")
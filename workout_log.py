@@ -0,0 +1,32 @@
+from db import query_db, execute_db
+from calorie_estimation import estimate_calories, weight_on
+
+# Workout writes and reads without Streamlit, shared by the workouts page and the API
+
+
+def record_workout(user_id, date, exercise, duration, calories_burned=0, weight=None):
+    """
+    Stores a workout (date as YYYY-MM-DD). Calories left at 0 are estimated from the
+    exercise, duration and the user's weight on that date (falling back to `weight`).
+    Returns (workout_id or -1, calories_burned, estimated).
+    """
+    estimated = not calories_burned
+    if estimated:
+        calories_burned = estimate_calories(exercise, duration, weight_on(user_id, date) or weight)
+    result = execute_db(
+        "INSERT INTO workouts (user_id, date, exercise, duration, calories_burned, calories_estimated) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (user_id, date, exercise, duration, calories_burned, int(estimated)),
+        shard_key=user_id
+    )
+    return result, calories_burned, estimated
+
+
+def get_workout_history(user_id, limit=10):
+    """The user's most recent workouts, newest first."""
+    return query_db(
+        "SELECT date, exercise, duration, calories_burned, calories_estimated "
+        "FROM workouts WHERE user_id = ? ORDER BY day DESC, id DESC LIMIT ?",
+        (user_id, limit),
+        shard_key=user_id
+    )
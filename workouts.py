@@ -1,6 +1,7 @@
 import streamlit as st
 from datetime import datetime
-from db import query_db, execute_db
+from fragments import fragment, rerun_fragment
+from workout_log import record_workout, get_workout_history
 
 # Common exercise types for the dropdown
 EXERCISE_OPTIONS = [
@@ -10,10 +11,16 @@ EXERCISE_OPTIONS = [
 ]
 
 
+@fragment("Workout / log")
 def log_workout(user_id):
     """Displays the interface for logging a new workout."""
     st.subheader("🏋️ Log a Workout")
 
+    # Set before the rerun below, so the message survives it
+    flash = st.session_state.pop(f"workout_flash_{user_id}", None)
+    if flash:
+        st.success(flash)
+
     with st.form("log_workout_form"):
         col1, col2 = st.columns(2)
         with col1:
@@ -26,7 +33,8 @@ def log_workout(user_id):
         with col2:
             duration = st.number_input("Duration (minutes)", min_value=1, value=30, step=1)
             calories_burned = st.number_input(
-                "Calories Burned (optional)", min_value=0.0, value=0.0, step=1.0
+                "Calories Burned (optional)", min_value=0.0, value=0.0, step=1.0,
+                help="Leave at 0 to estimate from the exercise, duration and your weight."
             )
 
         submitted = st.form_submit_button("✅ Log Workout", type="primary", use_container_width=True)
@@ -36,13 +44,14 @@ def log_workout(user_id):
         if not exercise:
             st.error("Please enter an exercise name.")
         else:
-            result = execute_db(
-                "INSERT INTO workouts (user_id, date, exercise, duration, calories_burned) VALUES (?, ?, ?, ?, ?)",
-                (user_id, date.strftime('%Y-%m-%d'), exercise, duration, calories_burned)
+            result, calories_burned, estimated = record_workout(
+                user_id, date.strftime('%Y-%m-%d'), exercise, duration, calories_burned,
+                st.session_state.get("user", {}).get("weight")
             )
             if result != -1:
-                st.success(f"✅ Workout '{exercise}' logged successfully!")
-                st.rerun()
+                note = f" (≈ {calories_burned:.0f} kcal, estimated)" if estimated else ""
+                st.session_state[f"workout_flash_{user_id}"] = f"✅ Workout '{exercise}' logged successfully!{note}"
+                rerun_fragment() # The history below is part of this fragment
             else:
                 st.error("Failed to log workout. Please try again.")
 
@@ -55,11 +64,7 @@ def view_workout_history(user_id, limit=10):
     """Fetches and displays the user's recent workout history as a table."""
     st.subheader(f"📋 Workout History (Last {limit} Sessions)")
 
-    workouts = query_db(
-        "SELECT date, exercise, duration, calories_burned "
-        "FROM workouts WHERE user_id = ? ORDER BY date DESC, id DESC LIMIT ?",
-        (user_id, limit)
-    )
+    workouts = get_workout_history(user_id, limit)
 
     if not workouts:
         st.info("You haven't logged any workouts yet. Use the form above to get started!")
@@ -69,6 +74,8 @@ def view_workout_history(user_id, limit=10):
     rows = []
     for w in workouts:
         cal = f"{w['calories_burned']:.0f}" if w['calories_burned'] else "—"
+        if w['calories_burned'] and w['calories_estimated']:
+            cal = f"≈ {cal}"
         rows.append({
             "Date": w['date'],
             "Exercise": w['exercise'],